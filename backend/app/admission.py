@@ -0,0 +1,143 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+from metrics import Histogram
+
+# Lower value = served first.
+CRITICAL, ROUTINE, CHAT = 0, 1, 2
+CLASS_NAMES = {CRITICAL: "critical", ROUTINE: "routine", CHAT: "chat"}
+
+ADMISSION_SLOTS = int(os.getenv("ADMISSION_SLOTS", os.getenv("LLM_CONCURRENCY", "16")))
+# Longest a request of each class may wait for a slot before it is shed, and
+# how many of each class may be queued at once.
+ADMISSION_DEADLINES = {
+    CRITICAL: float(os.getenv("ADMISSION_DEADLINE_CRITICAL", "30")),
+    ROUTINE: float(os.getenv("ADMISSION_DEADLINE_ROUTINE", "10")),
+    CHAT: float(os.getenv("ADMISSION_DEADLINE_CHAT", "5")),
+}
+ADMISSION_QUEUE_LIMITS = {
+    CRITICAL: int(os.getenv("ADMISSION_QUEUE_CRITICAL", "200")),
+    ROUTINE: int(os.getenv("ADMISSION_QUEUE_ROUTINE", "100")),
+    CHAT: int(os.getenv("ADMISSION_QUEUE_CHAT", "50")),
+}
+
+# Priority of the request being served; set by the endpoint, read by the LLM
+# layer. Tasks spawned for retries, hedges or coalesced calls inherit it.
+current_priority = contextvars.ContextVar("current_priority", default=ROUTINE)
+
+
+class Overloaded(Exception):
+    def __init__(self, priority, retry_after):
+        super().__init__(f"Too many {CLASS_NAMES[priority]} requests queued; retry in {retry_after}s")
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+class _ClassStats:
+    def __init__(self):
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self.wait = Histogram()
+
+    def stats(self):
+        return {"queued": self.queued, "admitted": self.admitted, "shed": self.shed, "wait": self.wait.stats()}
+
+
+class AdmissionController:
+    """Hands out upstream slots by priority class, shedding what cannot make its deadline.
+
+    A request that finds no free slot is queued behind everything of equal or
+    higher priority. If the expected wait already exceeds its class deadline,
+    or its class queue is full, it is rejected immediately with ``Overloaded``
+    instead of waiting to time out.
+    """
+
+    def __init__(self, slots=ADMISSION_SLOTS, deadlines=ADMISSION_DEADLINES, queue_limits=ADMISSION_QUEUE_LIMITS):
+        self.slots = slots
+        self.available = slots
+        self.deadlines = deadlines
+        self.queue_limits = queue_limits
+        self.classes = {priority: _ClassStats() for priority in CLASS_NAMES}
+        # Moving average of how long a slot is held, for wait estimates.
+        self.service_time = 1.0
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    def _expected_wait(self, priority):
+        ahead = sum(self.classes[p].queued for p in CLASS_NAMES if p <= priority)
+        return (ahead + 1) * self.service_time / self.slots
+
+    def _shed(self, priority, expected):
+        self.classes[priority].shed += 1
+        raise Overloaded(priority, max(1, math.ceil(expected)))
+
+    async def acquire(self, priority):
+        stats = self.classes[priority]
+        # Free slots only exist while nobody is queued: release() hands a
+        # slot straight to the next waiter when there is one.
+        if self.available > 0:
+            self.available -= 1
+            stats.admitted += 1
+            stats.wait.observe(0.0)
+            return
+
+        expected = self._expected_wait(priority)
+        if stats.queued >= self.queue_limits[priority] or expected > self.deadlines[priority]:
+            self._shed(priority, expected)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        stats.queued += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(future, self.deadlines[priority])
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we gave up; pass it on.
+                self.release()
+            else:
+                stats.queued -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                self._shed(priority, self._expected_wait(priority))
+            raise
+        stats.admitted += 1
+        stats.wait.observe(time.monotonic() - start)
+
+    def release(self):
+        while self._waiters:
+            priority, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot straight to the highest-priority waiter.
+                self.classes[priority].queued -= 1
+                future.set_result(None)
+                return
+        self.available += 1
+
+    @asynccontextmanager
+    async def slot(self, priority=None):
+        priority = current_priority.get() if priority is None else priority
+        await self.acquire(priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.service_time = 0.9 * self.service_time + 0.1 * (time.monotonic() - start)
+            self.release()
+
+    def stats(self):
+        return {
+            "slots": self.slots,
+            "available": self.available,
+            "service_time_ms": round(self.service_time * 1e3, 3),
+            "classes": {CLASS_NAMES[p]: c.stats() for p, c in self.classes.items()},
+        }
+
+
+controller = AdmissionController()
@@ -1,22 +1,43 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import google.generativeai as genai
+import asyncio
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field, HttpUrl
+from typing import Literal
 import os
+import secrets
 from datetime import datetime
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
 
-# Load environment variables
+# Load environment variables before the modules below read their settings
 load_dotenv()
 
-# Configure API key
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("GEMINI_API_KEY environment variable is not set")
-genai.configure(api_key=api_key)
+import batch
+import ecoli
+import knowledge
+import llm
+import rules
+import structured
+from admission import CHAT, CRITICAL, ROUTINE, Overloaded, current_priority
+from admission import controller as admission
+from backends import create_backend
+from breaker import CircuitOpenError
+from cache import analysis_cache, analysis_key
+from encoding import NegotiatedResponse, NegotiationMiddleware, wire
+from intent import classifier as intents
+from jobs import queue as jobs
+from predict import PREDICT_MAX_READINGS, ModelUnavailable, QueueFull
+from predict import batcher as predictor
+from quota import scheduler as quota
+from registry import MODEL_ADMIN_TOKEN, UnknownVersion
+from registry import registry as models
+from routing import LLM_TIERS, router, usage
+from semantic_cache import faq_cache
+from store import results
+from streaming import single_chunk, sse_response, ttfb
 
 # Create FastAPI app
-app = FastAPI(title="AarogyaJal Gemini API Service")
+# Responses are JSON (orjson) or msgpack, as the client's Accept header asks
+app = FastAPI(title="AarogyaJal Gemini API Service", default_response_class=NegotiatedResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -26,6 +47,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Decodes msgpack request bodies and compresses large responses (brotli/gzip)
+app.add_middleware(NegotiationMiddleware)
 
 # Water quality context for Gemini
 WATER_QUALITY_CONTEXT = """
@@ -38,8 +61,12 @@ Focus Areas:
 - Safety measures and preventive actions
 """
 
-# Model configuration
-MODEL = "gemini-2.5-flash"
+# Per-endpoint deadlines for the upstream Gemini call, in seconds
+CHAT_DEADLINE = float(os.getenv("CHAT_DEADLINE", "20"))
+ANALYZE_DEADLINE = float(os.getenv("ANALYZE_DEADLINE", "30"))
+
+# /ecoli/batch bodies at least this large are parsed and estimated in a thread
+ECOLI_OFFLOAD_BYTES = 64 * 1024
 
 # Request models
 class ChatRequest(BaseModel):
@@ -49,49 +76,531 @@ class AnalysisRequest(BaseModel):
     parameters: dict
     location: str = None
     notes: str = None
+    # Ask Gemini for a written analysis even when the rules are conclusive
+    narrative: bool = False
+    # Queue priority for Gemini; defaults to critical for unsafe samples
+    priority: Literal["critical", "routine"] = None
+    # "structured" returns the analysis as typed fields (StructuredAnalysis)
+    format: Literal["text", "structured"] = "text"
+
+class AsyncAnalysisRequest(AnalysisRequest):
+    callback_url: HttpUrl = None
+
+class PredictRequest(BaseModel):
+    # Sensor readings, e.g. {"ph": 7.2, "temperature": 28, "turbidity": 3.5, ...}
+    readings: list[dict]
+
+class ModelSwapRequest(BaseModel):
+    # A version in RISK_MODEL_REGISTRY; by default CURRENT is reloaded
+    version: str = None
+
+class BatchAnalysisRequest(BaseModel):
+    samples: list[AnalysisRequest]
+    # Several samples per Gemini prompt instead of one call each
+    pack: bool = False
+    max_concurrency: int = Field(default=None, ge=1, le=64)
+
+def grounded_context(queries):
+    # Guidance retrieved from the local knowledge base replaces the generic
+    # focus list; with no matching passage the generic context is kept
+    passages = knowledge.passages_for(queries)
+    if not passages:
+        return WATER_QUALITY_CONTEXT
+    return "\nContext: Water Quality Analysis System\nReference guidance:\n" + "\n".join(
+        f"- {passage}" for passage in passages
+    ) + "\n"
+
+def sample_queries(sample, assessment):
+    # One query per parameter outside its limits, plus the field notes
+    queries = [
+        f"{flag['label']} {flag['status']}"
+        for flag in assessment["parameters"].values()
+        if flag["status"] != "acceptable"
+    ]
+    if sample.notes:
+        queries.append(sample.notes)
+    return queries or [" ".join(map(str, sample.parameters))]
+
+def grounded(prompt, context):
+    knowledge.prompt_tokens.record(prompt, context, WATER_QUALITY_CONTEXT)
+    return prompt
+
+def build_chat_prompt(query):
+    context = grounded_context([query])
+    return grounded(
+        f"{context}\n\nUser Query: {query}\n\n"
+        f"Provide a helpful response focused on water quality and health.",
+        context,
+    )
+
+def build_analysis_prompt(request, assessment):
+    context = grounded_context(sample_queries(request, assessment))
+    # Format the parameters for analysis
+    params_text = "\n".join([f"{k}: {v}" for k, v in request.parameters.items()])
+    location_info = f"Location: {request.location}" if request.location else ""
+    notes_info = f"Notes: {request.notes}" if request.notes else ""
+
+    prompt = f"{context}\n\nWater Quality Parameters:\n{params_text}\n{location_info}\n{notes_info}\n\n"
+    prompt += "Analyze these water quality parameters and provide:\n"
+    prompt += "1. Overall water quality assessment\n"
+    prompt += "2. Health implications\n"
+    prompt += "3. Recommendations for treatment or improvement\n"
+    prompt += "4. Potential risks if any parameters are concerning"
+    return grounded(prompt, context)
+
+def build_structured_prompt(request, assessment):
+    context = grounded_context(sample_queries(request, assessment))
+    params_text = "\n".join([f"{k}: {v}" for k, v in request.parameters.items()])
+    location_info = f"Location: {request.location}\n" if request.location else ""
+    notes_info = f"Notes: {request.notes}\n" if request.notes else ""
+    flags_text = "\n".join(
+        f"{flag['label']}: {flag['status']} under BIS 10500" for flag in assessment["parameters"].values()
+    )
+
+    prompt = f"{context}\n\nWater Quality Parameters:\n{params_text}\n{location_info}{notes_info}\n"
+    if flags_text:
+        prompt += f"Limit table results:\n{flags_text}\n\n"
+    prompt += "Assess the overall water quality, the risk tier, the status of each parameter, "
+    prompt += "the health implications and the recommended treatment.\n"
+    prompt += structured.OUTPUT_INSTRUCTIONS
+    return grounded(prompt, context)
+
+def build_packed_analysis_prompt(samples, assessments):
+    context = grounded_context([
+        query for sample, assessment in zip(samples, assessments) for query in sample_queries(sample, assessment)
+    ])
+    prompt = f"{context}\n\nAnalyze each of the following {len(samples)} water samples separately.\n"
+    prompt += "Start each analysis with its heading exactly as given (for example "
+    prompt += f"\"{batch.SAMPLE_HEADING.format(1)}\") and for each sample provide:\n"
+    prompt += "1. Overall water quality assessment\n"
+    prompt += "2. Health implications\n"
+    prompt += "3. Recommendations for treatment or improvement\n"
+    prompt += "4. Potential risks if any parameters are concerning\n"
+    for number, sample in enumerate(samples, 1):
+        params_text = "\n".join([f"{k}: {v}" for k, v in sample.parameters.items()])
+        location_info = f"Location: {sample.location}\n" if sample.location else ""
+        notes_info = f"Notes: {sample.notes}\n" if sample.notes else ""
+        prompt += f"\n{batch.SAMPLE_HEADING.format(number)}\n{params_text}\n{location_info}{notes_info}"
+    return grounded(prompt, context)
+
+@app.on_event("startup")
+async def startup():
+    # LLM_BACKEND picks Gemini (default, needs GEMINI_API_KEY) or the local
+    # stand-in; LLM_TIERS names the model behind each routing tier
+    for tier, model in LLM_TIERS.items():
+        llm.init_backend(create_backend(model), tier)
+    faq_cache.load()
+    intents.load()
+    knowledge.index.load()
+    # Without model files /predict answers 503; the rest of the API is unaffected
+    await models.refresh()
+    models.start()
+    predictor.start()
+    await llm.warm_up()
+    jobs.start({"analyze": analysis_job})
+
+@app.on_event("shutdown")
+async def shutdown():
+    await jobs.stop()
+    await models.stop()
+    await predictor.stop()
+    faq_cache.save()
+    llm.shutdown()
+    ecoli.runner.shutdown()
 
 @app.get("/")
 async def root():
     return {"message": "AarogyaJal Gemini API Service"}
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "analyze_cache": analysis_cache.stats(),
+        "chat_faq_cache": faq_cache.stats(),
+        "chat_intents": intents.stats(),
+        "result_store": results.stats(),
+        "llm_singleflight": llm.flights.stats(),
+        "llm_breaker": llm.breaker.stats(),
+        "admission": admission.stats(),
+        "gemini_quota": quota.stats(),
+        "jobs": jobs.stats(),
+        "structured_output": dict(structured.counts),
+        "llm_retries": {
+            **llm.hedge_stats.stats(),
+            "budget": llm.retry_budget.stats(),
+            "upstream_latency": llm.upstream_latency.stats(),
+        },
+        "stream_ttfb": {name: tracker.stats() for name, tracker in ttfb.items()},
+        "model_tiers": {"usage": usage.stats(), "routing": router.stats()},
+        "ecoli": ecoli.stats.stats(),
+        "risk_model": {**models.stats(), "batching": predictor.stats()},
+        "knowledge": {**knowledge.index.stats(), "prompt_tokens": knowledge.prompt_tokens.stats()},
+        "compression": wire.stats(),
+    }
+
+def overloaded(e):
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def circuit_open(e):
+    return HTTPException(
+        status_code=503,
+        detail="The assistant is temporarily unavailable, please try again shortly",
+        headers={"Retry-After": str(int(e.retry_after) + 1)}
+    )
+
 @app.post("/chat")
 async def chat(request: ChatRequest):
+    current_priority.set(CHAT)
+    # Greetings, thanks and off-topic queries are answered from templates
+    intent = intents.classify(request.query)
+    if intent.reply is not None:
+        return {"response": intent.reply, "intent": intent.name}
     try:
-        model = genai.GenerativeModel(MODEL)
-        response = model.generate_content(
-            f"{WATER_QUALITY_CONTEXT}\n\nUser Query: {request.query}\n\n"
-            f"Provide a helpful response focused on water quality and health."
-        )
+        # Paraphrases of questions already answered skip Gemini entirely
+        cached = faq_cache.lookup(request.query)
+        if cached is not None:
+            return {"response": cached, "intent": intent.name}
+
+        prompt = build_chat_prompt(request.query)
+        text = await llm.generate(prompt, timeout=CHAT_DEADLINE, tier=router.route("chat", prompt))
+        faq_cache.add(request.query, text)
         
-        return {"response": response.text}
+        return {"response": text, "intent": intent.name}
+    except Overloaded as e:
+        raise overloaded(e)
+    except CircuitOpenError as e:
+        raise circuit_open(e)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"No answer from Gemini within {CHAT_DEADLINE:g}s")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def rules_analysis(request, assessment):
+    if request.format == "structured":
+        return structured.from_assessment(assessment).model_dump()
+    return rules.render(assessment)
+
+def llm_analysis(request, text, assessment):
+    # Structured completions are validated against StructuredAnalysis and
+    # reconciled with the limit tables; raises ValueError if malformed.
+    if request.format == "structured":
+        return structured.reconcile(structured.parse(text), assessment).model_dump()
+    return text
+
+def local_analysis(request, assessment=None):
+    # Clear-cut samples are answered from the BIS 10500 tables; Gemini only
+    # writes a narrative for ambiguous samples or when one is requested.
+    assessment = assessment or rules.assess(request.parameters)
+    if not request.narrative and not assessment["ambiguous"]:
+        return {"analysis": rules_analysis(request, assessment), "assessment": assessment, "source": "rules"}
+
+    # Near-identical sensor readings share one analysis
+    cached = analysis_cache.get(analysis_key(request, assessment))
+    if cached is not None:
+        return {"analysis": llm_analysis(request, cached, assessment), "assessment": assessment, "source": "llm"}
+    return None
+
+def analysis_tier(endpoint, request, prompt, assessment):
+    flagged = sum(flag["status"] != "acceptable" for flag in assessment["parameters"].values())
+    return router.route(endpoint, prompt, flagged=flagged, notes=request.notes)
+
+def analysis_priority(request, assessment):
+    if request.priority:
+        return CRITICAL if request.priority == "critical" else ROUTINE
+    return CRITICAL if assessment["overall"] == "unsafe" else ROUTINE
+
+async def run_analysis(request):
+    assessment = rules.assess(request.parameters)
+    result = local_analysis(request, assessment)
+    if result is not None:
+        return result
+
+    current_priority.set(analysis_priority(request, assessment))
+    if request.format == "structured":
+        prompt = build_structured_prompt(request, assessment)
+        max_output_tokens = structured.ANALYZE_STRUCTURED_MAX_TOKENS
+    else:
+        prompt, max_output_tokens = build_analysis_prompt(request, assessment), None
+    try:
+        text = await llm.generate(
+            prompt,
+            timeout=ANALYZE_DEADLINE,
+            max_output_tokens=max_output_tokens,
+            tier=analysis_tier("analyze", request, prompt, assessment),
+            # A truncated or malformed structured completion is not kept for reuse
+            valid=structured.is_valid if request.format == "structured" else None,
+        )
+    except Overloaded:
+        # Shed load is reported as 503, not papered over with a fallback
+        raise
+    except Exception as e:
+        return degraded_analysis(request, assessment, upstream_failure(e))
+    try:
+        analysis = llm_analysis(request, text, assessment)
+    except ValueError:
+        return degraded_analysis(request, assessment, "invalid_output")
+    analysis_cache.set(analysis_key(request, assessment), text)
+    return {"analysis": analysis, "assessment": assessment, "source": "llm"}
+
+def upstream_failure(error):
+    # The degraded_reason for a generation that did not come back
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, asyncio.TimeoutError):
+        return "deadline_exceeded"
+    return "upstream_error"
+
+def degraded_analysis(request, assessment, reason):
+    # Gemini is unavailable: fall back to the rule-based assessment, flagged
+    # so clients know no narrative analysis was produced.
+    return {
+        "analysis": rules_analysis(request, assessment),
+        "assessment": assessment,
+        "source": "rules",
+        "degraded": True,
+        "degraded_reason": reason,
+    }
+
+async def run_packed_analysis(samples):
+    # Only text analyses are packed; structured samples come back as None
+    # and are analyzed on their own
+    packed = [i for i, sample in enumerate(samples) if sample.format == "text"]
+    results = [None] * len(samples)
+    if not packed:
+        return results
+    texts = [samples[i] for i in packed]
+    assessments = [rules.assess(sample.parameters) for sample in texts]
+    current_priority.set(min(analysis_priority(s, a) for s, a in zip(texts, assessments)))
+    prompt = build_packed_analysis_prompt(texts, assessments)
+    try:
+        text = await llm.generate(prompt, timeout=ANALYZE_DEADLINE, tier=router.route("analyze_batch", prompt))
+    except Overloaded:
+        raise
+    except Exception as e:
+        # The same fallbacks as run_analysis, for every sample in the pack
+        reason = upstream_failure(e)
+        for i, sample, assessment in zip(packed, texts, assessments):
+            results[i] = degraded_analysis(sample, assessment, reason)
+        return results
+    for i, assessment, section in zip(packed, assessments, batch.split_packed(text, len(texts))):
+        if section is not None:
+            analysis_cache.set(analysis_key(samples[i], assessment), section)
+            results[i] = {"analysis": section, "assessment": assessment, "source": "llm"}
+    return results
+
 @app.post("/analyze")
 async def analyze_water_quality(request: AnalysisRequest):
     try:
-        # Format the parameters for analysis
-        params_text = "\n".join([f"{k}: {v}" for k, v in request.parameters.items()])
-        location_info = f"Location: {request.location}" if request.location else ""
-        notes_info = f"Notes: {request.notes}" if request.notes else ""
+        result = await run_analysis(request)
         
-        prompt = f"{WATER_QUALITY_CONTEXT}\n\nWater Quality Parameters:\n{params_text}\n{location_info}\n{notes_info}\n\n"
-        prompt += "Analyze these water quality parameters and provide:\n"
-        prompt += "1. Overall water quality assessment\n"
-        prompt += "2. Health implications\n"
-        prompt += "3. Recommendations for treatment or improvement\n"
-        prompt += "4. Potential risks if any parameters are concerning"
-        
-        model = genai.GenerativeModel(MODEL)
-        response = model.generate_content(prompt)
-        
-        return {
-            "analysis": response.text,
+        # Returned as a response so FastAPI skips jsonable_encoder
+        return NegotiatedResponse({
+            **result,
             "timestamp": str(datetime.now().isoformat())
-        }
+        })
+    except Overloaded as e:
+        raise overloaded(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def analysis_job(payload):
+    result = await run_analysis(AnalysisRequest(**payload))
+    return {**result, "timestamp": str(datetime.now().isoformat())}
+
+@app.post("/analyze/async", status_code=202)
+async def analyze_async(request: AsyncAnalysisRequest, response: Response, idempotency_key: str = Header(None)):
+    # Devices on flaky links submit once and poll /jobs/{id} or take the
+    # webhook; resubmitting with the same Idempotency-Key returns the same job.
+    job = await asyncio.to_thread(
+        jobs.submit,
+        "analyze",
+        request.model_dump(mode="json", exclude={"callback_url"}, exclude_unset=True),
+        callback_url=str(request.callback_url) if request.callback_url else None,
+        idempotency_key=idempotency_key,
+    )
+    response.headers["Location"] = f"/jobs/{job['job_id']}"
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return NegotiatedResponse(job)
+
+@app.post("/analyze/batch")
+async def analyze_batch(request: BatchAnalysisRequest):
+    if len(request.samples) > batch.ANALYZE_BATCH_MAX_SAMPLES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {batch.ANALYZE_BATCH_MAX_SAMPLES} samples per batch"
+        )
+    results = await batch.analyze_all(
+        request.samples,
+        run_analysis,
+        analyze_packed=run_packed_analysis if request.pack else None,
+        analyze_local=local_analysis,
+        concurrency=request.max_concurrency or batch.ANALYZE_BATCH_CONCURRENCY,
+    )
+    return NegotiatedResponse({
+        "results": results,
+        "timestamp": str(datetime.now().isoformat())
+    })
+
+@app.post("/ecoli/batch")
+async def ecoli_batch(
+    request: Request,
+    uncertainty: bool = False,
+    draws: int = Query(default=ecoli.ECOLI_MC_DRAWS, ge=10, le=100000),
+    percentiles: list[float] = Query(default=list(ecoli.PERCENTILES)),
+    seed: int = Query(default=None, ge=0),
+):
+    if any(not 0 <= p <= 100 for p in percentiles):
+        raise HTTPException(status_code=422, detail="Percentiles must be between 0 and 100")
+    if uncertainty and seed is None:
+        # Reported back so the bands can be reproduced
+        seed = secrets.randbits(63)
+    body = await request.body()
+    binary = request.headers.get("content-type", "").split(";")[0].strip() == ecoli.BINARY
+    args = (body, binary, draws if uncertainty else 0, percentiles, seed)
+    try:
+        # Millions of readings, or any uncertainty run, take tens of milliseconds
+        # or more; keep them off the event loop
+        if uncertainty or len(body) >= ECOLI_OFFLOAD_BYTES:
+            estimates, bands = await ecoli.runner.run(ecoli.estimate_body, *args)
+        else:
+            estimates, bands = ecoli.estimate_body(*args)
+    except ecoli.Busy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ecoli.TooManyReadings as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if ecoli.BINARY in request.headers.get("accept", ""):
+        return Response(ecoli.to_binary(estimates, bands), media_type=ecoli.BINARY)
+    content = {"ecoli": estimates, "count": estimates.size, "cap": ecoli.CAP}
+    if bands is not None:
+        content["bands"] = {f"p{p:g}": band for p, band in zip(percentiles, bands)}
+        content["draws"] = draws
+        content["seed"] = seed
+    return NegotiatedResponse(content)
+
+@app.post("/predict")
+async def predict_risk(request: PredictRequest):
+    # The request stays on this version even if another is swapped in meanwhile
+    risk_model = models.current
+    if not risk_model.loaded:
+        raise HTTPException(status_code=503, detail=risk_model.error)
+    if not request.readings:
+        raise HTTPException(status_code=422, detail="No readings")
+    if len(request.readings) > PREDICT_MAX_READINGS:
+        raise HTTPException(status_code=413, detail=f"At most {PREDICT_MAX_READINGS} readings per request")
+    try:
+        matrix = risk_model.rows(request.readings)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    risk_model.record(len(matrix))
+    try:
+        # Concurrent requests share one model call (see predict.MicroBatcher)
+        probabilities = await predictor.submit(matrix, risk_model.predict_proba)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ModelUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    classes = risk_model.classes
+    if probabilities.shape[1] != len(classes):
+        # RiskModel.load checks this; never pair probabilities with the wrong names
+        raise HTTPException(
+            status_code=500,
+            detail=f"The risk model returned {probabilities.shape[1]} probabilities for {len(classes)} classes",
+        )
+    return NegotiatedResponse({
+        "predictions": [
+            {"risk": classes[row.argmax()], "probabilities": dict(zip(classes, row.tolist()))}
+            for row in probabilities
+        ],
+        "timestamp": str(datetime.now().isoformat())
+    })
+
+@app.post("/admin/model")
+async def swap_model(request: ModelSwapRequest, x_admin_token: str = Header(None)):
+    if not MODEL_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Model admin is disabled; set MODEL_ADMIN_TOKEN")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, MODEL_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    try:
+        # This worker swaps now; the others follow CURRENT when they next
+        # poll it (RISK_MODEL_POLL_SECONDS)
+        swapped = await models.reload(request.version, force=True, publish=request.version is not None)
+    except UnknownVersion as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not swapped:
+        raise HTTPException(status_code=500, detail=models.error)
+    return {"version": models.current.version, "swaps": models.swaps, "load_seconds": models.current.load_seconds}
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    current_priority.set(CHAT)
+    intent = intents.classify(request.query)
+    if intent.reply is not None:
+        return sse_response("chat", single_chunk(intent.reply), metadata={"cached": False, "intent": intent.name})
+    cached = faq_cache.lookup(request.query)
+    if cached is not None:
+        return sse_response("chat", single_chunk(cached), metadata={"cached": True})
+    prompt = build_chat_prompt(request.query)
+    tier = router.route("chat", prompt)
+    # Admitted before the 200 goes out, so shed load is a 503 as on /chat
+    try:
+        chunks = await llm.open_stream(prompt, tier, timeout=CHAT_DEADLINE)
+    except Overloaded as e:
+        raise overloaded(e)
+    except CircuitOpenError as e:
+        raise circuit_open(e)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"No Gemini quota within {CHAT_DEADLINE:g}s")
+    return sse_response(
+        "chat",
+        chunks,
+        on_complete=lambda text: faq_cache.add(request.query, text),
+        metadata={"cached": False, "model": llm.get_backend(tier).model_name},
+    )
+
+@app.post("/analyze/stream")
+async def analyze_stream(request: AnalysisRequest):
+    if request.format == "structured":
+        raise HTTPException(status_code=422, detail="Structured analyses are not streamed; use /analyze")
+    assessment = rules.assess(request.parameters)
+    local = local_analysis(request, assessment)
+    if local is not None:
+        return sse_response(
+            "analyze",
+            single_chunk(local["analysis"]),
+            metadata={"cached": local["source"] == "llm", "source": local["source"], "assessment": assessment},
+        )
+    current_priority.set(analysis_priority(request, assessment))
+    prompt = build_analysis_prompt(request, assessment)
+    tier = analysis_tier("analyze", request, prompt, assessment)
+    # As on /analyze: shed load is a 503, an open circuit or no quota in time
+    # falls back to the rules
+    try:
+        chunks = await llm.open_stream(prompt, tier, timeout=ANALYZE_DEADLINE)
+    except Overloaded as e:
+        raise overloaded(e)
+    except (CircuitOpenError, asyncio.TimeoutError) as e:
+        reason = "circuit_open" if isinstance(e, CircuitOpenError) else "deadline_exceeded"
+        degraded = degraded_analysis(request, assessment, reason)
+        return sse_response(
+            "analyze",
+            single_chunk(degraded["analysis"]),
+            metadata={key: value for key, value in degraded.items() if key != "analysis"},
+        )
+    return sse_response(
+        "analyze",
+        chunks,
+        on_complete=lambda text: analysis_cache.set(analysis_key(request, assessment), text),
+        metadata={"cached": False, "source": "llm", "model": llm.get_backend(tier).model_name, "assessment": assessment},
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
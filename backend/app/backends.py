@@ -0,0 +1,231 @@
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from google.api_core import exceptions as api_exceptions
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+
+# Each pooled client owns its own channel (gRPC) or session (REST), both of
+# which keep their connections alive between calls.
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "4"))
+
+
+class LLMBackend:
+    """What the service needs from a text generator.
+
+    ``generate`` and ``stream`` block, and are run on the LLM thread pool.
+    ``max_output_tokens`` caps the completion length when given, and
+    ``timeout`` is the seconds left before the caller gives up: the call
+    should stop then instead of holding its thread. Failures should raise
+    ``google.api_core`` exceptions so retries and the circuit breaker treat
+    every backend alike.
+    """
+
+    name = "base"
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def generate(self, prompt, max_output_tokens=None, timeout=None):
+        raise NotImplementedError
+
+    def stream(self, prompt, timeout=None):
+        # Backends without native streaming return the whole text as one chunk.
+        yield self.generate(prompt, timeout=timeout)
+
+    def warm_up(self):
+        pass
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, model_name, pool_size=LLM_POOL_SIZE, client_options=None):
+        super().__init__(model_name)
+        import google.generativeai as genai
+        from google.generativeai import client as genai_client
+
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable is not set")
+        # "grpc" (default) or "rest"
+        genai.configure(
+            api_key=api_key,
+            transport=os.getenv("GEMINI_TRANSPORT") or None,
+            client_options=client_options,
+        )
+
+        self.models = []
+        for _ in range(max(1, pool_size)):
+            model = genai.GenerativeModel(model_name)
+            # GenerativeModel lazily binds the process-wide default client;
+            # give each pooled model a dedicated one instead.
+            model._client = genai_client._client_manager.make_client("generative")
+            self.models.append(model)
+        self._cycle = itertools.cycle(self.models)
+
+    def generate(self, prompt, max_output_tokens=None, timeout=None):
+        config = {"max_output_tokens": max_output_tokens} if max_output_tokens else None
+        options = {"timeout": timeout} if timeout else None
+        return next(self._cycle).generate_content(prompt, generation_config=config, request_options=options).text
+
+    def stream(self, prompt, timeout=None):
+        options = {"timeout": timeout} if timeout else None
+        for chunk in next(self._cycle).generate_content(prompt, stream=True, request_options=options):
+            yield chunk.text
+
+    def warm_up(self):
+        # count_tokens opens the connection without paying for a generation.
+        for model in self.models:
+            model.count_tokens("warm-up")
+
+
+STANDIN_ERRORS = {
+    "rate_limit": api_exceptions.TooManyRequests,
+    "unavailable": api_exceptions.ServiceUnavailable,
+    "internal": api_exceptions.InternalServerError,
+    "deadline": api_exceptions.DeadlineExceeded,
+}
+
+DEFAULT_TEMPLATE = (
+    "[{model} stand-in] Response to a {prompt_tokens}-token prompt.\n\n"
+    "Overall assessment: parameters reviewed against drinking water guidance.\n"
+    "Health implications: none beyond those implied by the flagged readings.\n"
+    "Recommendations: boil or chlorinate if in doubt and retest the source.\n"
+)
+_query_line = re.compile(r"^User Query: (.*)$", re.MULTILINE)
+
+
+class StandInBackend(LLMBackend):
+    """Local stand-in for Gemini for load tests, benchmarks and offline runs.
+
+    Latency is a time to first token drawn from ``latency`` ("fixed",
+    "uniform", "lognormal" or "pareto"), with a ``tail_rate`` share of calls
+    slowed by ``tail_factor``. The rest of the output is produced at
+    ``tokens_per_second``. ``error_rate`` of calls fail with one of
+    ``errors``. Text comes from ``responses``, a list of
+    ``{"match": regex, "response": text}`` rules, or from ``template``,
+    padded to about ``output_tokens`` tokens.
+    """
+
+    name = "standin"
+
+    def __init__(self, model_name, latency="lognormal", median=0.5, spread=0.5, tail_rate=0.0, tail_factor=20.0,
+                 tokens_per_second=80.0, output_tokens=200, error_rate=0.0, errors=("unavailable",),
+                 responses=(), template=DEFAULT_TEMPLATE, chunk_tokens=8, seed=None):
+        super().__init__(model_name)
+        self.latency = latency
+        self.median = median
+        self.spread = spread
+        self.tail_rate = tail_rate
+        self.tail_factor = tail_factor
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.errors = [STANDIN_ERRORS[name] for name in errors]
+        self.responses = [(re.compile(rule["match"], re.IGNORECASE), rule["response"]) for rule in responses]
+        self.template = template
+        self.chunk_tokens = chunk_tokens
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls, model_name):
+        responses = ()
+        if os.getenv("STANDIN_RESPONSES"):
+            with open(os.getenv("STANDIN_RESPONSES")) as f:
+                responses = json.load(f)
+        seed = os.getenv("STANDIN_SEED")
+        return cls(
+            model_name,
+            latency=os.getenv("STANDIN_LATENCY", "lognormal"),
+            median=float(os.getenv("STANDIN_MEDIAN", "0.5")),
+            spread=float(os.getenv("STANDIN_SPREAD", "0.5")),
+            tail_rate=float(os.getenv("STANDIN_TAIL_RATE", "0")),
+            tail_factor=float(os.getenv("STANDIN_TAIL_FACTOR", "20")),
+            tokens_per_second=float(os.getenv("STANDIN_TOKENS_PER_SECOND", "80")),
+            output_tokens=int(os.getenv("STANDIN_OUTPUT_TOKENS", "200")),
+            error_rate=float(os.getenv("STANDIN_ERROR_RATE", "0")),
+            errors=tuple(filter(None, os.getenv("STANDIN_ERRORS", "unavailable").split(","))),
+            responses=responses,
+            template=os.getenv("STANDIN_TEMPLATE", DEFAULT_TEMPLATE),
+            seed=int(seed) if seed else None,
+        )
+
+    def _draw(self):
+        # random.Random is not safe to share between executor threads.
+        with self._lock:
+            self.calls += 1
+            rnd = self._random
+            if self.latency == "fixed":
+                delay = self.median
+            elif self.latency == "uniform":
+                delay = rnd.uniform(max(0.0, self.median - self.spread), self.median + self.spread)
+            elif self.latency == "pareto":
+                delay = self.median * rnd.paretovariate(1 / max(self.spread, 1e-6)) / 2 ** self.spread
+            else:
+                delay = self.median * rnd.lognormvariate(0, self.spread)
+            if rnd.random() < self.tail_rate:
+                delay *= self.tail_factor
+            error = rnd.choice(self.errors) if self.errors and rnd.random() < self.error_rate else None
+        return delay, error
+
+    def _text(self, prompt):
+        for pattern, response in self.responses:
+            if pattern.search(prompt):
+                return response
+        query = _query_line.search(prompt)
+        text = self.template.format(
+            model=self.model_name,
+            prompt_tokens=len(prompt) // 4,
+            query=query.group(1) if query else "",
+        )
+        filler = "Continue routine monitoring of the source. "
+        while len(text) // 4 < self.output_tokens:
+            text += filler
+        return text
+
+    def _chunks(self, prompt, max_output_tokens=None, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def sleep(seconds):
+            # Like a real client, give up at the deadline rather than finish late
+            if deadline is not None and time.monotonic() + seconds > deadline:
+                time.sleep(max(0.0, deadline - time.monotonic()))
+                raise api_exceptions.DeadlineExceeded("Stand-in call passed its deadline")
+            time.sleep(seconds)
+
+        delay, error = self._draw()
+        sleep(delay)
+        if error is not None:
+            raise error("Injected stand-in failure")
+        text = self._text(prompt)
+        if max_output_tokens:
+            text = text[:max_output_tokens * 4]
+        size = self.chunk_tokens * 4
+        for i in range(0, len(text), size):
+            chunk = text[i:i + size]
+            if self.tokens_per_second > 0:
+                sleep(len(chunk) / 4 / self.tokens_per_second)
+            yield chunk
+
+    def generate(self, prompt, max_output_tokens=None, timeout=None):
+        return "".join(self._chunks(prompt, max_output_tokens, timeout))
+
+    def stream(self, prompt, timeout=None):
+        return self._chunks(prompt, timeout=timeout)
+
+
+BACKENDS = {"gemini": GeminiBackend, "standin": StandInBackend.from_env}
+
+
+def create_backend(model_name, name=LLM_BACKEND):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM_BACKEND {name!r}; expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](model_name)
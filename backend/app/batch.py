@@ -0,0 +1,101 @@
+import asyncio
+import os
+import re
+
+import orjson
+
+ANALYZE_BATCH_MAX_SAMPLES = int(os.getenv("ANALYZE_BATCH_MAX_SAMPLES", "1000"))
+ANALYZE_BATCH_CONCURRENCY = int(os.getenv("ANALYZE_BATCH_CONCURRENCY", "8"))
+ANALYZE_BATCH_PACK_SIZE = int(os.getenv("ANALYZE_BATCH_PACK_SIZE", "5"))
+
+SAMPLE_HEADING = "### Sample {}"
+_heading = re.compile(r"^\s*#{1,4}\s*\**\s*Sample\s+(\d+)\b.*$", re.IGNORECASE | re.MULTILINE)
+
+
+def sample_key(sample):
+    """Exact identity of a batch sample: its values as given and every option that changes the result.
+
+    Unlike the cache key, readings are not rounded: two samples either side
+    of a limit must not share one assessment.
+    """
+    return orjson.dumps(sample.model_dump(mode="json"), option=orjson.OPT_SORT_KEYS)
+
+
+def split_packed(text, count):
+    """Split a packed completion into per-sample sections.
+
+    Returns a list of ``count`` texts; a sample whose heading is missing from
+    the completion gets ``None``.
+    """
+    sections = [None] * count
+    matches = list(_heading.finditer(text))
+    for match, following in zip(matches, matches[1:] + [None]):
+        number = int(match.group(1))
+        end = following.start() if following else len(text)
+        body = text[match.end():end].strip()
+        if 1 <= number <= count and body:
+            sections[number - 1] = body
+    return sections
+
+
+async def analyze_all(samples, analyze_one, analyze_packed=None, analyze_local=None,
+                      concurrency=ANALYZE_BATCH_CONCURRENCY, pack_size=ANALYZE_BATCH_PACK_SIZE):
+    """Analyze ``samples`` and return per-item results in input order.
+
+    Identical samples (same ``sample_key``) are analyzed once. With
+    ``analyze_packed``, samples that ``analyze_local`` cannot answer go
+    upstream ``pack_size`` at a time; any sample the packed completion leaves
+    out (``None``) is retried on its own.
+    """
+    keys = [sample_key(sample) for sample in samples]
+    unique = {}
+    for key, sample in zip(keys, samples):
+        unique.setdefault(key, sample)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    outcomes = {}
+
+    async def run_one(key, sample):
+        async with semaphore:
+            try:
+                outcomes[key] = ("result", await analyze_one(sample))
+            except Exception as e:
+                outcomes[key] = ("error", str(e))
+
+    async def run_group(group):
+        async with semaphore:
+            try:
+                results = await analyze_packed([sample for _, sample in group])
+            except Exception as e:
+                for key, _ in group:
+                    outcomes[key] = ("error", str(e))
+                return
+        missing = []
+        for (key, sample), result in zip(group, results):
+            if result is None:
+                missing.append(run_one(key, sample))
+            else:
+                outcomes[key] = ("result", result)
+        await asyncio.gather(*missing)
+
+    if analyze_packed is None:
+        await asyncio.gather(*(run_one(key, sample) for key, sample in unique.items()))
+    else:
+        pending = []
+        for key, sample in unique.items():
+            local = analyze_local(sample) if analyze_local else None
+            if local is None:
+                pending.append((key, sample))
+            else:
+                outcomes[key] = ("result", local)
+        groups = [pending[i:i + pack_size] for i in range(0, len(pending), pack_size)]
+        await asyncio.gather(*(run_group(group) for group in groups))
+
+    results = []
+    for index, key in enumerate(keys):
+        kind, value = outcomes[key]
+        if kind == "result":
+            results.append({"index": index, **value})
+        else:
+            results.append({"index": index, "error": value})
+    return results
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import time
+from collections import Counter
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "15"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Upstream circuit is open; retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling an upstream after consecutive failures or slow calls.
+
+    After ``reset_seconds`` open, a single probe call is let through
+    (half-open); its outcome closes the circuit again or re-opens it.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 slow_call_seconds=BREAKER_SLOW_CALL_SECONDS, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.transitions = Counter()
+        self.rejected = 0
+
+    def _transition(self, state):
+        if state != self.state:
+            self.transitions[f"{self.state}->{state}"] += 1
+            self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+
+    def retry_after(self):
+        return max(0.0, self.opened_at + self.reset_seconds - time.monotonic())
+
+    def before_call(self):
+        if self.state == OPEN and self.retry_after() == 0:
+            self._transition(HALF_OPEN)
+        if self.state == OPEN or (self.state == HALF_OPEN and self.probe_in_flight):
+            self.rejected += 1
+            raise CircuitOpenError(self.retry_after() or self.reset_seconds)
+        if self.state == HALF_OPEN:
+            self.probe_in_flight = True
+
+    def record(self, ok, duration=0.0):
+        self.probe_in_flight = False
+        if ok and duration < self.slow_call_seconds:
+            self.consecutive_failures = 0
+            self._transition(CLOSED)
+            return
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._transition(OPEN)
+
+    async def call(self, fn, timeout=None):
+        """Await ``fn()`` under the breaker with an optional deadline in seconds."""
+        self.before_call()
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(fn(), timeout)
+        except asyncio.CancelledError:
+            self.probe_in_flight = False
+            raise
+        except Exception:
+            self.record(False)
+            raise
+        self.record(True, time.monotonic() - start)
+        return result
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected": self.rejected,
+            "transitions": dict(self.transitions),
+        }
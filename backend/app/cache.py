@@ -0,0 +1,113 @@
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import rules
+
+
+def parse_precision(spec):
+    # "default=0.1,ph=0.05,tds=10" -> {"default": 0.1, "ph": 0.05, "tds": 10.0}
+    precision = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, step = item.partition("=")
+        precision[name.strip().lower()] = float(step)
+    return precision
+
+
+ANALYZE_CACHE_SIZE = int(os.getenv("ANALYZE_CACHE_SIZE", "1024"))
+ANALYZE_CACHE_TTL = float(os.getenv("ANALYZE_CACHE_TTL", "900"))
+ANALYZE_CACHE_MAX_BYTES = int(os.getenv("ANALYZE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+ANALYZE_CACHE_PRECISION = parse_precision(os.getenv("ANALYZE_CACHE_PRECISION", "default=0.1"))
+
+
+class TTLCache:
+    """LRU cache with per-entry expiry and a cap on the approximate bytes held."""
+
+    def __init__(self, max_entries, ttl, max_bytes):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = sys.getsizeof(repr(key)) + sys.getsizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, time.monotonic() + self.ttl, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self._bytes -= self._data.pop(key)[2]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def _quantize(name, value, precision):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return str(value).strip().lower()
+    if not math.isfinite(value):
+        return str(value)
+    step = precision.get(name, precision.get("default"))
+    if not step:
+        return value
+    # Store the step count, not step * count, so float noise cannot split keys.
+    return round(value / step)
+
+
+def analysis_key(request, assessment=None, precision=ANALYZE_CACHE_PRECISION):
+    """Cache key for ``request``'s analysis: readings rounded to ``precision``, and the options.
+
+    Each reading's status under the limit tables (from ``assessment``,
+    computed if not given) is part of the key, so readings that round
+    together but fall either side of a limit never share an analysis.
+    """
+    assessment = assessment or rules.assess(request.parameters)
+    params = {str(k).strip().lower(): v for k, v in request.parameters.items()}
+    return (
+        tuple((name, _quantize(name, params[name], precision)) for name in sorted(params)),
+        tuple(sorted((name, flag["status"]) for name, flag in assessment["parameters"].items())),
+        (request.location or "").strip().lower(),
+        (request.notes or "").strip(),
+        request.format,
+    )
+
+
+analysis_cache = TTLCache(ANALYZE_CACHE_SIZE, ANALYZE_CACHE_TTL, ANALYZE_CACHE_MAX_BYTES)
@@ -0,0 +1,298 @@
+import asyncio
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import orjson
+
+from metrics import LatencyTracker
+
+# Coefficients of the E. coli estimation algorithm (see the README)
+TEMP_COEFF = 0.0693  # per °C
+TURBIDITY_FACTOR = 0.2156  # per NTU
+PH_ADJUSTMENT = 0.1234  # per pH unit away from neutral
+RAINFALL_IMPACT = 0.3421  # per mm
+BASE_CONTAMINATION = 10  # CFU/100ml
+CAP = 10000  # CFU/100ml
+
+COLUMNS = ("ph", "temperature", "turbidity", "rainfall", "season_factor")
+# Binary bodies are the five columns above, in order, as little-endian float64
+BINARY = "application/octet-stream"
+ECOLI_BATCH_MAX_READINGS = int(os.getenv("ECOLI_BATCH_MAX_READINGS", "5000000"))
+
+# Uncertainty bands: Monte Carlo draws per reading, the most draws x readings
+# one request may ask for, and the memory one chunk of draws may use
+ECOLI_MC_DRAWS = int(os.getenv("ECOLI_MC_DRAWS", "2000"))
+ECOLI_MC_MAX_SAMPLES = int(os.getenv("ECOLI_MC_MAX_SAMPLES", "20000000"))
+ECOLI_MC_MAX_BYTES = int(os.getenv("ECOLI_MC_MAX_BYTES", str(64 * 1024 * 1024)))
+PERCENTILES = (5, 50, 95)
+# Threads per worker for uncertainty runs and large bodies, kept apart from
+# the default executor that the SQLite stores use, and how many more requests
+# may wait for one before /ecoli/batch answers 503
+ECOLI_THREADS = int(os.getenv("ECOLI_THREADS", "2"))
+ECOLI_MAX_QUEUE = int(os.getenv("ECOLI_MAX_QUEUE", "4"))
+# Readings per random stream. Each block has its own streams, drawn row after
+# row and carried across chunk edges, so the memory bound (which may split a
+# block between chunks) does not change the draws a reading gets
+MC_BLOCK = 1024
+# Relative standard deviation of each coefficient
+COEFF_SD = 0.05
+# Sensor noise: absolute for pH (units) and temperature (°C), relative for
+# turbidity and rainfall
+PH_NOISE = 0.1
+TEMPERATURE_NOISE = 0.5
+TURBIDITY_NOISE = 0.1
+RAINFALL_NOISE = 0.1
+# Residual model error, lognormal; the README's ±15% taken as a 95% interval
+MODEL_SIGMA = math.log(1.15) / 1.96
+
+
+class TooManyReadings(ValueError):
+    pass
+
+
+class Busy(Exception):
+    pass
+
+
+def estimate_ecoli(ph, temperature, turbidity, rainfall, season_factor):
+    """E. coli estimate in CFU/100ml for a single reading."""
+    growth_factor = (TEMP_COEFF * temperature +
+                     TURBIDITY_FACTOR * turbidity +
+                     PH_ADJUSTMENT * abs(ph - 7) +
+                     RAINFALL_IMPACT * rainfall)
+    return min(BASE_CONTAMINATION * math.exp(growth_factor) * season_factor, CAP)
+
+
+def estimate_ecoli_batch(ph, temperature, turbidity, rainfall, season_factor):
+    """``estimate_ecoli`` over arrays of readings; scalars broadcast against the arrays.
+
+    Works in place on one output and one scratch buffer, summing the terms in
+    the same order as the scalar version.
+    """
+    columns = [np.asarray(column, dtype=np.float64) for column in (ph, temperature, turbidity, rainfall, season_factor)]
+    ph, temperature, turbidity, rainfall, season_factor = columns
+    out = np.empty(np.broadcast_shapes(*(column.shape for column in columns)))
+    scratch = np.empty_like(out)
+
+    np.multiply(temperature, TEMP_COEFF, out=out)
+    np.multiply(turbidity, TURBIDITY_FACTOR, out=scratch)
+    out += scratch
+    np.subtract(ph, 7, out=scratch)
+    np.abs(scratch, out=scratch)
+    scratch *= PH_ADJUSTMENT
+    out += scratch
+    np.multiply(rainfall, RAINFALL_IMPACT, out=scratch)
+    out += scratch
+    # Overflow goes to inf, which the cap brings back to CAP
+    with np.errstate(over="ignore"):
+        np.exp(out, out=out)
+    out *= BASE_CONTAMINATION
+    out *= season_factor
+    np.minimum(out, CAP, out=out)
+    return out
+
+
+def estimate_ecoli_bands(ph, temperature, turbidity, rainfall, season_factor, draws=ECOLI_MC_DRAWS,
+                         percentiles=PERCENTILES, seed=None, max_bytes=ECOLI_MC_MAX_BYTES):
+    """Monte Carlo percentile bands around ``estimate_ecoli_batch``.
+
+    Each draw samples the coefficients, noise on every sensor reading and the
+    residual model error. Returns an array of shape ``(len(percentiles), n)``.
+    The same ``seed`` gives the same bands whatever ``max_bytes`` is.
+    """
+    columns = np.broadcast_arrays(
+        *(np.asarray(column, dtype=np.float64) for column in (ph, temperature, turbidity, rainfall, season_factor))
+    )
+    shape = columns[0].shape
+    ph, temperature, turbidity, rainfall, season_factor = (column.reshape(-1) for column in columns)
+    n = ph.size
+    root = np.random.SeedSequence(seed)
+    coeffs = np.random.default_rng(root).normal(
+        loc=[[TEMP_COEFF], [TURBIDITY_FACTOR], [PH_ADJUSTMENT], [RAINFALL_IMPACT]],
+        scale=[[TEMP_COEFF * COEFF_SD], [TURBIDITY_FACTOR * COEFF_SD], [PH_ADJUSTMENT * COEFF_SD],
+               [RAINFALL_IMPACT * COEFF_SD]],
+        size=(4, draws),
+    )
+
+    # Five (readings, draws) float64 noise buffers per chunk, reused for the
+    # terms, plus the coefficients; the percentiles are taken in place
+    chunk = (max_bytes - coeffs.nbytes) // (5 * 8 * draws)
+    if chunk < 1:
+        raise TooManyReadings(f"{draws} draws need more than {max_bytes} bytes for a single reading")
+    bands = np.empty((len(percentiles), n))
+    # Allocated once: a new buffer per chunk would briefly coexist with the last
+    buffer = np.empty((5, min(chunk, n), draws))
+    block, streams = None, None
+    for start in range(0, n, chunk):
+        stop = min(start + chunk, n)
+        m = stop - start
+        # Noise for the chunk: temperature, turbidity, pH, rainfall and model
+        # error, each (m, draws). Every block of MC_BLOCK readings has one
+        # stream per term, drawn row after row, so chunks of any size (even
+        # parts of a block) see the same numbers
+        noise = buffer[:, :m]
+        row = start
+        while row < stop:
+            if row // MC_BLOCK != block:
+                block = row // MC_BLOCK
+                streams = [
+                    np.random.default_rng(np.random.SeedSequence(root.entropy, spawn_key=(block, term)))
+                    for term in range(5)
+                ]
+            end = min((block + 1) * MC_BLOCK, stop)
+            for column, rng in zip(noise, streams):
+                rng.standard_normal(out=column[row - start:end - start])
+            row = end
+        rows = slice(start, stop)
+        out = noise[0]
+        out *= TEMPERATURE_NOISE
+        out += temperature[rows, None]
+        out *= coeffs[0]
+        scratch = noise[1]
+        scratch *= TURBIDITY_NOISE
+        scratch += 1
+        scratch *= turbidity[rows, None]
+        np.maximum(scratch, 0, out=scratch)
+        scratch *= coeffs[1]
+        out += scratch
+        scratch = noise[2]
+        scratch *= PH_NOISE
+        scratch += ph[rows, None]
+        scratch -= 7
+        np.abs(scratch, out=scratch)
+        scratch *= coeffs[2]
+        out += scratch
+        scratch = noise[3]
+        scratch *= RAINFALL_NOISE
+        scratch += 1
+        scratch *= rainfall[rows, None]
+        np.maximum(scratch, 0, out=scratch)
+        scratch *= coeffs[3]
+        out += scratch
+        scratch = noise[4]
+        scratch *= MODEL_SIGMA
+        out += scratch
+        with np.errstate(over="ignore"):
+            np.exp(out, out=out)
+        out *= BASE_CONTAMINATION
+        out *= season_factor[rows, None]
+        np.minimum(out, CAP, out=out)
+        bands[:, rows] = np.percentile(out, percentiles, axis=1, overwrite_input=True)
+    return bands.reshape((len(percentiles),) + shape)
+
+
+def parse_columns(body):
+    """Columnar JSON ``{"ph": [...], ...}`` to arrays; ``season_factor`` may be a single number."""
+    try:
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise ValueError("Body is not valid JSON")
+    if not isinstance(payload, dict):
+        raise ValueError("Body must be an object of columns")
+    missing = [name for name in COLUMNS if name not in payload]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    try:
+        columns = [np.asarray(payload[name], dtype=np.float64) for name in COLUMNS]
+    except (TypeError, ValueError):
+        raise ValueError("Columns must hold numbers only")
+    if any(column.ndim > 1 for column in columns):
+        raise ValueError("Columns must be flat lists")
+    if all(column.ndim == 0 for column in columns):
+        raise ValueError("Columns must be lists; only season_factor may be a single number")
+    lengths = {column.size for column in columns if column.ndim == 1}
+    if len(lengths) > 1:
+        raise ValueError("Columns must all have the same length")
+    return columns
+
+
+def parse_binary(body):
+    if len(body) % (8 * len(COLUMNS)):
+        raise ValueError(f"Binary body must be {len(COLUMNS)} float64 columns of equal length")
+    return list(np.frombuffer(body, dtype="<f8").reshape(len(COLUMNS), -1))
+
+
+def estimate_body(body, binary=False, draws=0, percentiles=PERCENTILES, seed=None):
+    """Estimates for a request body, and their percentile bands when ``draws`` is set."""
+    columns = parse_binary(body) if binary else parse_columns(body)
+    readings = max(column.size for column in columns)
+    if readings > ECOLI_BATCH_MAX_READINGS:
+        raise TooManyReadings(f"At most {ECOLI_BATCH_MAX_READINGS} readings per request")
+    if readings * draws > ECOLI_MC_MAX_SAMPLES:
+        raise TooManyReadings(f"At most {ECOLI_MC_MAX_SAMPLES} readings x draws per request")
+    with stats.latency.time():
+        estimates = estimate_ecoli_batch(*columns)
+    stats.requests += 1
+    stats.readings += estimates.size
+    stats.capped += int(np.count_nonzero(estimates == CAP))
+    if not draws:
+        return estimates, None
+    with stats.bands_latency.time():
+        bands = estimate_ecoli_bands(*columns, draws=draws, percentiles=percentiles, seed=seed)
+    stats.band_requests += 1
+    stats.draws += estimates.size * draws
+    return estimates, bands
+
+
+def to_binary(estimates, bands=None):
+    """Little-endian float64 columns: the estimates, then one per percentile band."""
+    columns = estimates if bands is None else np.vstack([estimates, bands])
+    return columns.astype("<f8", copy=False).tobytes()
+
+
+class Runner:
+    """Runs estimates off the event loop on ``threads`` threads of their own.
+
+    At most ``max_queue`` more may wait for a thread; past that ``run``
+    raises ``Busy``. A request whose client went away keeps its place until
+    its thread is done, so the bound holds for the work actually running.
+    """
+
+    def __init__(self, threads=ECOLI_THREADS, max_queue=ECOLI_MAX_QUEUE):
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="ecoli")
+        self.limit = threads + max_queue
+        self._places = threading.BoundedSemaphore(self.limit)
+        self.shed = 0
+
+    async def run(self, fn, *args):
+        if not self._places.acquire(blocking=False):
+            self.shed += 1
+            raise Busy(f"More than {self.limit} E. coli estimates running or queued")
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self._places.release())
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class EcoliStats:
+    def __init__(self):
+        self.requests = 0
+        self.readings = 0
+        self.capped = 0
+        self.latency = LatencyTracker()
+        self.band_requests = 0
+        self.draws = 0
+        self.bands_latency = LatencyTracker()
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "readings": self.readings,
+            "capped": self.capped,
+            "latency": self.latency.stats(),
+            "bands": {
+                "requests": self.band_requests,
+                "draws": self.draws,
+                "latency": self.bands_latency.stats(),
+            },
+            "shed": runner.shed,
+        }
+
+
+runner = Runner()
+stats = EcoliStats()
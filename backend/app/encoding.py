@@ -0,0 +1,198 @@
+import asyncio
+import gzip
+import os
+from contextvars import ContextVar
+
+import brotli
+import msgpack
+import orjson
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+# Bodies smaller than this are sent as is; compressing them saves little.
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+# Brotli's default quality (11) is meant for static assets; 4-5 suits dynamic responses.
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+
+MSGPACK = "application/msgpack"
+MSGPACK_TYPES = {MSGPACK, "application/x-msgpack"}
+# Streaming bodies (SSE) have to reach the client chunk by chunk.
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+# Larger bodies (batch results) are compressed off the event loop.
+COMPRESS_OFFLOAD_BYTES = 64 * 1024
+
+_wants_msgpack = ContextVar("wants_msgpack", default=False)
+
+
+def dumps(content):
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def _to_builtin(value):
+    # NumPy arrays and scalars, which orjson serializes natively
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class NegotiatedResponse(Response):
+    """JSON via orjson, or msgpack when the request's Accept header asks for it."""
+
+    media_type = "application/json"
+
+    def __init__(self, content, *args, **kwargs):
+        self.binary = _wants_msgpack.get()
+        if self.binary:
+            self.media_type = MSGPACK
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content):
+        if self.binary:
+            return msgpack.packb(content, use_bin_type=True, default=_to_builtin)
+        return dumps(content)
+
+
+def _accepted(header):
+    # "gzip;q=0.5, br" -> {"gzip": 0.5, "br": 1.0}
+    accepted = {}
+    for item in filter(None, (part.strip() for part in header.split(","))):
+        name, _, params = item.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding):
+    accepted = _accepted(accept_encoding)
+    for encoding in ("br", "gzip"):
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+class WireStats:
+    def __init__(self):
+        self.responses = {"identity": 0, "gzip": 0, "br": 0}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.msgpack_requests = 0
+
+    def stats(self):
+        return {
+            "responses": dict(self.responses),
+            "body_bytes": self.bytes_in,
+            "wire_bytes": self.bytes_out,
+            "ratio": self.bytes_out / self.bytes_in if self.bytes_in else None,
+            "msgpack_requests": self.msgpack_requests,
+        }
+
+
+wire = WireStats()
+
+
+class NegotiationMiddleware:
+    """Content negotiation for the whole app.
+
+    Decodes msgpack request bodies into JSON for the route handlers, records
+    whether the client accepts msgpack for ``NegotiatedResponse``, and
+    compresses complete responses of at least ``minimum_size`` bytes with
+    brotli or gzip as the client's Accept-Encoding allows. Streamed responses
+    pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        accept = {item.split(";")[0].strip() for item in headers.get("accept", "").split(",")}
+        _wants_msgpack.set(bool(accept & MSGPACK_TYPES))
+        if headers.get("content-type", "").split(";")[0].strip() in MSGPACK_TYPES:
+            scope, receive = await self._decode_msgpack(scope, receive)
+        encoding = choose_encoding(headers.get("accept-encoding", ""))
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            response_headers = MutableHeaders(raw=start["headers"])
+            if (
+                message.get("more_body")
+                or encoding is None
+                or len(body) < self.minimum_size
+                or "content-encoding" in response_headers
+                or response_headers.get("content-type", "").startswith(UNCOMPRESSED_TYPES)
+            ):
+                if not message.get("more_body"):
+                    wire.responses["identity"] += 1
+                    wire.bytes_in += len(body)
+                    wire.bytes_out += len(body)
+                await send(start)
+                start = None
+                await send(message)
+                return
+            if len(body) >= COMPRESS_OFFLOAD_BYTES:
+                compressed = await asyncio.to_thread(compress, body, encoding)
+            else:
+                compressed = compress(body, encoding)
+            wire.responses[encoding] += 1
+            wire.bytes_in += len(body)
+            wire.bytes_out += len(compressed)
+            response_headers["Content-Encoding"] = encoding
+            response_headers["Content-Length"] = str(len(compressed))
+            response_headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            start = None
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
+
+    async def _decode_msgpack(self, scope, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        try:
+            body = dumps(msgpack.unpackb(b"".join(chunks), raw=False))
+        except (ValueError, TypeError):
+            # Left as is; the route then rejects the body as malformed JSON.
+            body = b"".join(chunks)
+        wire.msgpack_requests += 1
+        raw = [(k, v) for k, v in scope["headers"] if k not in (b"content-type", b"content-length")]
+        raw += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return {**scope, "headers": raw}, replay
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import random
+
+from google.api_core import exceptions as api_exceptions
+
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", "0.25"))
+LLM_RETRY_CAP = float(os.getenv("LLM_RETRY_CAP", "4"))
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.1"))
+LLM_RETRY_BUDGET_MAX = float(os.getenv("LLM_RETRY_BUDGET_MAX", "10"))
+
+# Errors worth trying again: rate limits, overload and transient server faults.
+TRANSIENT_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.InternalServerError,
+    api_exceptions.DeadlineExceeded,
+)
+
+
+class RetryBudget:
+    """Caps retries and hedges at a fraction of primary calls.
+
+    Every primary call deposits ``ratio`` tokens (up to ``max_tokens``); each
+    retry or hedge spends a whole token. During an outage the bucket drains
+    quickly, so extra attempts cannot multiply upstream load.
+    """
+
+    def __init__(self, ratio=LLM_RETRY_BUDGET_RATIO, max_tokens=LLM_RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.spent = 0
+        self.denied = 0
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        if self.tokens < 1:
+            self.denied += 1
+            return False
+        self.tokens -= 1
+        self.spent += 1
+        return True
+
+    def stats(self):
+        return {"tokens": round(self.tokens, 2), "spent": self.spent, "denied": self.denied}
+
+
+class HedgeStats:
+    def __init__(self):
+        self.fired = 0
+        self.won = 0
+        self.retries = 0
+
+    def stats(self):
+        return {"hedges_fired": self.fired, "hedges_won": self.won, "retries": self.retries}
+
+
+def hedge_delay(latency):
+    # Fire the hedge once the call is slower than the configured percentile
+    # of recent upstream latencies; no hedging until there is enough history.
+    if len(latency.samples) < LLM_HEDGE_MIN_SAMPLES:
+        return None
+    return max(LLM_HEDGE_MIN_DELAY, latency.percentile(LLM_HEDGE_PERCENTILE))
+
+
+async def hedged(fn, delay, budget, stats):
+    """Run ``fn()``; if it is still pending after ``delay`` seconds, race a second copy."""
+    first = asyncio.ensure_future(fn())
+    if delay is None:
+        return await first
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done or not budget.withdraw():
+        return await first
+
+    stats.fired += 1
+    second = asyncio.ensure_future(fn())
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        stats.won += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def with_retries(fn, deadline, budget, stats, attempts=LLM_RETRIES):
+    """Call ``fn()``, retrying transient errors with full-jitter backoff.
+
+    Retries stop when ``attempts`` are used up, when the retry budget is
+    empty, or when the backoff would run past ``deadline`` (loop time).
+    """
+    loop = asyncio.get_running_loop()
+    budget.deposit()
+    for attempt in range(attempts + 1):
+        try:
+            return await fn()
+        except TRANSIENT_ERRORS:
+            if attempt == attempts:
+                raise
+            backoff = random.uniform(0, min(LLM_RETRY_CAP, LLM_RETRY_BASE * 2 ** attempt))
+            if deadline is not None and loop.time() + backoff >= deadline:
+                raise
+            if not budget.withdraw():
+                raise
+            stats.retries += 1
+            await asyncio.sleep(backoff)
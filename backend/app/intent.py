@@ -0,0 +1,123 @@
+import os
+import re
+import time
+import zlib
+from collections import Counter
+from typing import NamedTuple
+
+import numpy as np
+
+from metrics import LatencyTracker
+from semantic_cache import normalize
+
+INTENT_MODEL_PATH = os.getenv(
+    "INTENT_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_model.npz")
+)
+# Below this probability a query is forwarded to Gemini rather than answered locally.
+INTENT_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", "0.8"))
+FEATURE_DIM = 2048
+
+WATER = "water_health"
+INTENTS = ("greeting", "thanks", "goodbye", "off_topic", WATER)
+
+TEMPLATES = {
+    "empty": "Please type your question about water quality or water-related health.",
+    "greeting": "Hello! I can help with drinking water quality, test results, treatment and waterborne diseases. What would you like to know?",
+    "thanks": "You're welcome! Ask any time you have a question about your water.",
+    "goodbye": "Goodbye, and stay safe. Remember to boil or chlorinate water when in doubt.",
+    "off_topic": "I can only help with water quality and water-related health questions, such as test results, treatment methods or waterborne diseases.",
+}
+
+# Any of these makes a query a water-health question whatever the model says.
+DOMAIN_KEYWORDS = frozenset((
+    "water", "drinking", "well", "borewell", "handpump", "tap", "pond", "river", "ph", "turbidity", "tds",
+    "coliform", "ecoli", "bacteria", "nitrate", "fluoride", "arsenic", "iron", "chlorine", "chlorinate",
+    "boil", "boiling", "filter", "filtration", "purify", "purifier", "ro", "cholera", "typhoid", "diarrhoea",
+    "diarrhea", "dysentery", "hepatitis", "jaundice", "fluorosis", "contamination", "contaminated", "sewage",
+    "sanitation", "hygiene", "dehydration", "ors", "hardness", "salinity", "bleaching",
+))
+_short_reply = {
+    "greeting": re.compile(r"^(hi+|hello+|hey+|namaste|namaskar|good (morning|afternoon|evening))( there)?$"),
+    "thanks": re.compile(r"^(thanks?( you)?( so much| a lot| very much)?|thank u|thx|ty|dhanyavad|shukriya)$"),
+    "goodbye": re.compile(r"^(bye+|goodbye|see you( later)?|good night|ok bye)$"),
+}
+
+
+def features(text):
+    # Hashed word unigrams and bigrams; crc32 keeps the buckets stable
+    # between the offline trainer and the service.
+    words = normalize(text).split()
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return np.fromiter((zlib.crc32(g.encode()) % FEATURE_DIM for g in grams), dtype=np.intp, count=len(grams))
+
+
+class Intent(NamedTuple):
+    name: str
+    confidence: float
+    # Canned answer, or None when the query should go to Gemini.
+    reply: str
+
+
+class IntentClassifier:
+    """Keyword rules in front of a linear model over hashed word n-grams.
+
+    The weights (``intents`` x ``FEATURE_DIM`` plus a bias per intent) come
+    from ``tools/train_intent.py``. Without a weights file only the keyword
+    rules run and everything else is forwarded.
+    """
+
+    def __init__(self, threshold=INTENT_THRESHOLD):
+        self.threshold = threshold
+        self.intents = INTENTS
+        self.weights = None
+        self.bias = None
+        self.counts = Counter()
+        self.latency = LatencyTracker()
+
+    def load(self, path=INTENT_MODEL_PATH):
+        if not os.path.exists(path):
+            return
+        with np.load(path) as data:
+            if data["weights"].shape[1] != FEATURE_DIM:
+                return
+            self.intents = tuple(str(name) for name in data["intents"])
+            # Columns per feature so that a query's features are one row gather.
+            self.weights = np.ascontiguousarray(data["weights"].T, dtype=np.float32)
+            self.bias = data["bias"].astype(np.float32)
+
+    def _classify(self, query):
+        text = normalize(query)
+        if not text:
+            return Intent("empty", 1.0, TEMPLATES["empty"])
+        for name, pattern in _short_reply.items():
+            if pattern.match(text):
+                return Intent(name, 1.0, TEMPLATES[name])
+        if DOMAIN_KEYWORDS.intersection(text.split()):
+            return Intent(WATER, 1.0, None)
+        if self.weights is None:
+            return Intent(WATER, 0.0, None)
+        scores = self.weights[features(text)].sum(axis=0) + self.bias
+        scores = np.exp(scores - scores.max())
+        probabilities = scores / scores.sum()
+        best = int(np.argmax(probabilities))
+        name, confidence = self.intents[best], float(probabilities[best])
+        if name == WATER or confidence < self.threshold:
+            return Intent(WATER, float(probabilities[self.intents.index(WATER)]), None)
+        return Intent(name, confidence, TEMPLATES[name])
+
+    def classify(self, query):
+        start = time.perf_counter()
+        intent = self._classify(query)
+        self.latency.observe(time.perf_counter() - start)
+        self.counts[intent.name] += 1
+        return intent
+
+    def stats(self):
+        return {
+            "model_loaded": self.weights is not None,
+            "counts": dict(self.counts),
+            "latency": self.latency.stats(),
+        }
+
+
+classifier = IntentClassifier()
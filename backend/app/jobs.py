@@ -0,0 +1,387 @@
+import asyncio
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from metrics import LatencyTracker
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.sqlite3")
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "4"))
+# Idle workers poll this often; jobs submitted to the same process wake them at once.
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "0.5"))
+# A job still running this long after it was claimed (its worker crashed or
+# restarted) is claimed again.
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "120"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+JOBS_TTL = float(os.getenv("JOBS_TTL", str(24 * 3600)))
+JOBS_WEBHOOK_TIMEOUT = float(os.getenv("JOBS_WEBHOOK_TIMEOUT", "10"))
+JOBS_WEBHOOK_RETRIES = int(os.getenv("JOBS_WEBHOOK_RETRIES", "3"))
+JOBS_WEBHOOK_SECRET = os.getenv("JOBS_WEBHOOK_SECRET", "")
+# Webhook posts can each block for JOBS_WEBHOOK_TIMEOUT, so they get threads of
+# their own instead of the default executor the job and store queries use
+JOBS_WEBHOOK_THREADS = int(os.getenv("JOBS_WEBHOOK_THREADS", "4"))
+# Webhooks only go to public addresses, except for these hosts (comma-separated),
+# such as a receiver on the private network
+JOBS_WEBHOOK_ALLOW_HOSTS = {host.strip().lower() for host in os.getenv("JOBS_WEBHOOK_ALLOW_HOSTS", "").split(",") if host.strip()}
+# Finished jobs are purged and stuck webhooks retried this often.
+MAINTAIN_EVERY = 60
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class WebhookRejected(ValueError):
+    pass
+
+
+_webhooks = ThreadPoolExecutor(max_workers=JOBS_WEBHOOK_THREADS, thread_name_prefix="webhook")
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+class JobQueue:
+    """Durable job queue in SQLite, shared by all workers on the host.
+
+    Workers claim the oldest available job under ``BEGIN IMMEDIATE`` and hold
+    a lease on it; jobs left running by a worker that died are claimed again
+    once the lease runs out, so queued and in-flight jobs survive restarts.
+    Webhooks are delivered at least once.
+    """
+
+    def __init__(self, path=JOBS_DB_PATH, lease=JOBS_LEASE_SECONDS, max_attempts=JOBS_MAX_ATTEMPTS, ttl=JOBS_TTL):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.ttl = ttl
+        self._local = threading.local()
+        self._tasks = []
+        self._deliveries = set()
+        self._wake = None
+        self._loop = None
+        # Time from submission to first pickup, and handler run time.
+        self.queue_latency = LatencyTracker()
+        self.run_time = LatencyTracker()
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.webhooks_delivered = 0
+        self.webhooks_failed = 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, idempotency_key TEXT UNIQUE, kind TEXT, payload TEXT, "
+                "callback_url TEXT, status TEXT, attempts INTEGER DEFAULT 0, result TEXT, error TEXT, "
+                "created REAL, available REAL, started REAL, finished REAL, lease_until REAL, "
+                "webhook TEXT, webhook_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available)")
+            self._local.conn = conn
+        return conn
+
+    def submit(self, kind, payload, callback_url=None, idempotency_key=None):
+        """Queue a job; a repeated ``idempotency_key`` returns the existing job instead."""
+        conn = self._connection()
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        conn.execute(
+            "INSERT OR IGNORE INTO jobs (id, idempotency_key, kind, payload, callback_url, status, created, available) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, idempotency_key, kind, json.dumps(payload), callback_url, QUEUED, now, now),
+        )
+        if idempotency_key is not None:
+            job_id = conn.execute("SELECT id FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone()[0]
+        if self._wake is not None:
+            # Called from executor threads: asyncio.Event is not thread-safe
+            self._loop.call_soon_threadsafe(self._wake.set)
+        return self.get(job_id)
+
+    def claim(self):
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # A job whose worker died on its last attempt is not run again;
+            # the maintenance pass sends its webhook
+            abandoned = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished = ?, "
+                "webhook = CASE WHEN callback_url IS NULL THEN NULL ELSE 'pending' END, webhook_at = 0 "
+                "WHERE status = ? AND lease_until <= ? AND attempts >= ?",
+                (FAILED, f"Worker lost on attempt {self.max_attempts} of {self.max_attempts}", now,
+                 RUNNING, now, self.max_attempts),
+            ).rowcount
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = ? AND available <= ?) OR (status = ? AND lease_until <= ?) "
+                "ORDER BY available LIMIT 1",
+                (QUEUED, now, RUNNING, now),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, started = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                    (RUNNING, now, now + self.lease, row["id"]),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.failed += abandoned
+        if row is not None and row["attempts"] == 0:
+            self.queue_latency.observe(now - row["created"])
+        return row
+
+    def complete(self, job_id, result):
+        now = time.time()
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, finished = ?, "
+            "webhook = CASE WHEN callback_url IS NULL THEN NULL ELSE 'pending' END, webhook_at = ? WHERE id = ?",
+            (DONE, json.dumps(result), now, now, job_id),
+        )
+        self.completed += 1
+
+    def fail(self, job_id, error):
+        now = time.time()
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, error = ?, finished = ?, "
+            "webhook = CASE WHEN callback_url IS NULL THEN NULL ELSE 'pending' END, webhook_at = ? WHERE id = ?",
+            (FAILED, error, now, now, job_id),
+        )
+        self.failed += 1
+
+    def retry(self, job_id, delay, error, count=True):
+        # Shed load (count=False) does not use up one of the job's attempts.
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, available = ?, error = ?, attempts = attempts - ? WHERE id = ?",
+            (QUEUED, time.time() + delay, error, 0 if count else 1, job_id),
+        )
+        self.retried += 1
+
+    def _row(self, job_id):
+        return self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def get(self, job_id):
+        row = self._row(job_id)
+        return None if row is None else self.view(row)
+
+    @staticmethod
+    def view(row):
+        job = {
+            "job_id": row["id"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "created": _iso(row["created"]),
+            "started": _iso(row["started"]),
+            "finished": _iso(row["finished"]),
+        }
+        if row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+        if row["error"] is not None:
+            job["error"] = row["error"]
+        if row["callback_url"] is not None:
+            job["webhook"] = row["webhook"] or "waiting"
+        return job
+
+    def set_webhook(self, job_id, state):
+        self._connection().execute("UPDATE jobs SET webhook = ? WHERE id = ?", (state, job_id))
+
+    def stale_webhooks(self):
+        # Webhooks still pending a lease after the job finished were lost with
+        # their worker; claim them by bumping webhook_at.
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE webhook = 'pending' AND webhook_at <= ?", (now - self.lease,)
+            )]
+            conn.executemany("UPDATE jobs SET webhook_at = ? WHERE id = ?", [(now, job_id) for job_id in ids])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return ids
+
+    def purge(self):
+        return self._connection().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished <= ? AND COALESCE(webhook, '') != 'pending'",
+            (DONE, FAILED, time.time() - self.ttl),
+        ).rowcount
+
+    # Worker side
+
+    def start(self, handlers, workers=JOBS_WORKERS):
+        """Run ``workers`` tasks that feed jobs to ``handlers`` ({kind: async fn(payload) -> result})."""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work(handlers)) for _ in range(workers)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+
+    async def stop(self):
+        for task in self._tasks + list(self._deliveries):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._deliveries, return_exceptions=True)
+        self._tasks = []
+        self._wake = None
+
+    async def _work(self, handlers):
+        while True:
+            job = await asyncio.to_thread(self.claim)
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), JOBS_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job, handlers)
+
+    async def _run(self, job, handlers):
+        job_id = job["id"]
+        attempts = job["attempts"] + 1
+        try:
+            with self.run_time.time():
+                result = await handlers[job["kind"]](json.loads(job["payload"]))
+        except asyncio.CancelledError:
+            # Shutting down: leave the job running; its lease expires and another worker picks it up.
+            raise
+        except Exception as e:
+            retry_after = getattr(e, "retry_after", None)
+            if retry_after is not None:
+                await asyncio.to_thread(self.retry, job_id, retry_after, str(e), False)
+            elif attempts < self.max_attempts:
+                await asyncio.to_thread(self.retry, job_id, min(60, 2 ** attempts), str(e))
+            else:
+                await asyncio.to_thread(self.fail, job_id, str(e))
+                self._notify(job_id)
+            return
+        await asyncio.to_thread(self.complete, job_id, result)
+        self._notify(job_id)
+
+    def _notify(self, job_id):
+        task = asyncio.create_task(self._deliver(job_id))
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, job_id):
+        row = await asyncio.to_thread(self._row, job_id)
+        if row is None or row["callback_url"] is None:
+            return
+        job = self.view(row)
+        del job["webhook"]
+        body = json.dumps(job).encode()
+        for attempt in range(JOBS_WEBHOOK_RETRIES + 1):
+            try:
+                await asyncio.get_running_loop().run_in_executor(_webhooks, _post, row["callback_url"], body)
+            except WebhookRejected:
+                # Retrying would not change the answer
+                break
+            except Exception:
+                if attempt < JOBS_WEBHOOK_RETRIES:
+                    await asyncio.sleep(2 ** attempt)
+                continue
+            await asyncio.to_thread(self.set_webhook, job_id, "delivered")
+            self.webhooks_delivered += 1
+            return
+        await asyncio.to_thread(self.set_webhook, job_id, "failed")
+        self.webhooks_failed += 1
+
+    async def _maintain(self):
+        while True:
+            for job_id in await asyncio.to_thread(self.stale_webhooks):
+                self._notify(job_id)
+            await asyncio.to_thread(self.purge)
+            await asyncio.sleep(MAINTAIN_EVERY)
+
+    def stats(self):
+        conn = self._connection()
+        now = time.time()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        oldest = conn.execute("SELECT MIN(created) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+        finished = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?) AND finished > ?", (DONE, FAILED, now - 60)
+        ).fetchone()[0]
+        return {
+            **{status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)},
+            "oldest_queued_age_s": round(now - oldest, 3) if oldest else None,
+            "finished_last_minute": finished,
+            "queue_latency": self.queue_latency.stats(),
+            "run_time": self.run_time.stats(),
+            "completed": self.completed,
+            "failed_total": self.failed,
+            "retried": self.retried,
+            "webhooks_delivered": self.webhooks_delivered,
+            "webhooks_failed": self.webhooks_failed,
+        }
+
+
+def _public_address(address, timeout, source_address=None, *args):
+    """``socket.create_connection`` that refuses hosts resolving to loopback, private or other non-public addresses."""
+    host, port = address
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    for *_, sockaddr in infos:
+        ip = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise WebhookRejected(f"Webhook host {host} resolves to non-public address {ip}")
+    # Connect to the addresses just checked, not to a second lookup's
+    error = None
+    for family, type_, proto, _, sockaddr in infos:
+        sock = socket.socket(family, type_, proto)
+        try:
+            sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as e:
+            sock.close()
+            error = e
+    raise error or OSError(f"No addresses for {host}")
+
+
+def _post(url, body):
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise WebhookRejected(f"Webhook URL {url!r} is not http(s)")
+    headers = {"Content-Type": "application/json"}
+    if JOBS_WEBHOOK_SECRET:
+        signature = hmac.new(JOBS_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        headers["X-AarogyaJal-Signature"] = f"sha256={signature}"
+    connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    # IPv6 literals keep their brackets, or http.client reads a port into them
+    host = f"[{parts.hostname}]" if ":" in parts.hostname else parts.hostname
+    conn = connection_class(host, parts.port, timeout=JOBS_WEBHOOK_TIMEOUT)
+    if parts.hostname.lower() not in JOBS_WEBHOOK_ALLOW_HOSTS:
+        conn._create_connection = _public_address
+    # Redirects are not followed, so they cannot lead anywhere unchecked
+    try:
+        path = parts.path or "/"
+        conn.request("POST", f"{path}?{parts.query}" if parts.query else path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+    finally:
+        conn.close()
+    if response.status >= 300:
+        raise OSError(f"Webhook returned HTTP {response.status}")
+    return response.status
+
+
+queue = JobQueue()
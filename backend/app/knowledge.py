@@ -0,0 +1,156 @@
+import json
+import os
+import re
+
+import numpy as np
+
+from metrics import LatencyTracker
+from quota import estimate_tokens
+from semantic_cache import normalize
+
+KNOWLEDGE_INDEX_PATH = os.getenv(
+    "KNOWLEDGE_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_index")
+)
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "3"))
+# Passages scoring below this are not worth their tokens.
+RAG_MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", "2.0"))
+# Bounds on the work per query: terms looked up, and how common a term may be
+# (share of passages) before it is skipped as carrying no signal.
+RAG_MAX_QUERY_TERMS = int(os.getenv("RAG_MAX_QUERY_TERMS", "32"))
+RAG_MAX_DF = float(os.getenv("RAG_MAX_DF", "0.5"))
+RAG_SNIPPET_CHARS = int(os.getenv("RAG_SNIPPET_CHARS", "600"))
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in is it its me my of on or our "
+    "should so than that the their them then there these they this to was we what when where which who "
+    "why will with you your mg per".split()
+)
+_stem = re.compile(r"(ies|es|s)$")
+
+
+def tokenize(text):
+    # Shared with tools/build_knowledge_index.py so query and index terms agree.
+    terms = []
+    for word in normalize(text).split():
+        # Readings and units ("2.1 mg/L") would match every limit passage.
+        if len(word) < 2 or word in STOPWORDS or word.isdigit():
+            continue
+        if len(word) > 4:
+            word = _stem.sub("", word)
+        terms.append(word)
+    return terms
+
+
+class KnowledgeIndex:
+    """BM25 index over the curated guidance in ``backend/knowledge``.
+
+    Built offline by ``tools/build_knowledge_index.py``. Postings are stored
+    in CSR form with each entry's BM25 weight precomputed, so a query is a
+    few array slices and one ``np.add.at``. The arrays and passage text are
+    memory-mapped, so every worker shares one copy in the page cache.
+    """
+
+    def __init__(self):
+        self.vocab = {}
+        self.loaded = False
+        self.latency = LatencyTracker()
+        self.queries = 0
+        self.hits = 0
+
+    def load(self, path=KNOWLEDGE_INDEX_PATH):
+        if not os.path.exists(os.path.join(path, "vocab.json")):
+            return
+        with open(os.path.join(path, "vocab.json")) as f:
+            self.vocab = json.load(f)
+        mapped = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in ("postings_ptr", "postings_doc", "postings_weight", "text_offsets", "titles")
+        }
+        self.ptr = mapped["postings_ptr"]
+        self.docs = mapped["postings_doc"]
+        self.weights = mapped["postings_weight"]
+        self.offsets = mapped["text_offsets"]
+        self.title_ids = mapped["titles"]
+        self.text = np.memmap(os.path.join(path, "passages.bin"), dtype=np.uint8, mode="r")
+        with open(os.path.join(path, "sources.json")) as f:
+            self.sources = json.load(f)
+        self.count = len(self.offsets) - 1
+        self.loaded = True
+
+    def passage(self, doc):
+        return bytes(self.text[self.offsets[doc]:self.offsets[doc + 1]]).decode()
+
+    def search(self, query, k=RAG_TOP_K, min_score=RAG_MIN_SCORE):
+        """Return up to ``k`` (score, source, passage) tuples, best first."""
+        if not self.loaded or k <= 0:
+            return []
+        with self.latency.time():
+            self.queries += 1
+            scores = np.zeros(self.count, dtype=np.float32)
+            max_df = max(1, int(self.count * RAG_MAX_DF))
+            for term in list(dict.fromkeys(tokenize(query)))[:RAG_MAX_QUERY_TERMS]:
+                term_id = self.vocab.get(term)
+                if term_id is None:
+                    continue
+                start, end = self.ptr[term_id], self.ptr[term_id + 1]
+                if end - start > max_df:
+                    continue
+                np.add.at(scores, self.docs[start:end], self.weights[start:end])
+            top = np.argpartition(scores, -k)[-k:] if self.count > k else np.arange(self.count)
+            top = top[np.argsort(scores[top])[::-1]]
+            results = [
+                (float(scores[doc]), self.sources[self.title_ids[doc]], self.passage(doc))
+                for doc in top
+                if scores[doc] >= min_score
+            ]
+            if results:
+                self.hits += 1
+            return results
+
+    def stats(self):
+        return {
+            "loaded": self.loaded,
+            "passages": self.count if self.loaded else 0,
+            "queries": self.queries,
+            "queries_with_hits": self.hits,
+            "latency": self.latency.stats(),
+        }
+
+
+def passages_for(queries, k=RAG_TOP_K):
+    """Top passages for ``queries``: ``k`` for a single query, else the best one per query, ``k`` in all."""
+    per_query = k if len(queries) == 1 else 1
+    passages = []
+    for query in queries:
+        for _, _, text in index.search(query, per_query):
+            text = text[:RAG_SNIPPET_CHARS]
+            if text not in passages:
+                passages.append(text)
+    return passages[:k]
+
+
+class PromptTokens:
+    """Estimated prompt tokens with retrieved context against the generic one."""
+
+    def __init__(self):
+        self.prompts = 0
+        self.baseline = 0
+        self.actual = 0
+
+    def record(self, prompt, context, generic_context):
+        self.prompts += 1
+        self.actual += estimate_tokens(prompt)
+        self.baseline += estimate_tokens(prompt) - estimate_tokens(context) + estimate_tokens(generic_context)
+
+    def stats(self):
+        return {
+            "prompts": self.prompts,
+            "baseline_tokens": self.baseline,
+            "prompt_tokens": self.actual,
+            "mean_baseline": round(self.baseline / self.prompts, 1) if self.prompts else None,
+            "mean_prompt": round(self.actual / self.prompts, 1) if self.prompts else None,
+        }
+
+
+index = KnowledgeIndex()
+prompt_tokens = PromptTokens()
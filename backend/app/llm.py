@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import hedging
+from admission import controller as admission
+from breaker import CircuitBreaker
+from metrics import LatencyTracker
+from quota import QUOTA_OUTPUT_TOKENS, estimate_tokens
+from quota import scheduler as quota
+from routing import usage
+from singleflight import SingleFlight
+from store import results
+
+# Backend calls (the Gemini SDK included) are blocking, so they run on a
+# bounded thread pool instead of the event loop. The admission controller
+# caps how many calls a single worker has in flight (LLM_CONCURRENCY /
+# ADMISSION_SLOTS); extra requests queue by priority without holding a thread.
+# A call its caller gave up on (timed out or lost a hedge) keeps its thread
+# until the backend's own timeout ends it, so the pool is larger than the
+# slots: otherwise admitted calls would queue unseen behind abandoned ones.
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", str(2 * admission.slots)))
+LLM_WARMUP = os.getenv("LLM_WARMUP", "1") == "1"
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix="llm")
+# Model tier name -> backend; the first registered is the default.
+_backends = {}
+flights = SingleFlight()
+breaker = CircuitBreaker("gemini")
+retry_budget = hedging.RetryBudget()
+hedge_stats = hedging.HedgeStats()
+# Successful upstream call durations; the hedge delay is a percentile of these.
+upstream_latency = LatencyTracker()
+
+
+def init_backend(backend, tier="default"):
+    _backends[tier] = backend
+    return backend
+
+
+def get_backend(tier=None):
+    if not _backends:
+        raise RuntimeError("LLM backend is not initialised")
+    return _backends.get(tier) or next(iter(_backends.values()))
+
+
+def default_tier(tier=None):
+    return tier if tier in _backends else next(iter(_backends), None)
+
+
+async def run_blocking(fn, *args):
+    loop = asyncio.get_running_loop()
+    async with admission.slot():
+        return await loop.run_in_executor(_executor, fn, *args)
+
+
+async def warm_up():
+    if not LLM_WARMUP:
+        return
+    for tier, backend in _backends.items():
+        try:
+            await run_blocking(backend.warm_up)
+        except Exception as e:
+            # A failed warm-up only costs the first request a cold connection.
+            logger.warning("LLM warm-up failed for %s: %s", tier, e)
+
+
+async def _acquire_quota(prompt, deadline, max_output_tokens=None):
+    """Wait for the host-wide Gemini quota; returns the tokens reserved."""
+    reserved = estimate_tokens(prompt) + min(QUOTA_OUTPUT_TOKENS, max_output_tokens or QUOTA_OUTPUT_TOKENS)
+    if not quota.enabled:
+        return reserved
+    loop = asyncio.get_running_loop()
+    while True:
+        # SQLite work goes to the default executor, not the Gemini threads.
+        wait = await asyncio.to_thread(quota.try_take, {"requests": 1, "tokens": reserved})
+        if wait == 0:
+            quota.granted += 1
+            return reserved
+        if deadline is not None and loop.time() + wait >= deadline:
+            raise asyncio.TimeoutError()
+        quota.waited += wait
+        await asyncio.sleep(wait)
+
+
+async def _settle_quota(prompt, reserved, text):
+    if quota.enabled:
+        await asyncio.to_thread(quota.settle, reserved, estimate_tokens(prompt) + estimate_tokens(text))
+
+
+async def _refund_quota(reserved):
+    # Tokens reserved for a call that never went out; its request stays spent.
+    if quota.enabled:
+        await asyncio.to_thread(quota.settle, reserved, 0)
+
+
+async def _attempt(prompt, deadline, max_output_tokens, tier):
+    backend = get_backend(tier)
+    loop = asyncio.get_running_loop()
+    # Quota before the slot: waiting for quota while holding a slot would keep
+    # the requests queued behind it waiting, whatever their priority.
+    reserved = await _acquire_quota(prompt, deadline, max_output_tokens)
+    sent = False
+    try:
+        async with admission.slot():
+            # The breaker covers the upstream call only, not the time spent
+            # waiting for a free slot or for quota.
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                raise asyncio.TimeoutError()
+            start = loop.time()
+            sent = True
+            try:
+                text = await breaker.call(
+                    lambda: loop.run_in_executor(_executor, backend.generate, prompt, max_output_tokens, remaining),
+                    remaining,
+                )
+            except Exception:
+                usage[tier].errors += 1
+                raise
+            upstream_latency.observe(loop.time() - start)
+            usage[tier].record(loop.time() - start, prompt, text)
+    except BaseException:
+        if not sent:
+            await _refund_quota(reserved)
+        raise
+    await _settle_quota(prompt, reserved, text)
+    return text
+
+
+async def _generate(prompt, timeout, max_output_tokens, tier):
+    deadline = None if timeout is None else asyncio.get_running_loop().time() + timeout
+
+    def attempt():
+        return _attempt(prompt, deadline, max_output_tokens, tier)
+
+    def call():
+        if not hedging.LLM_HEDGE:
+            return attempt()
+        return hedging.hedged(attempt, hedging.hedge_delay(upstream_latency), retry_budget, hedge_stats)
+
+    return await hedging.with_retries(call, deadline, retry_budget, hedge_stats)
+
+
+async def generate(prompt, timeout=None, max_output_tokens=None, tier=None, valid=None):
+    """Generate text for ``prompt`` on the model ``tier``, at most ``max_output_tokens`` long if given.
+
+    Transient errors are retried, and slow calls hedged when enabled,
+    within ``timeout`` seconds overall. Raises ``CircuitOpenError`` while the
+    breaker is open and ``asyncio.TimeoutError`` when the deadline passes.
+    A completion that ``valid`` rejects is returned but not stored, so the
+    next identical request asks again instead of reusing it.
+    """
+    tier = default_tier(tier)
+    model_name = get_backend(tier).model_name
+    if max_output_tokens:
+        # A capped completion is not interchangeable with an uncapped one.
+        model_name = f"{model_name}:max{max_output_tokens}"
+    text = await _stored(model_name, prompt)
+    if text is not None and (valid is None or valid(text)):
+        return text
+    # Identical prompts already in flight share one upstream call.
+    return await flights.do(
+        (model_name, prompt),
+        lambda: _generate_and_store(model_name, prompt, timeout, max_output_tokens, tier, valid),
+    )
+
+
+async def _generate_and_store(model_name, prompt, timeout, max_output_tokens, tier, valid=None):
+    text = await _generate(prompt, timeout, max_output_tokens, tier)
+    if valid is None or valid(text):
+        await asyncio.to_thread(results.put, results.key(model_name, prompt), model_name, text)
+    return text
+
+
+async def _stored(model_name, prompt):
+    # Results persisted by any worker, front cache first so hot keys skip disk.
+    key = results.key(model_name, prompt)
+    text = results.get_cached(key)
+    if text is None:
+        text = await asyncio.to_thread(results.get, key)
+    return text
+
+
+class OpenStream:
+    """Chunks of a streamed generation that has already been admitted.
+
+    Iterate it for the text; ``aclose`` must be called once the response is
+    over, even if it was never iterated, to give back the slot.
+    """
+
+    def __init__(self, chunks, release=None):
+        self.chunks = chunks
+        self._release = release
+
+    def __aiter__(self):
+        return self.chunks
+
+    async def aclose(self):
+        await self.chunks.aclose()
+        if self._release is not None:
+            release, self._release = self._release, None
+            await release()
+
+
+async def _stored_chunks(text):
+    yield text
+
+
+async def open_stream(prompt, tier=None, timeout=None):
+    """Admit a streamed generation on the model ``tier`` and return it as an ``OpenStream``.
+
+    The host quota (within ``timeout`` seconds), the admission slot and the
+    breaker are all checked here, before the endpoint sends any headers, so
+    it can answer 503/504 instead of a 200 stream that fails at once. Raises
+    ``Overloaded``, ``CircuitOpenError`` or ``asyncio.TimeoutError``.
+    """
+    tier = default_tier(tier)
+    backend = get_backend(tier)
+    model_name = backend.model_name
+    text = await _stored(model_name, prompt)
+    if text is not None:
+        return OpenStream(_stored_chunks(text))
+
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    # Quota before the slot, as in _attempt
+    reserved = await _acquire_quota(prompt, deadline)
+    slot = admission.slot()
+    try:
+        await slot.__aenter__()
+    except BaseException:
+        await _refund_quota(reserved)
+        raise
+    state = {"reserved": reserved, "started": False, "settled": False}
+
+    async def release():
+        # Also reached when the client disconnects before the first chunk.
+        if not state["started"]:
+            breaker.probe_in_flight = False
+        try:
+            if not state["settled"]:
+                await _settle_quota(prompt, state["reserved"], "")
+        finally:
+            await slot.__aexit__(None, None, None)
+
+    try:
+        breaker.before_call()
+    except BaseException:
+        await release()
+        raise
+    return OpenStream(_stream(backend, tier, model_name, prompt, state), release)
+
+
+async def _stream(backend, tier, model_name, prompt, state):
+    state["started"] = True
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        # Runs on the executor; hands chunks back to the event loop.
+        try:
+            for chunk in backend.stream(prompt):
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    parts = []
+    start = loop.time()
+    producer = loop.run_in_executor(_executor, produce)
+    try:
+        while (item := await queue.get()) is not done:
+            if isinstance(item, Exception):
+                breaker.record(False)
+                usage[tier].errors += 1
+                raise item
+            parts.append(item)
+            yield item
+        breaker.record(True, loop.time() - start)
+        usage[tier].record(loop.time() - start, prompt, "".join(parts))
+    finally:
+        breaker.probe_in_flight = False
+        # Also reached when the client disconnects mid-stream.
+        stop.set()
+        await producer
+    text = "".join(parts)
+    state["settled"] = True
+    await _settle_quota(prompt, state["reserved"], text)
+    await asyncio.to_thread(results.put, results.key(model_name, prompt), model_name, text)
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
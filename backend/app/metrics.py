@@ -0,0 +1,75 @@
+import time
+from collections import deque
+
+import numpy as np
+
+
+class LatencyTracker:
+    """Keeps the most recent samples (seconds) and reports percentiles in ms."""
+
+    def __init__(self, window=2048):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def percentile(self, q):
+        if not self.samples:
+            return None
+        return float(np.percentile(self.samples, q))
+
+    def stats(self):
+        if not self.samples:
+            return {"count": self.count}
+        p50, p95, p99 = np.percentile(self.samples, [50, 95, 99]) * 1e3
+        return {
+            "count": self.count,
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+        }
+
+
+class _Timer:
+    def __init__(self, tracker):
+        self.tracker = tracker
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracker.observe(time.perf_counter() - self.start)
+
+
+class Histogram:
+    """Counts of durations (seconds) per bucket, each above the previous bound and up to its own, in ms."""
+
+    def __init__(self, buckets_ms=(1, 5, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)):
+        self.bounds = [b / 1e3 for b in buckets_ms]
+        self.labels = [f"le_{b}ms" for b in buckets_ms] + ["le_inf"]
+        self.counts = [0] * (len(buckets_ms) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.bounds):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += seconds
+        self.count += 1
+
+    def stats(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1e3, 3) if self.count else None,
+            "buckets": dict(zip(self.labels, self.counts)),
+        }
@@ -0,0 +1,344 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+import numpy as np
+
+import trees
+from metrics import LatencyTracker
+from rules import canonical_name
+
+logger = logging.getLogger(__name__)
+
+# ensemble_model.pkl, preprocessing.pkl and model_config.json (see the project README)
+RISK_MODEL_PATH = os.getenv(
+    "RISK_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "ml-models")
+)
+# Readings per model call, and how long the first reading in a batch may wait
+# for others to join it
+PREDICT_MAX_BATCH = int(os.getenv("PREDICT_MAX_BATCH", "256"))
+PREDICT_MAX_WAIT_MS = float(os.getenv("PREDICT_MAX_WAIT_MS", "2"))
+# Readings waiting for the model before /predict sheds load
+PREDICT_MAX_QUEUE = int(os.getenv("PREDICT_MAX_QUEUE", "8192"))
+PREDICT_MAX_READINGS = int(os.getenv("PREDICT_MAX_READINGS", "1000"))
+# Evaluate exported tree members (tools/export_trees.py) from their flat arrays
+RISK_FLAT_TREES = os.getenv("RISK_FLAT_TREES", "1") != "0"
+
+RISK_CLASSES = ("low", "medium", "high", "critical")
+# Model inputs when model_config.json does not list them: the sensor readings
+DEFAULT_FEATURES = ("ph", "temperature", "turbidity", "dissolved_oxygen", "rainfall")
+
+
+class ModelUnavailable(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+class RiskModel:
+    """The risk ensemble, loaded once per worker.
+
+    ``ensemble_model.pkl`` is any classifier with ``predict_proba`` (for
+    example a soft-voting ensemble) and ``preprocessing.pkl`` an optional
+    transformer applied first. ``model_config.json`` may name the input
+    ``features`` and the risk ``classes`` in the order of the model's
+    probability columns (see ``model_classes``). Arrays in the pickles (if saved uncompressed) and
+    the exported trees are memory-mapped read-only, so workers share their
+    pages.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.error = "Risk model not loaded"
+        self.path = None
+        self.version = None
+        self.features = DEFAULT_FEATURES
+        self.classes = RISK_CLASSES
+        self.preprocessing = None
+        self.ensemble = None
+        self.members = []
+        self.weights = None
+        self.flat = {}
+        self.load_seconds = None
+        self.loaded_at = None
+        self.requests = 0
+        self.readings = 0
+
+    def load(self, path=RISK_MODEL_PATH, version=None):
+        self.path = path
+        self.version = version
+        model_path = os.path.join(path, "ensemble_model.pkl")
+        if not os.path.exists(model_path):
+            self.error = f"No risk model at {model_path}"
+            return False
+        start = time.perf_counter()
+        try:
+            # scikit-learn and xgboost are only needed to serve /predict
+            import joblib
+
+            config = {}
+            config_path = os.path.join(path, "model_config.json")
+            if os.path.exists(config_path):
+                with open(config_path) as f:
+                    config = json.load(f)
+            preprocessing_path = os.path.join(path, "preprocessing.pkl")
+            preprocessing = joblib.load(preprocessing_path, mmap_mode="r") if os.path.exists(preprocessing_path) else None
+            ensemble = joblib.load(model_path, mmap_mode="r")
+            flat = load_flat_trees(path, model_path) if RISK_FLAT_TREES else {}
+        except Exception as e:
+            logger.warning("Could not load the risk model from %s: %s", path, e)
+            self.error = f"Could not load the risk model: {e}"
+            return False
+        self.features = tuple(canonical_name(name) for name in config.get("features", DEFAULT_FEATURES))
+        self.classes = model_classes(config, ensemble)
+        self.preprocessing = preprocessing
+        self.members, self.weights = trees.members(ensemble)
+        self.flat = flat
+        # Exported members replace the pickled ones, whose trees would
+        # otherwise stay in this worker's private memory. A member that is
+        # only faster up to some batch size keeps its pickled trees for
+        # larger batches
+        self.members = [(name, serving_member(flat.get(name), member)) for name, member in self.members]
+        self.ensemble = None if flat else ensemble
+        try:
+            columns = probability_columns(self, ensemble)
+            if columns != len(self.classes):
+                raise ValueError(
+                    f"it has {columns} probability columns but {len(self.classes)} classes ({', '.join(self.classes)})"
+                )
+        except Exception as e:
+            logger.warning("Could not load the risk model from %s: %s", path, e)
+            self.error = f"Could not load the risk model: {e}"
+            return False
+        self.load_seconds = time.perf_counter() - start
+        self.loaded_at = time.time()
+        self.loaded = True
+        self.error = None
+        return True
+
+    def rows(self, readings):
+        """Readings (dicts of parameter values) to a feature matrix; raises ValueError naming missing inputs."""
+        matrix = np.empty((len(readings), len(self.features)))
+        for i, reading in enumerate(readings):
+            values = {canonical_name(name): value for name, value in reading.items()}
+            missing = [name for name in self.features if name not in values]
+            if missing:
+                raise ValueError(f"Reading {i} is missing {', '.join(missing)}")
+            try:
+                matrix[i] = [values[name] for name in self.features]
+            except (TypeError, ValueError):
+                raise ValueError(f"Reading {i} has a value that is not a number")
+        return matrix
+
+    def predict_proba(self, matrix):
+        if self.preprocessing is not None:
+            matrix = self.preprocessing.transform(matrix)
+        if self.ensemble is not None:
+            return self.ensemble.predict_proba(matrix)
+        # The ensemble's own averaging, with exported members read from their
+        # flat arrays; the results are bit-identical
+        probas = np.asarray([member.predict_proba(matrix) for _, member in self.members])
+        if len(probas) == 1:
+            return probas[0]
+        return np.average(probas, axis=0, weights=self.weights)
+
+    def record(self, readings):
+        self.requests += 1
+        self.readings += readings
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "loaded": self.loaded,
+            "error": self.error,
+            "features": list(self.features),
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "loaded_at": datetime.fromtimestamp(self.loaded_at).isoformat() if self.loaded_at else None,
+            "requests": self.requests,
+            "readings": self.readings,
+            "flat_trees": {name: flat.stats() for name, flat in self.flat.items()},
+        }
+
+
+def model_classes(config, ensemble):
+    """Risk class names in the order of the model's probability columns.
+
+    From ``model_config.json``, else the model's own ``classes_`` when they
+    are names; label-encoded models (integer classes) use RISK_CLASSES.
+    """
+    names = config.get("classes")
+    if names is None:
+        labels = getattr(ensemble, "classes_", None)
+        if labels is not None and not np.issubdtype(np.asarray(labels).dtype, np.number):
+            names = labels
+    return tuple(str(name).lower() for name in (RISK_CLASSES if names is None else names))
+
+
+def probability_columns(model, ensemble):
+    """How many probabilities ``model`` returns per reading."""
+    labels = getattr(ensemble, "classes_", None)
+    if labels is not None:
+        return len(labels)
+    return model.predict_proba(np.zeros((1, len(model.features)))).shape[1]
+
+
+def model_digest(model_path):
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def serving_member(flat, member):
+    """What /predict calls for ``member``: its flat arrays, if exported, handing large batches back if they must."""
+    if flat is None:
+        return member
+    if flat.max_rows is None:
+        return flat
+    return trees.Fallback(flat, member)
+
+
+def load_flat_trees(path, model_path):
+    """Exported tree members under ``path``/trees, if they were exported from this ensemble_model.pkl."""
+    manifest_path = os.path.join(path, "trees", "manifest.json")
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("model_sha256") != model_digest(model_path):
+        logger.warning("Ignoring exported trees in %s: they were made from another ensemble_model.pkl", path)
+        return {}
+    return {name: trees.TreeEnsemble.load(os.path.join(path, "trees", name)) for name in manifest["members"]}
+
+
+class MicroBatcher:
+    """Runs concurrent /predict requests through the model together.
+
+    The first request waiting opens a batch; others join until it holds
+    ``max_batch`` readings or ``max_wait`` seconds have passed. The batch then
+    runs in a thread while the next one fills, so batches grow with load and
+    a lone request waits at most ``max_wait``. Requests for different
+    models (``submit``'s ``predict``), such as the versions either side of a
+    model swap, never share a batch.
+    """
+
+    def __init__(self, predict=None, max_batch=PREDICT_MAX_BATCH, max_wait=PREDICT_MAX_WAIT_MS / 1e3,
+                 max_queue=PREDICT_MAX_QUEUE):
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.pending = deque()
+        self.queued = 0
+        self.arrived = None
+        self.task = None
+        self.batches = 0
+        self.rows = 0
+        self.shed = 0
+        self.sizes = Counter()
+        self.wait = LatencyTracker()
+        self.inference = LatencyTracker()
+
+    def start(self):
+        self.arrived = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        for _, _, future, _ in self.pending:
+            if not future.done():
+                future.set_exception(ModelUnavailable("Shutting down"))
+        self.pending.clear()
+        self.queued = 0
+
+    async def submit(self, matrix, predict=None):
+        """Probabilities for each row of ``matrix`` from ``predict`` (default the batcher's), computed in a shared batch."""
+        if self.queued + len(matrix) > self.max_queue:
+            self.shed += 1
+            raise QueueFull(f"More than {self.max_queue} readings waiting for the risk model")
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((matrix, predict or self.predict, future, time.perf_counter()))
+        self.queued += len(matrix)
+        self.arrived.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            if not self.pending:
+                self.arrived.clear()
+                await self.arrived.wait()
+            # The wait counts from the oldest request, so one that queued
+            # behind the previous batch does not wait twice
+            deadline = self.pending[0][3] + self.max_wait
+            while self.queued < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.arrived.clear()
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            batch, size = [], 0
+            predict = self.pending[0][1]
+            # Whole requests only; one larger than max_batch runs on its own
+            while self.pending and self.pending[0][1] == predict and (
+                not batch or size + len(self.pending[0][0]) <= self.max_batch
+            ):
+                item = self.pending.popleft()
+                batch.append(item)
+                size += len(item[0])
+            self.queued -= size
+            await self._predict(predict, batch, size)
+
+    async def _predict(self, predict, batch, size):
+        start = time.perf_counter()
+        for *_, submitted in batch:
+            self.wait.observe(start - submitted)
+        try:
+            matrix = np.concatenate([item[0] for item in batch]) if len(batch) > 1 else batch[0][0]
+            probabilities = await asyncio.to_thread(predict, matrix)
+        except Exception as e:
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.inference.observe(time.perf_counter() - start)
+        self.batches += 1
+        self.rows += size
+        self.sizes[1 << (size - 1).bit_length()] += 1
+        offset = 0
+        for matrix, _, future, _ in batch:
+            if not future.done():
+                future.set_result(probabilities[offset:offset + len(matrix)])
+            offset += len(matrix)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "readings": self.rows,
+            "mean_batch": round(self.rows / self.batches, 2) if self.batches else None,
+            # Batches by size, rounded up to a power of two
+            "batch_sizes": {f"le_{size}": count for size, count in sorted(self.sizes.items())},
+            "queued": self.queued,
+            "shed": self.shed,
+            "queue_wait": self.wait.stats(),
+            "inference": self.inference.stats(),
+        }
+
+
+batcher = MicroBatcher()
@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Limits shared by every worker on the host; 0 disables that limit.
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "0"))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "0"))
+# Bucket capacity in seconds of quota: small values smooth bursts, large
+# values let idle time be spent in one go.
+QUOTA_BURST_SECONDS = float(os.getenv("QUOTA_BURST_SECONDS", "5"))
+QUOTA_DB_PATH = os.getenv("QUOTA_DB_PATH", os.path.join(tempfile.gettempdir(), "aarogyajal_quota.sqlite3"))
+# Completion tokens reserved per call before the real size is known.
+QUOTA_OUTPUT_TOKENS = int(os.getenv("QUOTA_OUTPUT_TOKENS", "512"))
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text.
+    return max(1, len(text) // 4)
+
+
+class QuotaScheduler:
+    """Token buckets for requests and tokens per minute, shared through SQLite.
+
+    Each worker process opens the same database file; ``BEGIN IMMEDIATE``
+    serialises the read-refill-take step, so the limits hold across all
+    uvicorn workers on the host.
+    """
+
+    def __init__(self, path=QUOTA_DB_PATH, rpm=GEMINI_RPM, tpm=GEMINI_TPM, burst_seconds=QUOTA_BURST_SECONDS):
+        self.path = path
+        # name -> (refill per second, capacity)
+        self.buckets = {
+            name: (limit / 60.0, max(1.0, limit / 60.0 * burst_seconds))
+            for name, limit in (("requests", rpm), ("tokens", tpm))
+            if limit > 0
+        }
+        self._local = threading.local()
+        self.granted = 0
+        self.waited = 0.0
+
+    @property
+    def enabled(self):
+        return bool(self.buckets)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            self._local.conn = conn
+        return conn
+
+    def try_take(self, amounts):
+        """Take ``amounts`` ({bucket: n}) if all buckets allow it.
+
+        Returns 0 on success, otherwise the seconds to wait before the
+        request could be granted. Nothing is taken on failure.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels = {}
+            wait = 0.0
+            for name, (rate, capacity) in self.buckets.items():
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+                # A single call larger than the bucket could never fit; let it
+                # through once the bucket is full instead of blocking forever.
+                need = min(amounts.get(name, 0), capacity)
+                levels[name] = level - amounts.get(name, 0)
+                if level < need:
+                    wait = max(wait, (need - level) / rate)
+            if wait == 0.0:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                    [(name, level, now) for name, level in levels.items()],
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def settle(self, estimated, actual):
+        # Charge (or refund) the difference once the real token count is known.
+        if "tokens" not in self.buckets or actual == estimated:
+            return
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE buckets SET tokens = tokens - ? WHERE name = 'tokens'", (actual - estimated,))
+        conn.execute("COMMIT")
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "limits_per_minute": {name: rate * 60 for name, (rate, _) in self.buckets.items()},
+            "granted": self.granted,
+            "waited_seconds": round(self.waited, 3),
+        }
+
+
+scheduler = QuotaScheduler()
@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import os
+import signal
+from collections import deque
+from datetime import datetime
+
+from predict import RISK_MODEL_PATH, RiskModel
+
+logger = logging.getLogger(__name__)
+
+# Directory of model versions, one subdirectory each (see tools/publish_model.py),
+# with the active one named in CURRENT. Unset, RISK_MODEL_PATH is the only model.
+RISK_MODEL_REGISTRY = os.getenv("RISK_MODEL_REGISTRY", "")
+# How often every worker checks CURRENT (or, without a registry, the model
+# files) and loads what changed; 0 leaves it to SIGHUP and POST /admin/model,
+# which only reach one worker each
+RISK_MODEL_POLL_SECONDS = float(os.getenv("RISK_MODEL_POLL_SECONDS", "2"))
+# Retired versions kept in /metrics
+RISK_MODEL_HISTORY = int(os.getenv("RISK_MODEL_HISTORY", "8"))
+# Sent as X-Admin-Token to POST /admin/model; unset, the endpoint is off
+MODEL_ADMIN_TOKEN = os.getenv("MODEL_ADMIN_TOKEN", "")
+
+CURRENT = "CURRENT"
+# Files whose change means a new unversioned model
+MODEL_FILES = ("ensemble_model.pkl", "preprocessing.pkl", "model_config.json", os.path.join("trees", "manifest.json"))
+
+
+class UnknownVersion(ValueError):
+    pass
+
+
+def read_current(root):
+    try:
+        with open(os.path.join(root, CURRENT)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        raise UnknownVersion(f"No {CURRENT} file in {root}")
+
+
+def write_current(root, version):
+    """Point CURRENT at ``version``; readers see the old name or the new one, never a partial file."""
+    tmp = os.path.join(root, f".{CURRENT}.{os.getpid()}")
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, CURRENT))
+
+
+def valid_version(version):
+    """A plain directory name; dot names are reserved for staging."""
+    return bool(version) and not version.startswith(".") and os.path.basename(version) == version
+
+
+def version_path(root, version):
+    if not valid_version(version):
+        raise UnknownVersion(f"Invalid model version {version!r}")
+    path = os.path.join(root, version)
+    if not os.path.isdir(path):
+        raise UnknownVersion(f"No model version {version!r} in {root}")
+    return path
+
+
+def files_signature(path):
+    """Size and mtime of the model files under ``path``, to notice them being replaced."""
+    signature = []
+    for name in MODEL_FILES:
+        try:
+            stat = os.stat(os.path.join(path, name))
+        except OSError:
+            signature.append(None)
+        else:
+            signature.append((stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+def process_rss():
+    """Resident bytes of this process, or None off Linux."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def mapped_memory(path):
+    """Bytes of files under ``path`` mapped into this process, from /proc/self/smaps.
+
+    ``resident`` pages are in memory, ``shared`` ones also used by other
+    workers, and ``proportional`` splits shared pages between the processes
+    mapping them. None off Linux.
+    """
+    prefix = os.path.realpath(path) + os.sep
+    totals = {"mapped": 0, "resident": 0, "shared": 0, "private": 0, "proportional": 0}
+    fields = {
+        "Size:": ("mapped",), "Rss:": ("resident",), "Pss:": ("proportional",),
+        "Shared_Clean:": ("shared",), "Shared_Dirty:": ("shared",),
+        "Private_Clean:": ("private",), "Private_Dirty:": ("private",),
+    }
+    try:
+        with open("/proc/self/smaps") as f:
+            inside = False
+            for line in f:
+                parts = line.split()
+                if not parts:
+                    continue
+                if parts[0].endswith(":"):
+                    if inside and parts[0] in fields:
+                        for key in fields[parts[0]]:
+                            totals[key] += int(parts[1]) * 1024
+                else:
+                    # A mapping's header: address range, perms, offset, device, inode, path
+                    inside = len(parts) > 5 and parts[5].startswith(prefix)
+    except OSError:
+        return None
+    return {f"{key}_bytes": value for key, value in totals.items()}
+
+
+class ModelRegistry:
+    """The risk model this worker serves, swapped for a new version without a restart.
+
+    A swap loads the new version next to the old one and then replaces it in
+    one assignment. /predict takes the current model once per request, so
+    requests already running, or queued in the batcher, finish on the
+    version they started with; the old version is freed when the last of
+    them is done.
+    """
+
+    def __init__(self, root=RISK_MODEL_REGISTRY, path=RISK_MODEL_PATH, poll=RISK_MODEL_POLL_SECONDS,
+                 history=RISK_MODEL_HISTORY):
+        self.root = root
+        self.path = path
+        self.poll = poll
+        self.current = RiskModel()
+        self.current_rss = None
+        self.retired = deque(maxlen=history)
+        self.swaps = 0
+        self.failed = 0
+        self.error = None
+        # A version that failed to load is not retried until asked again
+        self.bad_version = None
+        # Model files as of the last unversioned load, loaded or not
+        self.signature = None
+        self._lock = None
+        self._wake = None
+        self._task = None
+        self._signal = False
+
+    def resolve(self, version=None):
+        """The directory and version name to load; ``version`` defaults to CURRENT."""
+        if not self.root:
+            if version is not None:
+                raise UnknownVersion("Model versions need RISK_MODEL_REGISTRY")
+            return self.path, None
+        version = version or read_current(self.root)
+        return version_path(self.root, version), version
+
+    async def reload(self, version=None, force=False, publish=False):
+        """Load ``version`` (default CURRENT) and swap it in; False if it is already serving or failed to load.
+
+        With ``publish``, a version that loads becomes CURRENT for every
+        worker. Raises UnknownVersion if there is no such version.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            path, version = self.resolve(version)
+            if not force and self.root and (
+                version == self.bad_version or self.current.loaded and version == self.current.version
+            ):
+                return False
+            if not self.root:
+                signature = files_signature(path)
+                if not force and signature == self.signature:
+                    return False
+                self.signature = signature
+            model = RiskModel()
+            rss = process_rss()
+            # Unpickling takes a while; requests keep using the current model meanwhile
+            loaded = await asyncio.to_thread(model.load, path, version)
+            if not loaded:
+                self.failed += 1
+                self.error = model.error
+                self.bad_version = version
+                logger.warning("Keeping model version %s: %s", self.current.version, model.error)
+                if not self.current.loaded:
+                    self.current = model
+                return False
+            after = process_rss()
+            if self.current.loaded:
+                self.retired.append({**self.describe(), "retired_at": datetime.now().isoformat()})
+                self.swaps += 1
+            self.current = model
+            if publish and self.root:
+                write_current(self.root, version)
+            # Private memory the load added (approximate: other threads allocate too)
+            self.current_rss = after - rss if rss is not None and after is not None else None
+            self.error = None
+            self.bad_version = None
+            logger.info("Serving risk model version %s from %s", version, path)
+            return True
+
+    async def refresh(self, force=False):
+        """``reload`` of CURRENT that logs a missing version instead of raising."""
+        try:
+            return await self.reload(force=force)
+        except UnknownVersion as e:
+            self.failed += 1
+            self.error = str(e)
+            if not self.current.loaded:
+                self.current.error = self.error
+            logger.warning("Could not load the risk model: %s", e)
+            return False
+
+    def start(self):
+        """Reload on SIGHUP, and every ``poll`` seconds if set."""
+        self._wake = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self._wake.set)
+            self._signal = True
+        except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+            # No SIGHUP on Windows, and no handlers outside the main thread
+            pass
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._signal:
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+            self._signal = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self):
+        timeout = self.poll if self.poll > 0 else None
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+                signalled = True
+            except asyncio.TimeoutError:
+                signalled = False
+            self._wake.clear()
+            # SIGHUP reloads even if CURRENT has not changed
+            await self.refresh(force=signalled)
+
+    def describe(self):
+        """The current version's stats, with the memory it maps and the process memory its load added."""
+        stats = self.current.stats()
+        if self.current.loaded:
+            stats["memory"] = {**(mapped_memory(self.current.path) or {}), "load_rss_bytes": self.current_rss}
+        return stats
+
+    def stats(self):
+        return {
+            **self.describe(),
+            "registry": self.root or None,
+            "swaps": self.swaps,
+            "failed_loads": self.failed,
+            "last_error": self.error,
+            "retired": list(self.retired),
+        }
+
+
+registry = ModelRegistry()
@@ -0,0 +1,120 @@
+import os
+from collections import Counter
+
+from metrics import LatencyTracker
+from quota import estimate_tokens
+
+
+def parse_tiers(spec):
+    # "fast=gemini-2.5-flash-lite,heavy=gemini-2.5-flash" -> {"fast": ..., "heavy": ...}, in order
+    tiers = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, model = item.partition("=")
+        tiers[name.strip()] = model.strip()
+    return tiers
+
+
+def parse_prices(spec):
+    # "fast=0.10/0.40" -> {"fast": (0.10, 0.40)}, USD per million input/output tokens
+    prices = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, pair = item.partition("=")
+        prompt, _, output = pair.partition("/")
+        prices[name.strip()] = (float(prompt), float(output or prompt))
+    return prices
+
+
+# Ordered from the lowest-latency tier to the strongest one.
+LLM_TIERS = parse_tiers(os.getenv("LLM_TIERS", "fast=gemini-2.5-flash-lite,heavy=gemini-2.5-flash"))
+LLM_TIER_PRICES = parse_prices(os.getenv("LLM_TIER_PRICES", "fast=0.10/0.40,heavy=0.30/2.50"))
+# A request goes to the strongest tier when any of these holds.
+ROUTE_HEAVY_PROMPT_TOKENS = int(os.getenv("ROUTE_HEAVY_PROMPT_TOKENS", "1200"))
+ROUTE_HEAVY_FLAGGED = int(os.getenv("ROUTE_HEAVY_FLAGGED", "2"))
+ROUTE_HEAVY_NOTES = os.getenv("ROUTE_HEAVY_NOTES", "1") == "1"
+ROUTE_HEAVY_ENDPOINTS = set(filter(None, os.getenv("ROUTE_HEAVY_ENDPOINTS", "analyze_batch").split(",")))
+
+
+class Router:
+    """Picks a model tier per request from cheap local features.
+
+    Requests with a long prompt, several out-of-range readings, free-text
+    notes, or from an endpoint listed in ``heavy_endpoints`` go to the last
+    (strongest) tier; everything else goes to the first (fastest) one.
+    """
+
+    def __init__(self, tiers=LLM_TIERS, prompt_tokens=ROUTE_HEAVY_PROMPT_TOKENS, flagged=ROUTE_HEAVY_FLAGGED,
+                 notes=ROUTE_HEAVY_NOTES, heavy_endpoints=ROUTE_HEAVY_ENDPOINTS):
+        self.tiers = list(tiers)
+        self.prompt_tokens = prompt_tokens
+        self.flagged = flagged
+        self.notes = notes
+        self.heavy_endpoints = heavy_endpoints
+        self.decisions = Counter()
+
+    def reason(self, endpoint, prompt, flagged=0, notes=None):
+        if endpoint in self.heavy_endpoints:
+            return "endpoint"
+        if estimate_tokens(prompt) >= self.prompt_tokens:
+            return "prompt_length"
+        if self.flagged and flagged >= self.flagged:
+            return "flagged_parameters"
+        if self.notes and notes and notes.strip():
+            return "notes"
+        return None
+
+    def route(self, endpoint, prompt, flagged=0, notes=None):
+        reason = self.reason(endpoint, prompt, flagged, notes)
+        tier = self.tiers[-1] if reason else self.tiers[0]
+        self.decisions[f"{endpoint}:{tier}:{reason or 'simple'}"] += 1
+        return tier
+
+    def stats(self):
+        return dict(self.decisions)
+
+
+class TierUsage:
+    def __init__(self, prices):
+        self.prices = prices
+        self.latency = LatencyTracker()
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def record(self, seconds, prompt, text):
+        self.latency.observe(seconds)
+        self.calls += 1
+        self.prompt_tokens += estimate_tokens(prompt)
+        self.output_tokens += estimate_tokens(text)
+
+    def stats(self):
+        prompt_price, output_price = self.prices
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency": self.latency.stats(),
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            # Estimated from ~4 characters per token, not billed usage.
+            "cost_usd": round((self.prompt_tokens * prompt_price + self.output_tokens * output_price) / 1e6, 6),
+        }
+
+
+class Usage:
+    """Per-tier latency, token and cost counters for upstream calls."""
+
+    def __init__(self, prices=LLM_TIER_PRICES):
+        self.prices = prices
+        self.tiers = {}
+
+    def __getitem__(self, tier):
+        if tier not in self.tiers:
+            self.tiers[tier] = TierUsage(self.prices.get(tier, (0.0, 0.0)))
+        return self.tiers[tier]
+
+    def stats(self):
+        return {tier: usage.stats() for tier, usage in self.tiers.items()}
+
+
+router = Router()
+usage = Usage()
@@ -0,0 +1,212 @@
+import math
+import re
+from typing import NamedTuple
+
+import numpy as np
+
+
+class Limit(NamedTuple):
+    label: str
+    unit: str
+    # Acceptable range, then the permissible range in the absence of an
+    # alternate source (BIS 10500:2012). None means unbounded on that side.
+    acceptable: tuple
+    permissible: tuple
+    advice: str
+
+
+# Drinking water limits from BIS 10500:2012. BIS sets none for dissolved
+# oxygen, so it uses the CPCB drinking-water source criteria (class A / C).
+LIMITS = {
+    "ph": Limit("pH", "", (6.5, 8.5), (6.5, 8.5),
+                "Correct the pH before supply: lime or soda ash dosing for acidic water, aeration or acid neutralisation for alkaline water."),
+    "turbidity": Limit("Turbidity", "NTU", (None, 1), (None, 5),
+                       "Reduce turbidity by settling, coagulation or filtration before disinfection; chlorine is less effective in turbid water."),
+    "tds": Limit("Total dissolved solids", "mg/L", (None, 500), (None, 2000),
+                 "High dissolved solids call for reverse osmosis or blending with a low-TDS source."),
+    "dissolved_oxygen": Limit("Dissolved oxygen", "mg/L", (6, None), (4, None),
+                              "Low dissolved oxygen points to organic pollution; inspect the source for sewage or runoff."),
+    "nitrate": Limit("Nitrate", "mg/L", (None, 45), (None, 45),
+                     "Nitrate above 45 mg/L is unsafe for infants; use an alternate source and check for sewage or fertiliser contamination."),
+    "fluoride": Limit("Fluoride", "mg/L", (None, 1.0), (None, 1.5),
+                      "Excess fluoride needs defluoridation (activated alumina or Nalgonda technique) or an alternate source."),
+    "total_coliform": Limit("Total coliform", "MPN/100mL", (None, 0), (None, 0),
+                            "Coliforms must not be detectable: boil or chlorinate before drinking and disinfect the source."),
+    "e_coli": Limit("E. coli", "MPN/100mL", (None, 0), (None, 0),
+                    "E. coli indicates faecal contamination: boil or chlorinate before drinking, disinfect the source and alert the health worker."),
+    "chloride": Limit("Chloride", "mg/L", (None, 250), (None, 1000),
+                      "High chloride suggests saline intrusion or sewage; blend or treat by reverse osmosis."),
+    "hardness": Limit("Total hardness", "mg/L as CaCO3", (None, 200), (None, 600),
+                      "Hard water can be softened by ion exchange or lime softening."),
+    "iron": Limit("Iron", "mg/L", (None, 1.0), (None, 1.0),
+                  "Remove iron by aeration followed by filtration."),
+    "arsenic": Limit("Arsenic", "mg/L", (None, 0.01), (None, 0.01),
+                     "Arsenic above 0.01 mg/L is unsafe; switch to an alternate source and use certified arsenic removal units."),
+    "sulphate": Limit("Sulphate", "mg/L", (None, 200), (None, 400),
+                      "High sulphate can cause gastro-intestinal irritation; blend with a low-sulphate source."),
+    "residual_chlorine": Limit("Residual free chlorine", "mg/L", (0.2, None), (0.2, 1.0),
+                               "Keep residual free chlorine between 0.2 and 1 mg/L by adjusting the chlorine dose."),
+}
+
+# Readings that carry context but have no drinking-water limit of their own.
+INFORMATIONAL = {"temperature", "conductivity", "rainfall"}
+
+ALIASES = {
+    "temp": "temperature",
+    "water_temperature": "temperature",
+    "ec": "conductivity",
+    "electrical_conductivity": "conductivity",
+    "rain": "rainfall",
+    "p_h": "ph",
+    "ntu": "turbidity",
+    "total_dissolved_solids": "tds",
+    "do": "dissolved_oxygen",
+    "oxygen": "dissolved_oxygen",
+    "no3": "nitrate",
+    "nitrates": "nitrate",
+    "f": "fluoride",
+    "coliform": "total_coliform",
+    "coliforms": "total_coliform",
+    "total_coliforms": "total_coliform",
+    "ecoli": "e_coli",
+    "fecal_coliform": "e_coli",
+    "faecal_coliform": "e_coli",
+    "total_hardness": "hardness",
+    "fe": "iron",
+    "as": "arsenic",
+    "sulfate": "sulphate",
+    "so4": "sulphate",
+    "chlorine": "residual_chlorine",
+    "free_chlorine": "residual_chlorine",
+    "residual_free_chlorine": "residual_chlorine",
+}
+
+OK, MARGINAL, UNSAFE, MISSING = 0, 1, 2, -1
+CLASSES = {OK: "safe", MARGINAL: "marginal", UNSAFE: "unsafe"}
+STATUSES = {OK: "acceptable", MARGINAL: "permissible", UNSAFE: "unsafe"}
+
+_units = re.compile(r"\(.*?\)|\[.*?\]")
+_separators = re.compile(r"[^a-z0-9]+")
+
+
+def canonical_name(name):
+    # "Turbidity (NTU)" -> "turbidity", "E. coli" -> "e_coli"
+    key = _separators.sub("_", _units.sub("", str(name).lower())).strip("_")
+    return ALIASES.get(key, key)
+
+
+def _bounds(names):
+    # Columns of lower/upper bounds for the acceptable and permissible ranges.
+    bounds = np.empty((4, len(names)))
+    for i, name in enumerate(names):
+        limit = LIMITS[name]
+        acc_lo, acc_hi = limit.acceptable
+        perm_lo, perm_hi = limit.permissible
+        bounds[:, i] = [
+            -np.inf if acc_lo is None else acc_lo,
+            np.inf if acc_hi is None else acc_hi,
+            -np.inf if perm_lo is None else perm_lo,
+            np.inf if perm_hi is None else perm_hi,
+        ]
+    return bounds
+
+
+def assess_array(names, values):
+    """Classify a (samples, parameters) array of readings.
+
+    ``names`` are canonical parameter names (keys of ``LIMITS``), one per
+    column. NaN marks a missing reading. Returns the per-reading status codes
+    and the overall code per sample (the worst status of its readings, or
+    MISSING if it has none).
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[np.newaxis, :]
+    acc_lo, acc_hi, perm_lo, perm_hi = _bounds(names)
+    status = np.full(values.shape, OK, dtype=np.int8)
+    status[(values < acc_lo) | (values > acc_hi)] = MARGINAL
+    status[(values < perm_lo) | (values > perm_hi)] = UNSAFE
+    status[np.isnan(values)] = MISSING
+    overall = status.max(axis=1, initial=MISSING)
+    return status, overall
+
+
+def _as_number(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def assess(parameters):
+    """Assess one sample's parameters against the limit tables.
+
+    The result is ambiguous, meaning the rules alone should not decide it,
+    when the sample is marginal, has no recognised readings, or carries
+    readings the tables do not cover.
+    """
+    names, values, unrecognized = [], [], []
+    for raw_name, raw_value in parameters.items():
+        name = canonical_name(raw_name)
+        value = _as_number(raw_value)
+        if name in LIMITS and value is not None and name not in names:
+            names.append(name)
+            values.append(value)
+        elif name not in INFORMATIONAL:
+            unrecognized.append(raw_name)
+
+    flags = {}
+    recommendations = []
+    overall = MISSING
+    if names:
+        status, overall_codes = assess_array(names, values)
+        overall = int(overall_codes[0])
+        for name, value, code in zip(names, values, status[0]):
+            limit = LIMITS[name]
+            flags[name] = {
+                "label": limit.label,
+                "value": value,
+                "unit": limit.unit,
+                "status": STATUSES[int(code)],
+                "acceptable": list(limit.acceptable),
+                "permissible": list(limit.permissible),
+            }
+            if code != OK:
+                recommendations.append(limit.advice)
+
+    return {
+        "overall": CLASSES.get(overall, "unknown"),
+        "parameters": flags,
+        "recommendations": recommendations,
+        "unrecognized": unrecognized,
+        "ambiguous": overall in (MARGINAL, MISSING) or bool(unrecognized),
+    }
+
+
+def _range_text(bounds, unit):
+    low, high = bounds
+    suffix = f" {unit}" if unit else ""
+    if low is not None and high is not None:
+        return f"{low}-{high}{suffix}"
+    if low is not None:
+        return f">= {low}{suffix}"
+    return f"<= {high}{suffix}"
+
+
+def render(assessment):
+    lines = [f"Overall water quality: {assessment['overall'].upper()} (BIS 10500 limits)", ""]
+    for flag in assessment["parameters"].values():
+        unit = f" {flag['unit']}" if flag["unit"] else ""
+        lines.append(
+            f"- {flag['label']}: {flag['value']:g}{unit} is {flag['status']} "
+            f"(acceptable limit {_range_text(flag['acceptable'], flag['unit'])})"
+        )
+    if assessment["recommendations"]:
+        lines += ["", "Recommendations:"]
+        lines += [f"- {advice}" for advice in assessment["recommendations"]]
+    elif assessment["overall"] == "safe":
+        lines += ["", "All measured parameters are within acceptable limits; continue routine monitoring."]
+    return "\n".join(lines)
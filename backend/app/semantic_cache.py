@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+from metrics import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "semantic_cache.npz")
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2000"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+EMBED_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "1024"))
+NGRAM_SIZES = (3, 4, 5)
+
+_non_word = re.compile(r"[^\w\s]+")
+_spaces = re.compile(r"\s+")
+# A number (3,000 or 0.2) and the word written after it, kept if it is a unit
+_quantity = re.compile(r"(\d+(?:,\d{3})*(?:\.\d+)?)\s*([^\W\d_]+|%)?")
+UNITS = {
+    "%", "c", "f", "degree", "degrees", "mg", "µg", "ug", "g", "kg", "ppm", "ppb", "ntu", "cfu", "mpn", "us", "µs",
+    "ms", "l", "litre", "litres", "liter", "liters", "ml", "m", "cm", "mm", "km", "minute", "minutes", "min",
+    "hour", "hours", "hr", "hrs", "day", "days", "week", "weeks", "month", "months", "year", "years",
+}
+
+
+def normalize(text):
+    return _spaces.sub(" ", _non_word.sub(" ", text.lower())).strip()
+
+
+def quantities(text):
+    """The numbers in ``text`` with their units, in order; "2 mg/l" and "2.0mg per l" give the same."""
+    return tuple(
+        (float(number.replace(",", "")), unit if unit in UNITS else "")
+        for number, unit in _quantity.findall(text.lower())
+    )
+
+
+def embed(text, dim=EMBED_DIM):
+    # Hashed character n-grams: crc32 is stable across processes, unlike hash().
+    padded = f" {normalize(text)} "
+    vector = np.zeros(dim, dtype=np.float32)
+    for n in NGRAM_SIZES:
+        for i in range(len(padded) - n + 1):
+            h = zlib.crc32(padded[i:i + n].encode())
+            vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Nearest-neighbour index of answered queries, matched by cosine similarity.
+
+    Character n-grams barely notice a changed reading ("pH 6" against "pH 9"
+    scores above 0.85), so a match must also have exactly the same numbers
+    and units as the query.
+    """
+
+    def __init__(self, capacity=SEMANTIC_CACHE_SIZE, threshold=SEMANTIC_CACHE_THRESHOLD, dim=EMBED_DIM):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.dim = dim
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.queries = []
+        self.answers = []
+        self.numbers = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Lookups that cleared the threshold but named other numbers
+        self.number_mismatches = 0
+        self.lookup_latency = LatencyTracker()
+
+    def __len__(self):
+        return len(self.answers)
+
+    def _match(self, vector, numbers):
+        """The closest entry above the threshold with the same numbers, or -1."""
+        if not self.answers:
+            return -1
+        scores = self.vectors[:len(self.answers)] @ vector
+        candidates = np.flatnonzero(scores >= self.threshold)
+        for index in candidates[np.argsort(scores[candidates])[::-1]]:
+            if self.numbers[index] == numbers:
+                return int(index)
+        if len(candidates):
+            self.number_mismatches += 1
+        return -1
+
+    def lookup(self, query):
+        with self.lookup_latency.time():
+            index = self._match(embed(query, self.dim), quantities(query))
+            if index >= 0:
+                self.hits += 1
+                self.last_used[index] = time.time()
+                return self.answers[index]
+            self.misses += 1
+            return None
+
+    def add(self, query, answer):
+        vector = embed(query, self.dim)
+        numbers = quantities(query)
+        index = self._match(vector, numbers)
+        if index < 0:
+            if len(self.answers) < self.capacity:
+                index = len(self.answers)
+                self.queries.append(query)
+                self.answers.append(answer)
+                self.numbers.append(numbers)
+            else:
+                # Evict the entry that has gone unused the longest.
+                index = int(np.argmin(self.last_used))
+                self.evictions += 1
+        self.vectors[index] = vector
+        self.last_used[index] = time.time()
+        self.queries[index] = query
+        self.answers[index] = answer
+        self.numbers[index] = numbers
+
+    def save(self, path=SEMANTIC_CACHE_PATH):
+        count = len(self.answers)
+        # A temporary file of its own, so workers saving at once never write
+        # into the same one; readers see the old cache or the new one
+        fd, tmp = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    vectors=self.vectors[:count],
+                    last_used=self.last_used[:count],
+                    entries=np.array(json.dumps({"queries": self.queries, "answers": self.answers})),
+                )
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def load(self, path=SEMANTIC_CACHE_PATH):
+        if not os.path.exists(path):
+            return
+        try:
+            with np.load(path) as data:
+                if data["vectors"].shape[1] != self.dim:
+                    return
+                entries = json.loads(str(data["entries"]))
+                # Keep the most recently used entries if the capacity shrank.
+                order = np.argsort(data["last_used"])[::-1][:self.capacity]
+                vectors = data["vectors"][order]
+                last_used = data["last_used"][order]
+            queries = [entries["queries"][i] for i in order]
+            answers = [entries["answers"][i] for i in order]
+        except Exception as e:
+            # The cache only saves Gemini calls; start empty rather than fail startup.
+            logger.warning("Ignoring the semantic cache in %s: %s", path, e)
+            return
+        count = len(order)
+        self.vectors[:count] = vectors
+        self.last_used[:count] = last_used
+        self.queries = queries
+        self.answers = answers
+        self.numbers = [quantities(query) for query in self.queries]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.answers),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "number_mismatches": self.number_mismatches,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "lookup_latency": self.lookup_latency.stats(),
+        }
+
+
+faq_cache = SemanticCache()
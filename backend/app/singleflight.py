@@ -0,0 +1,33 @@
+import asyncio
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution.
+
+    Nothing is kept once the call settles, so later callers always trigger a
+    fresh call; only requests that overlap in time share a result or error.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            self.executed += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shield so one disconnecting client does not cancel the shared call.
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "in_flight": len(self._calls),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+        }
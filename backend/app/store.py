@@ -0,0 +1,121 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from cache import TTLCache
+
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH", "results.sqlite3")
+RESULT_STORE_TTL = float(os.getenv("RESULT_STORE_TTL", str(7 * 24 * 3600)))
+RESULT_STORE_MAX_BYTES = int(os.getenv("RESULT_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+RESULT_STORE_FRONT_SIZE = int(os.getenv("RESULT_STORE_FRONT_SIZE", "1024"))
+RESULT_STORE_FRONT_TTL = float(os.getenv("RESULT_STORE_FRONT_TTL", "300"))
+# Expiry and size eviction run once every this many writes.
+EVICT_EVERY = 64
+
+
+class ResultStore:
+    """Completed LLM results on disk, shared by all workers and kept across restarts.
+
+    Entries are keyed by a hash of model name and prompt and live in an
+    SQLite database in WAL mode, so readers in other workers never block on
+    a writer. Hot keys are served from a small in-memory front cache.
+    """
+
+    def __init__(self, path=RESULT_STORE_PATH, ttl=RESULT_STORE_TTL, max_bytes=RESULT_STORE_MAX_BYTES,
+                 front_size=RESULT_STORE_FRONT_SIZE, front_ttl=RESULT_STORE_FRONT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.front = TTLCache(front_size, min(front_ttl, ttl), max_bytes)
+        self._local = threading.local()
+        self._writes = 0
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.evicted = 0
+
+    @staticmethod
+    def key(model, prompt):
+        return hashlib.sha256(f"{model}\0{prompt}".encode()).hexdigest()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, model TEXT, value TEXT, size INTEGER, "
+                "created REAL, expires REAL, accessed REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            self._local.conn = conn
+        return conn
+
+    def get_cached(self, key):
+        return self.front.get(key)
+
+    def get(self, key):
+        # Disk lookup; blocking, so call it off the event loop.
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute("SELECT value FROM results WHERE key = ? AND expires > ?", (key, now)).fetchone()
+        if row is None:
+            self.disk_misses += 1
+            return None
+        self.disk_hits += 1
+        conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+        self.front.set(key, row[0])
+        return row[0]
+
+    def put(self, key, model, value):
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (key, model, value, size, created, expires, accessed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, model, value, len(value.encode()), now, now + self.ttl, now),
+        )
+        self.front.set(key, value)
+        self._writes += 1
+        if self._writes % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.evicted += conn.execute("DELETE FROM results WHERE expires <= ?", (time.time(),)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total > self.max_bytes:
+                # Drop least recently used entries until back under 90% of the cap.
+                excess = total - int(self.max_bytes * 0.9)
+                rows = conn.execute("SELECT key, size FROM results ORDER BY accessed").fetchall()
+                doomed = []
+                for key, size in rows:
+                    if excess <= 0:
+                        break
+                    doomed.append((key,))
+                    excess -= size
+                conn.executemany("DELETE FROM results WHERE key = ?", doomed)
+                self.evicted += len(doomed)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self):
+        count, size = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {
+            "entries": count,
+            "bytes": size,
+            "front": self.front.stats(),
+            "disk_hits": self.disk_hits,
+            "disk_misses": self.disk_misses,
+            "evicted": self.evicted,
+        }
+
+
+results = ResultStore()
@@ -0,0 +1,70 @@
+import json
+import time
+from datetime import datetime
+
+from fastapi.responses import StreamingResponse
+
+from metrics import LatencyTracker
+
+# Time from the handler starting a stream to its first chunk, per endpoint.
+ttfb = {"chat": LatencyTracker(), "analyze": LatencyTracker()}
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class _EventStreamResponse(StreamingResponse):
+    def __init__(self, content, chunks, **kwargs):
+        super().__init__(content, **kwargs)
+        self.chunks = chunks
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Releases an llm.OpenStream's slot even if the client left
+            # before the first chunk
+            await self.chunks.aclose()
+
+
+def sse_response(endpoint, chunks, on_complete=None, metadata=None):
+    """Wrap an async iterator of text chunks as a Server-Sent Events response.
+
+    Each chunk is sent as a ``chunk`` event. The stream ends with a ``done``
+    event that carries the timestamp and metadata, or with an ``error`` event.
+    ``on_complete`` gets the full text once the stream has finished cleanly.
+    ``chunks`` is closed when the response ends.
+    """
+    start = time.perf_counter()
+
+    async def events():
+        parts = []
+        try:
+            async for text in chunks:
+                if not parts:
+                    ttfb[endpoint].observe(time.perf_counter() - start)
+                parts.append(text)
+                yield sse_event("chunk", {"text": text})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+            return
+        if on_complete is not None:
+            on_complete("".join(parts))
+        yield sse_event("done", {
+            "timestamp": str(datetime.now().isoformat()),
+            "chunks": len(parts),
+            "elapsed_ms": round((time.perf_counter() - start) * 1e3, 3),
+            **(metadata or {}),
+        })
+
+    return _EventStreamResponse(
+        events(),
+        chunks,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def single_chunk(text):
+    yield text
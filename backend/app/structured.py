@@ -0,0 +1,112 @@
+import json
+import os
+import re
+from collections import Counter
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+import rules
+
+# Completion cap for structured analyses; the JSON is much shorter than prose.
+ANALYZE_STRUCTURED_MAX_TOKENS = int(os.getenv("ANALYZE_STRUCTURED_MAX_TOKENS", "768"))
+
+RISK_TIERS = ("low", "moderate", "high", "critical")
+SEVERITY = ("safe", "marginal", "unsafe")
+# Unsafe readings of these mean acute or irreversible harm, not just "unsafe".
+CRITICAL_PARAMETERS = {"e_coli", "total_coliform", "arsenic", "nitrate"}
+
+counts = Counter()
+
+
+class ParameterStatus(BaseModel):
+    name: str
+    value: Optional[float] = None
+    unit: str = ""
+    status: Literal["acceptable", "permissible", "unsafe", "unknown"]
+    comment: str = ""
+
+
+class StructuredAnalysis(BaseModel):
+    overall: Literal["safe", "marginal", "unsafe", "unknown"]
+    risk_tier: Literal["low", "moderate", "high", "critical"]
+    parameters: list[ParameterStatus]
+    health_implications: list[str] = Field(default_factory=list)
+    recommendations: list[str] = Field(default_factory=list)
+
+
+OUTPUT_INSTRUCTIONS = """Respond with a single JSON object and nothing else, in this shape:
+{"overall": "safe|marginal|unsafe|unknown",
+ "risk_tier": "low|moderate|high|critical",
+ "parameters": [{"name": "...", "value": 7.2, "unit": "...", "status": "acceptable|permissible|unsafe|unknown", "comment": "..."}],
+ "health_implications": ["..."],
+ "recommendations": ["..."]}
+Keep each comment and list item to one short sentence."""
+
+_fence = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def rules_tier(assessment):
+    overall = assessment["overall"]
+    if overall == "unsafe":
+        unsafe = {name for name, flag in assessment["parameters"].items() if flag["status"] == "unsafe"}
+        return "critical" if unsafe & CRITICAL_PARAMETERS else "high"
+    return {"safe": "low", "marginal": "moderate"}.get(overall, "moderate")
+
+
+def from_assessment(assessment):
+    return StructuredAnalysis(
+        overall=assessment["overall"],
+        risk_tier=rules_tier(assessment),
+        parameters=[
+            ParameterStatus(name=name, value=flag["value"], unit=flag["unit"], status=flag["status"])
+            for name, flag in assessment["parameters"].items()
+        ],
+        recommendations=assessment["recommendations"],
+    )
+
+
+def _validate(text):
+    body = _fence.sub("", text.strip())
+    start, end = body.find("{"), body.rfind("}")
+    return StructuredAnalysis.model_validate(json.loads(body[start:end + 1]))
+
+
+def parse(text):
+    """Validate a completion against ``StructuredAnalysis``; raises ValueError if it does not fit."""
+    try:
+        analysis = _validate(text)
+    except ValueError:
+        counts["invalid"] += 1
+        raise
+    counts["valid"] += 1
+    return analysis
+
+
+def is_valid(text):
+    """Whether ``parse`` would accept ``text``, without counting it."""
+    try:
+        _validate(text)
+    except ValueError:
+        return False
+    return True
+
+
+def reconcile(analysis, assessment):
+    # The limit tables stay authoritative: readings they cover keep the rules'
+    # status, and neither the overall class nor the risk tier drops below
+    # what the rules imply.
+    for parameter in analysis.parameters:
+        flag = assessment["parameters"].get(rules.canonical_name(parameter.name))
+        if flag is not None:
+            parameter.status = flag["status"]
+            parameter.value = flag["value"]
+    overall = assessment["overall"]
+    if overall in SEVERITY and (
+        analysis.overall not in SEVERITY or SEVERITY.index(analysis.overall) < SEVERITY.index(overall)
+    ):
+        analysis.overall = overall
+    floor = rules_tier(assessment) if overall in SEVERITY else RISK_TIERS[0]
+    if RISK_TIERS.index(analysis.risk_tier) < RISK_TIERS.index(floor):
+        analysis.risk_tier = floor
+    return analysis
@@ -0,0 +1,389 @@
+import json
+import os
+from decimal import Decimal, localcontext
+
+import numpy as np
+
+FORMAT_VERSION = 1
+# Rows evaluated together; bounds the (trees x rows) node index arrays
+TREE_CHUNK_ROWS = int(os.getenv("TREE_CHUNK_ROWS", "4096"))
+
+ARRAYS = ("feature", "threshold", "children", "default_left", "roots", "values", "tree_class")
+
+
+class TreeEnsemble:
+    """A random forest or XGBoost model as flat NumPy arrays, evaluated a batch at a time.
+
+    Nodes of all trees are concatenated: ``feature``, ``threshold``,
+    ``children`` (left and right child index, interleaved) and
+    ``default_left`` (where a missing value goes), with each tree starting at
+    ``roots[t]``. Leaves point to themselves. ``values`` holds per-leaf class
+    probabilities (forests) or leaf margins (XGBoost, with ``tree_class``
+    naming the class each tree adds to). Saved as .npy files and
+    memory-mapped on load, so worker processes share one copy of the pages.
+    ``max_rows``, measured by tools/export_trees.py, is the largest batch for
+    which the arrays beat the original model; None if they always do.
+    """
+
+    def __init__(self, arrays, meta):
+        self.arrays = arrays
+        self.meta = meta
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.kind = meta["kind"]
+        self.depth = meta["depth"]
+        self.n_classes = meta["n_classes"]
+        self.max_rows = meta.get("max_rows")
+        self.is_leaf = self.children[::2] == np.arange(len(self.feature), dtype=self.children.dtype)
+        # Trees grown to purity end at many depths: set rows aside as they
+        # reach leaves. Boosted trees mostly end at the depth limit, where
+        # checking would cost more than it saves
+        self.ragged = _mean_leaf_depth(self.children, self.is_leaf, self.roots) < 0.75 * self.depth
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name, array in self.arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({**self.meta, "format": FORMAT_VERSION}, f, indent=1)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported tree format {meta.get('format')} in {path}")
+        mode = "r" if mmap else None
+        # Plain ndarray views of the mapped files; np.memmap slows down every take
+        arrays = {name: np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)) for name in ARRAYS}
+        return cls(arrays, meta)
+
+    def apply(self, X):
+        """Leaf index of every row in every tree, shape ``(trees, rows)``.
+
+        (tree, row) pairs step down together, at most ``depth`` times. In a
+        ragged ensemble, once half of the pairs still stepping are at leaves
+        they are set aside, and the loop ends when none are left, so a batch
+        costs about its mean path length rather than the deepest tree's.
+        """
+        X = np.ascontiguousarray(X)
+        values = X.ravel()
+        trees, rows = len(self.roots), len(X)
+        leaves = np.empty(trees * rows, dtype=np.intp)
+        # The pairs still stepping, tree-major: their node, where their row
+        # starts in values, and where their leaf goes
+        node = np.repeat(np.asarray(self.roots, dtype=np.intp), rows)
+        row_start = np.tile(np.arange(rows, dtype=np.intp) * X.shape[1], trees)
+        position = np.arange(trees * rows)
+        has_missing = np.isnan(values).any()
+        # XGBoost goes left when x < threshold, scikit-learn when x <= threshold
+        go_right = np.greater_equal if self.kind == "xgboost" else np.greater
+        for _ in range(self.depth):
+            if self.ragged:
+                arrived = self.is_leaf.take(node)
+                count = np.count_nonzero(arrived)
+                if count == len(node):
+                    break
+                if 2 * count >= len(node):
+                    leaves[position[arrived]] = node[arrived]
+                    stepping = ~arrived
+                    node, row_start, position = node[stepping], row_start[stepping], position[stepping]
+            x = values.take(row_start + self.feature.take(node))
+            right = go_right(x, self.threshold.take(node))
+            if has_missing:
+                missing = np.isnan(x)
+                right = np.where(missing, ~self.default_left.take(node), right)
+            node = self.children.take(2 * node + right)
+        leaves[position] = node
+        return leaves.reshape(trees, rows)
+
+    def predict_proba(self, X):
+        # Both libraries compare float32 features against their thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if len(X) > TREE_CHUNK_ROWS:
+            return np.concatenate([
+                self.predict_proba(X[start:start + TREE_CHUNK_ROWS]) for start in range(0, len(X), TREE_CHUNK_ROWS)
+            ])
+        leaves = self.apply(X)
+        if self.kind == "forest":
+            return self._forest_proba(leaves)
+        return self._xgboost_proba(leaves)
+
+    def _forest_proba(self, leaves):
+        # As RandomForestClassifier.predict_proba: sum tree by tree, then divide
+        # (cumsum adds in order; sum may add pairwise)
+        proba = self.values[leaves].cumsum(axis=0)[-1]
+        proba /= len(leaves)
+        return proba
+
+    def _xgboost_proba(self, leaves):
+        # float32 margins summed in tree order from the base score, as XGBoost does
+        outputs = 1 if self.meta["objective"] == "binary:logistic" else self.n_classes
+        margin = np.empty((leaves.shape[1], outputs), dtype=np.float32)
+        base_margin = np.broadcast_to(np.asarray(self.meta["base_margin"], dtype=np.float32), outputs)
+        for group in range(outputs):
+            group_leaves = leaves[self.tree_class == group]
+            terms = np.empty((1 + len(group_leaves), leaves.shape[1]), dtype=np.float32)
+            terms[0] = base_margin[group]
+            terms[1:] = self.values.take(group_leaves)
+            margin[:, group] = terms.cumsum(axis=0)[-1]
+        if outputs == 1:
+            positive = np.float32(1) / (np.float32(1) + _expf(-margin[:, 0]))
+            return np.column_stack([np.float32(1) - positive, positive])
+        # common::Softmax: float exps of the shifted margins, summed in double
+        margin -= margin.max(axis=1, keepdims=True)
+        exp = _expf(margin)
+        total = np.zeros(len(exp))
+        for column in exp.T:
+            total += column
+        return exp / total.astype(np.float32)[:, None]
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "trees": len(self.roots),
+            "nodes": len(self.feature),
+            "bytes": self.nbytes,
+            "max_rows": self.max_rows,
+        }
+
+
+class Fallback:
+    """An exported member that hands batches over ``flat.max_rows`` rows back to the original.
+
+    Both give bit-identical probabilities, so only the time differs.
+    """
+
+    def __init__(self, flat, original):
+        self.flat = flat
+        self.original = original
+
+    def predict_proba(self, X):
+        if len(X) > self.flat.max_rows:
+            return self.original.predict_proba(X)
+        return self.flat.predict_proba(X)
+
+
+# glibc's expf (sysdeps/ieee754/flt-32/e_expf.c): XGBoost's softmax and
+# sigmoid call it, and it is not always correctly rounded, so matching
+# XGBoost bit for bit means following the same steps in double precision.
+_EXP2F_N = 32
+with localcontext() as _context:
+    _context.prec = 40
+    _EXP2F_TABLE = np.array(
+        [np.float64(float(Decimal(2) ** (Decimal(i) / _EXP2F_N))).view(np.uint64) - np.uint64(i << 47)
+         for i in range(_EXP2F_N)],
+        dtype=np.uint64,
+    )
+_EXP2F_C0 = float.fromhex("0x1.c6af84b912394p-5") / _EXP2F_N ** 3
+_EXP2F_C1 = float.fromhex("0x1.ebfce50fac4f3p-3") / _EXP2F_N ** 2
+_EXP2F_C2 = float.fromhex("0x1.62e42ff0c52d6p-1") / _EXP2F_N
+_EXP2F_INVLN2N = float.fromhex("0x1.71547652b82fep+0") * _EXP2F_N
+_EXP2F_SHIFT = float.fromhex("0x1.8p+52")
+_EXPF_OVERFLOW = np.float32(float.fromhex("0x1.62e42ep6"))
+_EXPF_UNDERFLOW = np.float32(-float.fromhex("0x1.9fe368p6"))
+
+
+def _expf(x):
+    xd = x.astype(np.float64)
+    z = _EXP2F_INVLN2N * xd
+    kd = z + _EXP2F_SHIFT
+    # k in the low bits of the shifted double; kd itself must not be changed in place
+    ki = kd.view(np.uint64)
+    kd = kd - _EXP2F_SHIFT
+    r = z - kd
+    # 2^(k/N) from the table entry and the integer part of k in the exponent bits
+    s = (_EXP2F_TABLE[ki & np.uint64(_EXP2F_N - 1)] + (ki << np.uint64(47))).view(np.float64)
+    y = (_EXP2F_C0 * r + _EXP2F_C1) * (r * r) + (_EXP2F_C2 * r + 1)
+    y = (y * s).astype(np.float32)
+    # Out of range: infinity, zero, and NaN passed through
+    y[x > _EXPF_OVERFLOW] = np.inf
+    y[x < _EXPF_UNDERFLOW] = 0
+    y[np.isnan(x)] = np.nan
+    return y
+
+
+def _children(left, right):
+    # Leaves (-1) point to themselves; (left, right) pairs interleaved
+    leaves = left < 0
+    index = np.arange(len(left))
+    return np.column_stack([np.where(leaves, index, left), np.where(leaves, index, right)]).astype(np.int32).ravel()
+
+
+def _depth(children, roots):
+    depth = 0
+    frontier = np.asarray(roots)
+    while True:
+        below = children.reshape(-1, 2)[frontier].ravel()
+        below = below[below != np.repeat(frontier, 2)]
+        if not len(below):
+            return depth
+        depth += 1
+        frontier = below
+
+
+def _mean_leaf_depth(children, is_leaf, roots):
+    total = leaves = depth = 0
+    frontier = np.asarray(roots)
+    while len(frontier):
+        leaf = is_leaf[frontier]
+        total += depth * np.count_nonzero(leaf)
+        leaves += np.count_nonzero(leaf)
+        frontier = children.reshape(-1, 2)[frontier[~leaf]].ravel()
+        depth += 1
+    return total / leaves
+
+
+def export_forest(forest):
+    """Flat arrays for a fitted scikit-learn RandomForestClassifier or ExtraTreesClassifier."""
+    from sklearn import __version__
+
+    if forest.n_outputs_ != 1:
+        raise ValueError("Only single-output forests are supported")
+    legacy_values = tuple(int(part) for part in __version__.split(".")[:2]) < (1, 4)
+    parts = {name: [] for name in ("feature", "threshold", "left", "right", "default_left", "values")}
+    roots, offset = [], 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        values = tree.value[:, 0, :forest.n_classes_]
+        if legacy_values:
+            # Before scikit-learn 1.4 leaves held counts, normalized at predict time
+            normalizer = values.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            values = values / normalizer
+        left = np.where(tree.children_left < 0, -1, tree.children_left + offset)
+        right = np.where(tree.children_right < 0, -1, tree.children_right + offset)
+        parts["feature"].append(np.maximum(tree.feature, 0))
+        parts["threshold"].append(tree.threshold)
+        parts["left"].append(left)
+        parts["right"].append(right)
+        parts["default_left"].append(getattr(tree, "missing_go_to_left", np.zeros(tree.node_count, np.uint8)))
+        parts["values"].append(values)
+        roots.append(offset)
+        offset += tree.node_count
+    children = _children(np.concatenate(parts["left"]), np.concatenate(parts["right"]))
+    arrays = {
+        "feature": np.concatenate(parts["feature"]).astype(np.int32),
+        "threshold": np.concatenate(parts["threshold"]).astype(np.float64),
+        "children": children,
+        "default_left": np.concatenate(parts["default_left"]).astype(bool),
+        "roots": np.array(roots, dtype=np.int32),
+        "values": np.concatenate(parts["values"]),
+        "tree_class": np.zeros(len(roots), dtype=np.int32),
+    }
+    meta = {
+        "kind": "forest",
+        "n_classes": int(forest.n_classes_),
+        "n_features": int(forest.n_features_in_),
+        "depth": _depth(children, arrays["roots"]),
+    }
+    return TreeEnsemble(arrays, meta)
+
+
+def export_xgboost(model):
+    """Flat arrays for a fitted XGBClassifier (``multi:softprob`` or ``binary:logistic``)."""
+    learner = json.loads(model.get_booster().save_raw(raw_format="json"))["learner"]
+    objective = learner["objective"]["name"]
+    if objective not in ("multi:softprob", "binary:logistic"):
+        raise ValueError(f"Unsupported XGBoost objective {objective}")
+    booster = learner["gradient_booster"]
+    if booster["name"] != "gbtree":
+        raise ValueError(f"Unsupported XGBoost booster {booster['name']}")
+    trees = booster["model"]["trees"]
+    tree_info = booster["model"]["tree_info"]
+    best_iteration = getattr(model, "best_iteration", None)
+    if best_iteration is not None and "iteration_indptr" in booster["model"]:
+        # Early-stopped models predict with the trees up to the best round only
+        last = booster["model"]["iteration_indptr"][best_iteration + 1]
+        trees, tree_info = trees[:last], tree_info[:last]
+    parts = {name: [] for name in ("feature", "threshold", "left", "right", "default_left", "values")}
+    roots, offset = [], 0
+    for tree in trees:
+        if any(tree["split_type"]):
+            raise ValueError("Categorical splits are not supported")
+        left = np.array(tree["left_children"], dtype=np.int64)
+        right = np.array(tree["right_children"], dtype=np.int64)
+        conditions = np.array(tree["split_conditions"], dtype=np.float32)
+        leaves = left < 0
+        parts["feature"].append(np.where(leaves, 0, tree["split_indices"]))
+        parts["threshold"].append(conditions)
+        parts["left"].append(np.where(leaves, -1, left + offset))
+        parts["right"].append(np.where(leaves, -1, right + offset))
+        parts["default_left"].append(tree["default_left"])
+        # A leaf's split condition is its value
+        parts["values"].append(np.where(leaves, conditions, np.float32(0)))
+        roots.append(offset)
+        offset += len(left)
+    children = _children(np.concatenate(parts["left"]), np.concatenate(parts["right"]))
+
+    params = learner["learner_model_param"]
+    n_classes = int(params["num_class"]) or 2
+    base_score = json.loads(params["base_score"].lower())
+    base_score = np.atleast_1d(np.asarray(base_score, dtype=np.float32))
+    if objective == "binary:logistic":
+        # Stored as a probability; predictions start from its logit
+        base_score = -np.log(np.float32(1) / base_score - np.float32(1))
+    arrays = {
+        "feature": np.concatenate(parts["feature"]).astype(np.int32),
+        "threshold": np.concatenate(parts["threshold"]).astype(np.float32),
+        "children": children,
+        "default_left": np.concatenate(parts["default_left"]).astype(bool),
+        "roots": np.array(roots, dtype=np.int32),
+        "values": np.concatenate(parts["values"]).astype(np.float32),
+        "tree_class": np.array(tree_info, dtype=np.int32),
+    }
+    meta = {
+        "kind": "xgboost",
+        "objective": objective,
+        "n_classes": n_classes,
+        "n_features": int(params["num_feature"]),
+        "depth": _depth(children, arrays["roots"]),
+        "base_margin": [float(value) for value in base_score],
+    }
+    return TreeEnsemble(arrays, meta)
+
+
+def export(estimator):
+    """Flat arrays for a supported tree model; raises ValueError for anything else."""
+    if hasattr(estimator, "get_booster"):
+        return export_xgboost(estimator)
+    members = getattr(estimator, "estimators_", None)
+    if members is not None and len(members) and hasattr(members[0], "tree_") and hasattr(estimator, "n_classes_"):
+        return export_forest(estimator)
+    raise ValueError(f"{type(estimator).__name__} is not a supported tree ensemble")
+
+
+def members(model):
+    """The ``(name, estimator)`` pairs whose probabilities ``model`` averages, and their weights.
+
+    Members of a soft-voting ensemble in the order VotingClassifier uses;
+    any other model is a single member named "model".
+    """
+    if getattr(model, "voting", None) == "soft" and hasattr(model, "estimators_"):
+        named = [(name, estimator) for name, estimator in model.estimators if estimator != "drop"]
+        weights = None
+        if model.weights is not None:
+            weights = [w for (_, estimator), w in zip(model.estimators, model.weights) if estimator != "drop"]
+        return [(name, fitted) for (name, _), fitted in zip(named, model.estimators_)], weights
+    return [("model", model)], None
+
+
+def verification_rows(flat, count, seed=0):
+    """Rows that land on, just below and just above the split thresholds of ``flat``."""
+    rng = np.random.default_rng(seed)
+    internal = ~flat.is_leaf
+    features = np.asarray(flat.feature)[internal]
+    thresholds = np.asarray(flat.threshold)[internal].astype(np.float32)
+    X = np.zeros((count, flat.meta["n_features"]), dtype=np.float32)
+    for f in range(X.shape[1]):
+        candidates = thresholds[features == f]
+        if not len(candidates):
+            continue
+        values = rng.choice(candidates, count)
+        step = rng.choice([-1, 0, 1], count)
+        X[:, f] = np.where(step < 0, np.nextafter(values, -np.inf), np.where(step > 0, np.nextafter(values, np.inf), values))
+    return X
@@ -0,0 +1,102 @@
+"""Per-request client overhead: fresh GenerativeModel vs the pooled clients.
+
+Runs against a local stand-in for the Gemini REST API, so no key or network
+is needed:
+
+    cd backend && python benchmarks/bench_client_pool.py --requests 500
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import google.generativeai as genai  # noqa: E402
+from google.generativeai import client as genai_client  # noqa: E402
+
+from backends import LLM_POOL_SIZE, GeminiBackend  # noqa: E402
+
+MODEL = "gemini-2.5-flash"
+GENERATE_BODY = json.dumps({
+    "candidates": [{
+        "content": {"parts": [{"text": "Water looks safe."}], "role": "model"},
+        "finishReason": "STOP",
+        "index": 0,
+    }]
+}).encode()
+COUNT_BODY = json.dumps({"totalTokens": 2}).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = COUNT_BODY if self.path.endswith(":countTokens") else GENERATE_BODY
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def fresh_client(prompt):
+    model = genai.GenerativeModel(MODEL)
+    model._client = genai_client._client_manager.make_client("generative")
+    return model.generate_content(prompt).text
+
+
+def fresh_model(prompt):
+    return genai.GenerativeModel(MODEL).generate_content(prompt).text
+
+
+backend = None
+
+
+def pooled(prompt):
+    return backend.generate(prompt)
+
+
+def run(label, fn, n):
+    fn("warm-up")
+    start = time.perf_counter()
+    for _ in range(n):
+        fn("Is boiled water safe?")
+    elapsed = time.perf_counter() - start
+    print(f"{label:<14} {elapsed / n * 1e3:8.3f} ms/request")
+
+
+def main():
+    global backend
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--pool-size", type=int, default=LLM_POOL_SIZE)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["GEMINI_API_KEY"] = "bench"
+    os.environ["GEMINI_TRANSPORT"] = "rest"
+    backend = GeminiBackend(
+        MODEL,
+        args.pool_size,
+        client_options={"api_endpoint": f"http://127.0.0.1:{server.server_port}"},
+    )
+    backend.warm_up()
+
+    run("fresh client", fresh_client, args.requests)
+    run("fresh model", fresh_model, args.requests)
+    run("pooled", pooled, args.requests)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Readings per second for the E. coli estimate: scalar loop against the NumPy batch version.
+
+Also times the /ecoli/batch body paths (columnar JSON and binary float64),
+checks the batch results against the scalar ones, and times the Monte Carlo
+uncertainty bands with the default and a small memory bound:
+
+    cd backend && python benchmarks/bench_ecoli.py --readings 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import orjson
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import ecoli  # noqa: E402
+
+
+def readings(n, seed):
+    rng = np.random.default_rng(seed)
+    return [
+        rng.uniform(5.5, 9.5, n),  # pH
+        rng.uniform(10, 38, n),  # temperature
+        rng.gamma(1.5, 3.0, n),  # turbidity
+        rng.exponential(4.0, n),  # rainfall
+        rng.uniform(1.2, 2.8, n),  # season factor
+    ]
+
+
+def best_of(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readings", type=int, default=1_000_000)
+    parser.add_argument("--python-readings", type=int, default=200_000, help="readings for the scalar loop")
+    parser.add_argument("--band-readings", type=int, default=5_000, help="readings for the uncertainty bands")
+    parser.add_argument("--draws", type=int, default=ecoli.ECOLI_MC_DRAWS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    columns = readings(args.readings, args.seed)
+    subset = [column[: args.python_readings].tolist() for column in columns]
+
+    seconds, expected = best_of(
+        max(1, args.repeat // 2), lambda: [ecoli.estimate_ecoli(*row) for row in zip(*subset)]
+    )
+    python_rate = len(expected) / seconds
+    print(f"python loop   {len(expected):>10} readings  {seconds * 1e3:9.1f} ms  {python_rate:>14,.0f} readings/s")
+
+    seconds, estimates = best_of(args.repeat, lambda: ecoli.estimate_ecoli_batch(*columns))
+    numpy_rate = args.readings / seconds
+    print(
+        f"numpy batch   {args.readings:>10} readings  {seconds * 1e3:9.1f} ms  {numpy_rate:>14,.0f} readings/s"
+        f"  ({numpy_rate / python_rate:.0f}x)"
+    )
+
+    got = estimates[: len(expected)]
+    expected = np.array(expected)
+    identical = np.count_nonzero(got == expected)
+    relative = np.max(np.abs(got - expected) / expected)
+    print(f"agreement     {identical}/{len(expected)} bit-identical, max relative difference {relative:.1e}")
+
+    json_body = orjson.dumps(dict(zip(ecoli.COLUMNS, columns)), option=orjson.OPT_SERIALIZE_NUMPY)
+    binary_body = np.stack(columns).astype("<f8").tobytes()
+    for name, body, binary in (("json body", json_body, False), ("binary body", binary_body, True)):
+        seconds, _ = best_of(args.repeat, lambda: ecoli.estimate_body(body, binary))
+        print(
+            f"{name:<13} {len(body) / 1e6:>8.1f} MB  {seconds * 1e3:9.1f} ms  "
+            f"{args.readings / seconds:>14,.0f} readings/s"
+        )
+
+    subset = [column[: args.band_readings] for column in columns]
+    samples = args.band_readings * args.draws
+    bands = {}
+    for name, max_bytes in (("bands", ecoli.ECOLI_MC_MAX_BYTES), ("bands 8 MB", 8 * 1024 * 1024)):
+        seconds, bands[name] = best_of(
+            max(1, args.repeat // 2),
+            lambda: ecoli.estimate_ecoli_bands(*subset, draws=args.draws, seed=args.seed, max_bytes=max_bytes),
+        )
+        print(
+            f"{name:<13} {args.band_readings:>10} x {args.draws} draws  {seconds * 1e3:9.1f} ms  "
+            f"{args.band_readings / seconds:>14,.0f} readings/s  {samples / seconds:>14,.0f} draws/s"
+        )
+    same = all(np.array_equal(bands["bands"], other) for other in bands.values())
+    print(f"reproducible  same bands for the same seed under both memory bounds: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Serialization time and bytes on the wire for /analyze and /analyze/batch bodies.
+
+Compares the stock FastAPI path (jsonable_encoder + JSONResponse) with
+orjson and msgpack, and the body sizes after gzip and brotli:
+
+    cd backend && python benchmarks/bench_encoding.py --batch 1000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+import encoding  # noqa: E402
+import rules  # noqa: E402
+
+WORDS = (
+    "turbidity coliform chlorination boil source well handpump monsoon runoff sewage filtration "
+    "residual dose infants diarrhoea cholera typhoid hepatitis settle alum sediment retest storage "
+    "container clean village panchayat health worker advisory safe unsafe limit exceeds within the "
+    "a of and to for is be should water sample reading level treatment recommended"
+).split()
+
+
+def analysis_result(rnd, words):
+    parameters = {
+        "pH": round(rnd.uniform(5.5, 9.5), 2),
+        "turbidity": round(rnd.uniform(0, 12), 1),
+        "tds": rnd.randint(80, 1500),
+        "nitrate": round(rnd.uniform(0, 80), 1),
+        "fluoride": round(rnd.uniform(0, 2.5), 2),
+        "e_coli": rnd.choice([0, 0, 0, 2, 9]),
+        "temperature": round(rnd.uniform(18, 34), 1),
+    }
+    text = " ".join(rnd.choice(WORDS) for _ in range(words))
+    return {
+        "analysis": text,
+        "assessment": rules.assess(parameters),
+        "source": "llm",
+        "timestamp": "2024-03-01T10:15:00.000000",
+    }
+
+
+def stock(payload):
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def orjson_encoded(payload):
+    # What default_response_class=NegotiatedResponse does for a returned dict.
+    return encoding.NegotiatedResponse(jsonable_encoder(payload)).body
+
+
+def orjson_direct(payload):
+    return encoding.NegotiatedResponse(payload).body
+
+
+def msgpack_direct(payload):
+    token = encoding._wants_msgpack.set(True)
+    try:
+        return encoding.NegotiatedResponse(payload).body
+    finally:
+        encoding._wants_msgpack.reset(token)
+
+
+def timed(fn, arg, repeat):
+    fn(arg)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(arg)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def report(label, payload, repeat):
+    print(f"\n{label}")
+    print(f"  {'encoder':<26} {'encode ms':>10} {'bytes':>10} {'gzip':>10} {'br':>10} {'gzip ms':>8} {'br ms':>8}")
+    for name, fn in (
+        ("jsonable_encoder + json", stock),
+        ("jsonable_encoder + orjson", orjson_encoded),
+        ("orjson", orjson_direct),
+        ("msgpack", msgpack_direct),
+    ):
+        seconds, body = timed(fn, payload, repeat)
+        gzip_seconds, gzipped = timed(lambda b: encoding.compress(b, "gzip"), body, max(1, repeat // 10))
+        br_seconds, brotlied = timed(lambda b: encoding.compress(b, "br"), body, max(1, repeat // 10))
+        print(
+            f"  {name:<26} {seconds * 1e3:10.3f} {len(body):10d} {len(gzipped):10d} {len(brotlied):10d} "
+            f"{gzip_seconds * 1e3:8.3f} {br_seconds * 1e3:8.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--words", type=int, default=600, help="words per analysis text")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    single = analysis_result(rnd, args.words)
+    batch = {
+        "results": [{"index": i, **analysis_result(rnd, args.words)} for i in range(args.batch)],
+        "timestamp": "2024-03-01T10:15:00.000000",
+    }
+    report("single /analyze response", single, args.repeat * 20)
+    report(f"/analyze/batch response, {args.batch} samples", batch, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Tail latency of /analyze-style Gemini calls with and without hedging.
+
+Uses the stand-in backend with heavy-tailed latency: lognormal around
+--median, with a --tail-rate share of calls taking --tail-factor times longer.
+
+    cd backend && python benchmarks/bench_hedging.py --requests 600
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+# Losing hedges keep their thread until the stand-in returns, as real calls do.
+os.environ.setdefault("LLM_CONCURRENCY", "64")
+
+import numpy as np  # noqa: E402
+
+import hedging  # noqa: E402
+import llm  # noqa: E402
+from backends import StandInBackend  # noqa: E402
+from metrics import LatencyTracker  # noqa: E402
+
+
+async def run(args, hedge):
+    hedging.LLM_HEDGE = hedge
+    llm.upstream_latency = LatencyTracker()
+    llm.retry_budget = hedging.RetryBudget(args.budget_ratio, 10)
+    llm.hedge_stats = hedging.HedgeStats()
+    backend = llm.get_backend()
+    backend.calls = 0
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await llm.generate(f"sample {i} {hedge}")
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e3
+    print(
+        f"{'hedged' if hedge else 'plain':<7} p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  p99 {p99:7.1f} ms  "
+        f"upstream calls {backend.calls}  hedges {llm.hedge_stats.fired} (won {llm.hedge_stats.won})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--median", type=float, default=0.02)
+    parser.add_argument("--tail-rate", type=float, default=0.03)
+    parser.add_argument("--tail-factor", type=float, default=25)
+    parser.add_argument("--budget-ratio", type=float, default=0.1)
+    args = parser.parse_args()
+
+    hedging.LLM_HEDGE_MIN_DELAY = 0
+    llm.init_backend(StandInBackend(
+        "stand-in",
+        median=args.median,
+        spread=0.3,
+        tail_rate=args.tail_rate,
+        tail_factor=args.tail_factor,
+        tokens_per_second=0,
+        output_tokens=0,
+        seed=0,
+    ))
+    asyncio.run(run(args, hedge=False))
+    asyncio.run(run(args, hedge=True))
+    llm.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Latency and throughput of /predict-style risk predictions with and without micro-batching.
+
+Trains a synthetic stand-in for ml-models/ (a soft-voting ensemble of an
+MLP, a random forest and XGBoost behind a StandardScaler, on readings
+labelled with the E. coli estimate and dissolved oxygen) unless --model
+points at real model files, and exports its tree members to flat arrays.
+Then --clients concurrent clients each send single readings through
+predict.MicroBatcher, with the pickled members and with the flat arrays.
+Needs scikit-learn and xgboost:
+
+    cd backend && python benchmarks/bench_predict.py --clients 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tools"))
+
+import numpy as np  # noqa: E402
+
+import ecoli  # noqa: E402
+import export_trees  # noqa: E402
+import predict  # noqa: E402
+
+
+def synthetic_readings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.uniform(5.5, 9.5, n),  # pH
+        rng.uniform(10, 38, n),  # temperature
+        rng.gamma(1.5, 3.0, n),  # turbidity
+        rng.uniform(2, 10, n),  # dissolved oxygen
+        rng.exponential(4.0, n),  # rainfall
+    ])
+
+
+def build_synthetic_model(path, samples=20000, trees=100, seed=0):
+    """Write ensemble_model.pkl, preprocessing.pkl and model_config.json to ``path``."""
+    import joblib
+    from sklearn.ensemble import RandomForestClassifier, VotingClassifier
+    from sklearn.neural_network import MLPClassifier
+    from sklearn.preprocessing import StandardScaler
+    from xgboost import XGBClassifier
+
+    X = synthetic_readings(samples, seed)
+    ph, temperature, turbidity, oxygen, rainfall = X.T
+    score = np.log(ecoli.estimate_ecoli_batch(ph, temperature, turbidity, rainfall, 1.5)) - 0.3 * oxygen
+    score += np.random.default_rng(seed + 1).normal(0, 0.5, samples)
+    y = np.digitize(score, np.quantile(score, [0.4, 0.7, 0.9]))
+
+    scaler = StandardScaler().fit(X)
+    ensemble = VotingClassifier(
+        [
+            ("ann", MLPClassifier((32, 16), max_iter=300, random_state=seed)),
+            ("random_forest", RandomForestClassifier(trees, max_depth=12, random_state=seed)),
+            ("xgboost", XGBClassifier(n_estimators=trees, max_depth=6, learning_rate=0.1, random_state=seed)),
+        ],
+        voting="soft",
+    ).fit(scaler.transform(X), y)
+
+    os.makedirs(path, exist_ok=True)
+    joblib.dump(scaler, os.path.join(path, "preprocessing.pkl"))
+    joblib.dump(ensemble, os.path.join(path, "ensemble_model.pkl"))
+    with open(os.path.join(path, "model_config.json"), "w") as f:
+        json.dump({"features": list(predict.DEFAULT_FEATURES), "classes": list(predict.RISK_CLASSES)}, f, indent=1)
+
+
+async def run(model, readings, args, max_batch, label):
+    batcher = predict.MicroBatcher(model.predict_proba, max_batch=max_batch, max_wait=args.max_wait_ms / 1e3)
+    batcher.start()
+    latencies = []
+
+    async def client(offset):
+        for i in range(args.requests):
+            row = readings[(offset * args.requests + i) % len(readings)][None, :]
+            start = time.perf_counter()
+            await batcher.submit(row)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    await batcher.stop()
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+    label = f"{label} {'unbatched' if max_batch == 1 else f'batch<={max_batch}'}"
+    print(
+        f"{label:<22} {len(latencies) / elapsed:>9,.0f} predictions/s  p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  "
+        f"mean batch {batcher.rows / batcher.batches:6.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="directory with real model files; default trains a synthetic one")
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=50, help="sequential requests per client")
+    parser.add_argument("--max-batch", type=int, default=predict.PREDICT_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=predict.PREDICT_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.model or tmp
+        if not args.model:
+            build_synthetic_model(path)
+            export_trees.export(path, rows=20000)
+        readings = synthetic_readings(4096, seed=1)
+        results = {}
+        for label, flat in (("pickled", False), ("flat", True)):
+            predict.RISK_FLAT_TREES = flat
+            model = predict.RiskModel()
+            if not model.load(path):
+                sys.exit(model.error)
+            print(f"{label} model loaded in {model.load_seconds * 1e3:.0f} ms, flat members {sorted(model.flat)}")
+            results[label] = model.predict_proba(readings)
+            for rows in (1, args.max_batch):
+                start = time.perf_counter()
+                for _ in range(20):
+                    model.predict_proba(readings[:rows])
+                seconds = (time.perf_counter() - start) / 20
+                print(
+                    f"{label + ' direct call':<22} {rows:>4} rows  {seconds * 1e3:7.2f} ms  "
+                    f"{rows / seconds:>9,.0f} predictions/s"
+                )
+            for max_batch in (1, args.max_batch):
+                asyncio.run(run(model, readings, args, max_batch, label))
+        print(f"pickled and flat probabilities bit-identical: {np.array_equal(results['pickled'], results['flat'])}")
+
+
+if __name__ == "__main__":
+    main()
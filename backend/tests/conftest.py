@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its settings at import time: a local stand-in instead of
+# Gemini, and every on-disk store in a scratch directory
+_scratch = tempfile.mkdtemp(prefix="aarogyajal-tests-")
+os.environ.update(
+    LLM_BACKEND="standin",
+    STANDIN_MEDIAN="0.01",
+    STANDIN_SPREAD="0",
+    STANDIN_TOKENS_PER_SECOND="0",
+    LLM_WARMUP="0",
+    RESULT_STORE_PATH=os.path.join(_scratch, "results.sqlite3"),
+    QUOTA_DB_PATH=os.path.join(_scratch, "quota.sqlite3"),
+    JOBS_DB_PATH=os.path.join(_scratch, "jobs.sqlite3"),
+    SEMANTIC_CACHE_PATH=os.path.join(_scratch, "faq_cache.npz"),
+    RISK_MODEL_PATH=os.path.join(_scratch, "no-model"),
+)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    import app
+
+    with TestClient(app.app) as test_client:
+        yield test_client
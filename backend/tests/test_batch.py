@@ -0,0 +1,58 @@
+def test_samples_either_side_of_a_limit_are_not_merged(client):
+    # 8.46 and 8.54 round to the same 0.1 step, but only 8.54 is over the 6.5-8.5 pH limit
+    response = client.post("/analyze/batch", json={"samples": [
+        {"parameters": {"pH": 8.46}},
+        {"parameters": {"pH": 8.54}},
+    ]})
+    assert response.status_code == 200
+    first, second = response.json()["results"]
+    assert first["assessment"]["parameters"]["ph"]["value"] == 8.46
+    assert first["assessment"]["overall"] == "safe"
+    assert second["assessment"]["parameters"]["ph"]["value"] == 8.54
+    assert second["assessment"]["overall"] == "unsafe"
+
+
+def test_narrative_sample_is_not_answered_by_a_rules_only_twin(client):
+    response = client.post("/analyze/batch", json={"samples": [
+        {"parameters": {"pH": 7.2}},
+        {"parameters": {"pH": 7.2}, "narrative": True},
+    ]})
+    first, second = response.json()["results"]
+    assert first["source"] == "rules"
+    assert second["source"] == "llm"
+
+
+def test_identical_samples_are_analyzed_once():
+    import asyncio
+
+    import batch
+    from app import AnalysisRequest
+
+    calls = []
+
+    async def analyze_one(sample):
+        calls.append(sample)
+        return {"analysis": "ok"}
+
+    samples = [AnalysisRequest(parameters={"pH": 7.2})] * 3 + [AnalysisRequest(parameters={"pH": 7.21})]
+    results = asyncio.run(batch.analyze_all(samples, analyze_one))
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert len(calls) == 2
+
+
+def test_packed_samples_degrade_while_the_circuit_is_open(client):
+    import llm
+    from breaker import CLOSED, OPEN
+
+    samples = [{"parameters": {"pH": 7.2}, "narrative": True, "notes": f"packed circuit test {i}"} for i in range(3)]
+    llm.breaker._transition(OPEN)
+    try:
+        response = client.post("/analyze/batch", json={"samples": samples, "pack": True})
+    finally:
+        llm.breaker._transition(CLOSED)
+    assert response.status_code == 200
+    for result in response.json()["results"]:
+        assert "error" not in result
+        assert result["degraded"] is True
+        assert result["degraded_reason"] == "circuit_open"
+        assert result["source"] == "rules"
@@ -0,0 +1,30 @@
+from cache import analysis_key
+from routing import usage
+
+
+def request(**parameters):
+    from app import AnalysisRequest
+
+    return AnalysisRequest(parameters=parameters, narrative=True, notes="cache key test")
+
+
+def test_readings_either_side_of_a_limit_get_different_keys():
+    # Both round to 8.5, but only 8.54 is over the 6.5-8.5 pH limit
+    assert analysis_key(request(pH=8.46)) != analysis_key(request(pH=8.54))
+
+
+def test_nearby_readings_on_the_same_side_share_a_key():
+    assert analysis_key(request(pH=7.21)) == analysis_key(request(pH=7.24))
+
+
+def test_a_narrative_is_not_reused_across_a_limit(client):
+    calls = lambda: sum(tier.calls for tier in usage.tiers.values())  # noqa: E731
+    sample = {"narrative": True, "notes": "cache limit test"}
+    safe = client.post("/analyze", json={**sample, "parameters": {"pH": 8.46}}).json()
+    before = calls()
+    unsafe = client.post("/analyze", json={**sample, "parameters": {"pH": 8.54}}).json()
+    assert safe["assessment"]["overall"] == "safe"
+    assert unsafe["assessment"]["overall"] == "unsafe"
+    assert unsafe["source"] == "llm"
+    # Gemini wrote a narrative for the unsafe reading instead of the safe one's being replayed
+    assert calls() - before == 1
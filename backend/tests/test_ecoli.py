@@ -0,0 +1,91 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import ecoli
+
+
+def readings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        rng.uniform(5.5, 9.5, n),
+        rng.uniform(10, 38, n),
+        rng.gamma(1.5, 3.0, n),
+        rng.exponential(4.0, n),
+        rng.uniform(1.2, 2.8, n),
+    ]
+
+
+@pytest.mark.parametrize("readings_per_chunk", [1, 7, 1000, 3000])
+def test_seeded_bands_do_not_depend_on_the_chunk_size(readings_per_chunk):
+    columns = readings(2500)
+    expected = ecoli.estimate_ecoli_bands(*columns, draws=200, seed=42)
+    got = ecoli.estimate_ecoli_bands(*columns, draws=200, seed=42, max_bytes=(4 + 5 * readings_per_chunk) * 8 * 200)
+    assert np.array_equal(expected, got)
+
+
+@pytest.mark.parametrize("draws, n", [(20000, 1000), (100000, 200)])
+def test_memory_stays_within_max_bytes(draws, n):
+    columns = readings(n)
+    max_bytes = 16 * 1024 * 1024
+    tracemalloc.start()
+    try:
+        ecoli.estimate_ecoli_bands(*columns, draws=draws, seed=1, max_bytes=max_bytes)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < max_bytes * 1.1
+
+
+def test_draws_that_do_not_fit_one_reading_are_rejected():
+    with pytest.raises(ecoli.TooManyReadings):
+        ecoli.estimate_ecoli_bands(*readings(3), draws=100000, seed=1, max_bytes=1024 * 1024)
+
+
+def test_estimates_past_the_queue_limit_are_shed():
+    import asyncio
+    import threading
+
+    runner = ecoli.Runner(threads=1, max_queue=1)
+    release = threading.Event()
+
+    async def run():
+        held = [asyncio.ensure_future(runner.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(ecoli.Busy):
+            await runner.run(release.wait)
+        release.set()
+        await asyncio.gather(*held)
+        # Places come back once the work is done
+        assert await runner.run(lambda: 42) == 42
+
+    try:
+        asyncio.run(run())
+    finally:
+        release.set()
+        runner.shutdown()
+    assert runner.shed == 1
+
+
+
+def test_a_full_runner_answers_503(client, monkeypatch):
+    runner = ecoli.Runner(threads=1, max_queue=0)
+    monkeypatch.setattr(ecoli, "runner", runner)
+    # An uncertainty run already holds the only place
+    runner._places.acquire()
+    try:
+        body = {"ph": [7.0], "temperature": [25], "turbidity": [2], "rainfall": [1], "season_factor": 1}
+        response = client.post("/ecoli/batch?uncertainty=true&draws=100", json=body)
+    finally:
+        runner._places.release()
+        runner.shutdown()
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_a_body_of_single_numbers_is_rejected(client):
+    body = {"ph": 7.0, "temperature": 25, "turbidity": 2, "rainfall": 1, "season_factor": 1}
+    response = client.post("/ecoli/batch", json=body)
+    assert response.status_code == 422
+    assert "only season_factor" in response.json()["detail"]
@@ -0,0 +1,104 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import jobs
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:9/hook",
+    "http://localhost/hook",
+    "http://10.0.0.5/hook",
+    "http://192.168.1.1/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]/hook",
+    "http://[::ffff:127.0.0.1]/hook",
+    "file:///etc/passwd",
+])
+def test_webhooks_to_non_public_addresses_are_refused(url):
+    with pytest.raises(jobs.WebhookRejected):
+        jobs._post(url, b"{}")
+
+
+def test_allowed_hosts_may_be_private(monkeypatch):
+    received = []
+
+    class Receiver(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Receiver)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        monkeypatch.setattr(jobs, "JOBS_WEBHOOK_ALLOW_HOSTS", {"127.0.0.1"})
+        assert jobs._post(f"http://127.0.0.1:{server.server_port}/hook", b'{"ok": true}') == 204
+    finally:
+        server.shutdown()
+    assert received == [{"ok": True}]
+
+
+def test_a_job_whose_worker_keeps_dying_fails_at_max_attempts(tmp_path):
+    # A zero lease makes every claimed job look abandoned at once
+    queue = jobs.JobQueue(str(tmp_path / "jobs.sqlite3"), lease=0, max_attempts=2)
+    job = queue.submit("analyze", {}, callback_url="https://example.com/hook")
+    assert queue.claim()["id"] == job["job_id"]
+    assert queue.claim()["id"] == job["job_id"]
+    assert queue.claim() is None
+    row = queue._row(job["job_id"])
+    assert row["status"] == jobs.FAILED
+    assert row["attempts"] == 2
+    assert row["webhook"] == "pending"
+    assert queue.stale_webhooks() == [job["job_id"]]
+    assert queue.failed == 1
+
+
+def test_webhooks_are_posted_off_the_default_executor(tmp_path, monkeypatch):
+    import asyncio
+
+    threads = []
+    monkeypatch.setattr(jobs, "_post", lambda url, body: threads.append(threading.current_thread().name))
+    queue = jobs.JobQueue(str(tmp_path / "jobs.sqlite3"))
+    job = queue.submit("analyze", {}, callback_url="https://example.com/hook")
+    queue.complete(job["job_id"], {"ok": True})
+    asyncio.run(queue._deliver(job["job_id"]))
+    assert queue.get(job["job_id"])["webhook"] == "delivered"
+    assert threads and threads[0].startswith("webhook")
+
+
+def test_submitting_from_a_thread_wakes_the_workers_safely(tmp_path):
+    import asyncio
+
+    queue = jobs.JobQueue(str(tmp_path / "jobs.sqlite3"))
+    errors = []
+
+    async def run():
+        # Debug mode rejects Event.set from another thread
+        asyncio.get_running_loop().set_debug(True)
+        queue.start({}, workers=0)
+        # Stands in for an idle worker
+        woken = asyncio.ensure_future(queue._wake.wait())
+        await asyncio.sleep(0)
+        try:
+            # As /analyze/async does
+            await asyncio.to_thread(queue.submit, "analyze", {})
+        except RuntimeError as e:
+            # The waiter can never finish now; leave it to loop.close()
+            errors.append(e)
+            return
+        await asyncio.wait_for(woken, 1)
+        await queue.stop()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
+    assert errors == []
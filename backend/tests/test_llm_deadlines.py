@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+import llm
+from admission import controller as admission
+from backends import StandInBackend
+from breaker import CLOSED, CircuitBreaker
+
+
+def stand_in(median):
+    return StandInBackend("test", latency="fixed", median=median, tokens_per_second=0, output_tokens=10)
+
+
+def test_the_stand_in_gives_up_at_its_timeout():
+    start = time.monotonic()
+    with pytest.raises(api_exceptions.DeadlineExceeded):
+        stand_in(5).generate("slow", timeout=0.1)
+    assert time.monotonic() - start < 1
+
+
+def test_abandoned_calls_do_not_starve_admitted_ones(monkeypatch):
+    monkeypatch.setattr(llm, "_backends", {"slow": stand_in(3), "fast": stand_in(0.01)})
+    monkeypatch.setattr(llm, "breaker", CircuitBreaker("test", failure_threshold=10 * admission.slots))
+
+    async def run():
+        # As many timed-out calls as there are slots, all abandoned at once
+        slow = [llm._generate(f"slow {i}", 0.2, None, "slow") for i in range(admission.slots)]
+        results = await asyncio.gather(*slow, return_exceptions=True)
+        assert all(isinstance(r, (asyncio.TimeoutError, api_exceptions.DeadlineExceeded)) for r in results)
+        assert admission.available == admission.slots
+        return await llm._generate("fast", 1.0, None, "fast")
+
+    assert asyncio.run(run())
+    assert llm.breaker.state == CLOSED
@@ -0,0 +1,58 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import llm
+from admission import CLASS_NAMES, CRITICAL, ROUTINE, AdmissionController, Overloaded, current_priority
+from backends import StandInBackend
+from quota import QuotaScheduler
+
+
+def stand_in():
+    return StandInBackend("test", latency="fixed", median=0.01, tokens_per_second=0, output_tokens=10)
+
+
+def test_waiting_for_quota_does_not_hold_a_slot(monkeypatch):
+    controller = AdmissionController(slots=1)
+    monkeypatch.setattr(llm, "admission", controller)
+    monkeypatch.setattr(llm, "_backends", {"test": stand_in()})
+
+    async def run():
+        granted = asyncio.Event()
+
+        async def acquire_quota(prompt, deadline, max_output_tokens=None):
+            if prompt == "routine":
+                await granted.wait()
+            return 1
+
+        monkeypatch.setattr(llm, "_acquire_quota", acquire_quota)
+        current_priority.set(ROUTINE)
+        routine = asyncio.ensure_future(llm._attempt("routine", None, None, "test"))
+        await asyncio.sleep(0.05)
+        assert controller.available == 1
+        current_priority.set(CRITICAL)
+        assert await asyncio.wait_for(llm._attempt("critical", None, None, "test"), 1)
+        granted.set()
+        assert await routine
+
+    asyncio.run(run())
+
+
+def test_quota_taken_for_a_shed_call_is_given_back(tmp_path, monkeypatch):
+    path = str(tmp_path / "quota.sqlite3")
+    # 100 tokens of capacity, refilling at one a second
+    monkeypatch.setattr(llm, "quota", QuotaScheduler(path=path, tpm=60, burst_seconds=100))
+    controller = AdmissionController(slots=1, queue_limits={priority: 0 for priority in CLASS_NAMES})
+    monkeypatch.setattr(llm, "admission", controller)
+    monkeypatch.setattr(llm, "_backends", {"test": stand_in()})
+
+    async def run():
+        await controller.acquire(ROUTINE)
+        with pytest.raises(Overloaded):
+            await llm._attempt("x" * 40, None, 10, "test")
+
+    asyncio.run(run())
+    with sqlite3.connect(path) as conn:
+        (tokens,) = conn.execute("SELECT tokens FROM buckets WHERE name = 'tokens'").fetchone()
+    assert tokens == pytest.approx(100, abs=0.5)
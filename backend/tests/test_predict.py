@@ -0,0 +1,46 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import predict
+
+pytest.importorskip("sklearn")
+
+
+def save_model(path, labels, config=None):
+    import joblib
+    from sklearn.linear_model import LogisticRegression
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(120, 5))
+    y = np.asarray(labels)[rng.integers(0, len(labels), 120)]
+    os.makedirs(path, exist_ok=True)
+    joblib.dump(LogisticRegression(max_iter=200).fit(X, y), os.path.join(path, "ensemble_model.pkl"))
+    if config is not None:
+        with open(os.path.join(path, "model_config.json"), "w") as f:
+            json.dump(config, f)
+
+
+def test_class_names_come_from_the_model_without_a_config(tmp_path):
+    save_model(str(tmp_path), ["Low", "High", "Critical"])
+    model = predict.RiskModel()
+    assert model.load(str(tmp_path))
+    # In the order of the probability columns, not RISK_CLASSES'
+    assert model.classes == ("critical", "high", "low")
+
+
+def test_label_encoded_models_use_the_risk_classes(tmp_path):
+    save_model(str(tmp_path), [0, 1, 2, 3])
+    model = predict.RiskModel()
+    assert model.load(str(tmp_path))
+    assert model.classes == predict.RISK_CLASSES
+
+
+def test_a_class_count_that_does_not_match_the_model_fails_the_load(tmp_path):
+    save_model(str(tmp_path), [0, 1, 2], config={"classes": ["low", "medium", "high", "critical"]})
+    model = predict.RiskModel()
+    assert not model.load(str(tmp_path))
+    assert not model.loaded
+    assert "3 probability columns but 4 classes" in model.error
@@ -0,0 +1,80 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+import registry
+
+pytest.importorskip("sklearn")
+
+
+def save_model(path, seed):
+    import joblib
+    from sklearn.linear_model import LogisticRegression
+
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(80, 5))
+    y = rng.integers(0, 4, 80)
+    os.makedirs(path, exist_ok=True)
+    joblib.dump(LogisticRegression(max_iter=200).fit(X, y), os.path.join(path, "ensemble_model.pkl"))
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            return False
+        await asyncio.sleep(0.02)
+    return True
+
+
+def test_every_worker_follows_a_version_activated_on_one(tmp_path):
+    root = str(tmp_path)
+    save_model(os.path.join(root, "v1"), 1)
+    save_model(os.path.join(root, "v2"), 2)
+    registry.write_current(root, "v1")
+
+    async def run():
+        # Two workers: the admin request reaches only the first
+        first = registry.ModelRegistry(root=root, poll=0.05)
+        second = registry.ModelRegistry(root=root, poll=0.05)
+        for worker in (first, second):
+            await worker.refresh()
+            worker.start()
+        try:
+            assert second.current.version == "v1"
+            assert await first.reload("v2", force=True, publish=True)
+            assert await wait_for(lambda: second.current.version == "v2")
+        finally:
+            await first.stop()
+            await second.stop()
+
+    asyncio.run(run())
+
+
+def test_the_default_poll_is_on():
+    assert registry.RISK_MODEL_POLL_SECONDS > 0
+
+
+def test_an_unversioned_model_reloads_when_its_files_change(tmp_path):
+    path = str(tmp_path / "model")
+    save_model(path, 1)
+
+    async def run():
+        worker = registry.ModelRegistry(root="", path=path, poll=0.05)
+        await worker.refresh()
+        worker.start()
+        try:
+            old = worker.current
+            assert old.loaded
+            # An unchanged model is not loaded again
+            await asyncio.sleep(0.2)
+            assert worker.current is old
+            save_model(path, 2)
+            assert await wait_for(lambda: worker.current is not old)
+            assert worker.current.loaded
+        finally:
+            await worker.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from rules import MARGINAL, MISSING, OK, UNSAFE, assess, assess_array, canonical_name
+
+
+@pytest.mark.parametrize("name, value, status", [
+    # BIS gives pH one range: the acceptable limits are also the permissible ones
+    ("pH", 6.5, "acceptable"),
+    ("pH", 6.49, "unsafe"),
+    ("pH", 8.5, "acceptable"),
+    ("pH", 8.51, "unsafe"),
+    ("turbidity", 1, "acceptable"),
+    ("turbidity", 1.01, "permissible"),
+    ("turbidity", 5, "permissible"),
+    ("turbidity", 5.01, "unsafe"),
+    ("total_coliform", 0, "acceptable"),
+    ("total_coliform", 1, "unsafe"),
+    ("e_coli", 0, "acceptable"),
+    ("e_coli", 1, "unsafe"),
+])
+def test_limits_include_their_boundaries(name, value, status):
+    flag = assess({name: value})["parameters"][canonical_name(name)]
+    assert flag["status"] == status
+
+
+@pytest.mark.parametrize("raw, name", [
+    ("pH", "ph"),
+    ("P.H.", "ph"),
+    ("Turbidity (NTU)", "turbidity"),
+    ("E. coli", "e_coli"),
+    ("Faecal coliform", "e_coli"),
+    ("Coliforms", "total_coliform"),
+    ("DO [mg/L]", "dissolved_oxygen"),
+    ("Sulfate", "sulphate"),
+    ("Free chlorine", "residual_chlorine"),
+    ("Temp", "temperature"),
+])
+def test_canonical_names(raw, name):
+    assert canonical_name(raw) == name
+
+
+def test_aliases_are_assessed_under_the_canonical_name():
+    assessment = assess({"P.H.": 7.2, "Turbidity (NTU)": 0.5, "Coliforms": 0})
+    assert set(assessment["parameters"]) == {"ph", "turbidity", "total_coliform"}
+    assert assessment["overall"] == "safe"
+    assert not assessment["ambiguous"]
+
+
+@pytest.mark.parametrize("parameters, unrecognized", [
+    ({"pH": 7.2, "lead": 0.001}, ["lead"]),
+    ({"pH": 7.2, "turbidity": "clear"}, ["turbidity"]),
+    ({"pH": 7.2, "turbidity": float("nan")}, ["turbidity"]),
+    ({"pH": 7.2, "turbidity": True}, ["turbidity"]),
+])
+def test_readings_the_tables_do_not_cover_make_a_sample_ambiguous(parameters, unrecognized):
+    assessment = assess(parameters)
+    assert assessment["overall"] == "safe"
+    assert assessment["unrecognized"] == unrecognized
+    assert assessment["ambiguous"]
+
+
+def test_informational_readings_alone_are_ambiguous_but_not_unrecognized():
+    assessment = assess({"temperature": 25, "rainfall": 12})
+    assert assessment["overall"] == "unknown"
+    assert assessment["unrecognized"] == []
+    assert assessment["ambiguous"]
+
+
+def test_nan_readings_are_missing_in_assess_array():
+    status, overall = assess_array(
+        ["ph", "turbidity"],
+        [[7.0, np.nan], [np.nan, 3.0], [np.nan, np.nan], [5.0, np.nan]],
+    )
+    assert status.tolist() == [[OK, MISSING], [MISSING, MARGINAL], [MISSING, MISSING], [UNSAFE, MISSING]]
+    assert overall.tolist() == [OK, MARGINAL, MISSING, UNSAFE]
+
+
+def test_assess_array_takes_a_single_sample():
+    status, overall = assess_array(["ph", "turbidity"], [7.0, 6.0])
+    assert status.tolist() == [[OK, UNSAFE]]
+    assert overall.tolist() == [UNSAFE]
@@ -0,0 +1,76 @@
+import pytest
+
+from semantic_cache import SemanticCache, embed
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("Is water with pH 6 safe to drink?", "Is water with pH 9 safe to drink?"),
+    ("Is TDS 300 mg/l safe for drinking water?", "Is TDS 3000 mg/l safe for drinking water?"),
+    ("Is fluoride 2 mg/l in drinking water harmful?", "Is fluoride 0.2 mg/l in drinking water harmful?"),
+    ("How much chlorine should I add to 10 litres of water?", "How much chlorine should I add to 100 litres of water?"),
+])
+def test_a_different_reading_is_not_served_the_cached_answer(cached, asked):
+    cache = SemanticCache(capacity=8)
+    # The texts are close enough that similarity alone would serve the answer
+    assert float(embed(cached) @ embed(asked)) >= cache.threshold
+    cache.add(cached, "cached answer")
+    assert cache.lookup(asked) is None
+    assert cache.number_mismatches == 1
+
+
+def test_the_same_numbers_written_differently_still_hit():
+    cache = SemanticCache(capacity=8)
+    cache.add("Is water with pH 6 safe to drink?", "answer")
+    assert cache.lookup("is water with pH 6.0 safe to drink??") == "answer"
+    assert cache.lookup("Is TDS 3,000 mg/l safe?") is None
+
+
+def test_a_different_reading_gets_its_own_entry():
+    cache = SemanticCache(capacity=8)
+    cache.add("Is water with pH 6 safe to drink?", "pH 6 answer")
+    cache.add("Is water with pH 9 safe to drink?", "pH 9 answer")
+    assert len(cache) == 2
+    assert cache.lookup("Is water with pH 6 safe to drink?") == "pH 6 answer"
+    assert cache.lookup("Is water with pH 9 safe to drink?") == "pH 9 answer"
+
+
+def test_numbers_survive_save_and_load(tmp_path):
+    path = str(tmp_path / "cache.npz")
+    cache = SemanticCache(capacity=8)
+    cache.add("Is water with pH 6 safe to drink?", "answer")
+    cache.save(path)
+    loaded = SemanticCache(capacity=8)
+    loaded.load(path)
+    assert loaded.lookup("Is water with pH 9 safe to drink?") is None
+    assert loaded.lookup("Is water with pH 6 safe to drink?") == "answer"
+
+
+def test_concurrent_saves_do_not_share_a_temporary_file(tmp_path):
+    import threading
+
+    path = str(tmp_path / "cache.npz")
+    caches = []
+    for worker in range(4):
+        cache = SemanticCache(capacity=64)
+        for i in range(50):
+            cache.add(f"worker {worker} question {i}", "answer " * 200)
+        caches.append(cache)
+    threads = [threading.Thread(target=cache.save, args=(path,)) for cache in caches for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    loaded = SemanticCache(capacity=64)
+    loaded.load(path)
+    assert len(loaded) == 50
+    assert [p.name for p in tmp_path.iterdir()] == ["cache.npz"]
+
+
+def test_an_unreadable_cache_file_is_ignored(tmp_path):
+    path = tmp_path / "cache.npz"
+    path.write_bytes(b"PK\x03\x04 not really a zip file")
+    cache = SemanticCache(capacity=8)
+    cache.load(str(path))
+    assert len(cache) == 0
+    cache.add("Is water with pH 6 safe to drink?", "answer")
+    assert cache.lookup("Is water with pH 6 safe to drink?") == "answer"
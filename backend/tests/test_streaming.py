@@ -0,0 +1,61 @@
+import itertools
+
+import pytest
+
+import llm
+from admission import CHAT
+from admission import controller as admission
+from breaker import CLOSED, OPEN
+
+_questions = itertools.count()
+
+
+def question():
+    # A fresh question each time, so neither the FAQ cache nor the result store answers it
+    return f"What does a nitrate level of {next(_questions) + 11} mg/l mean for a village well?"
+
+
+@pytest.fixture
+def no_free_slots(monkeypatch):
+    monkeypatch.setattr(admission, "available", 0)
+    monkeypatch.setitem(admission.queue_limits, CHAT, 0)
+
+
+@pytest.fixture
+def open_circuit():
+    llm.breaker._transition(OPEN)
+    yield
+    llm.breaker._transition(CLOSED)
+
+
+@pytest.mark.parametrize("path", ["/chat", "/chat/stream"])
+def test_shed_load_is_503_before_any_event(client, no_free_slots, path):
+    response = client.post(path, json={"query": question()})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert "event:" not in response.text
+
+
+@pytest.mark.parametrize("path", ["/chat", "/chat/stream"])
+def test_open_circuit_is_503_before_any_event(client, open_circuit, path):
+    response = client.post(path, json={"query": question()})
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) > 0
+    assert "event:" not in response.text
+
+
+def test_stream_gives_its_slot_back(client):
+    free = admission.available
+    response = client.post("/chat/stream", json={"query": question()})
+    assert response.status_code == 200
+    assert "event: done" in response.text
+    assert admission.available == free
+
+
+def test_analyze_stream_falls_back_to_the_rules_when_the_circuit_is_open(client, open_circuit):
+    response = client.post("/analyze/stream", json={
+        "parameters": {"pH": 7.2}, "narrative": True, "notes": "circuit test",
+    })
+    assert response.status_code == 200
+    assert '"degraded_reason": "circuit_open"' in response.text
+    assert "event: done" in response.text
@@ -0,0 +1,27 @@
+import llm
+from routing import usage
+
+
+def upstream_calls():
+    return sum(tier.calls for tier in usage.tiers.values())
+
+
+def test_invalid_structured_completion_is_not_reused(client):
+    # The stand-in answers in prose, so every structured completion is invalid
+    sample = {"parameters": {"pH": 7.2}, "narrative": True, "format": "structured", "notes": "store test"}
+    before = upstream_calls()
+    for _ in range(3):
+        body = client.post("/analyze", json=sample).json()
+        assert body["degraded_reason"] == "invalid_output"
+    # Each request asked again instead of replaying the stored bad completion
+    assert upstream_calls() - before == 3
+
+
+def test_valid_completions_are_still_stored(client):
+    sample = {"parameters": {"pH": 7.2}, "narrative": True, "notes": "text store test"}
+    before = upstream_calls()
+    first = client.post("/analyze", json=sample).json()
+    second = client.post("/analyze", json=sample).json()
+    assert first["source"] == second["source"] == "llm"
+    assert upstream_calls() - before == 1
+    assert llm.results.stats()["entries"] >= 1
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import trees
+
+pytest.importorskip("sklearn")
+
+
+def fit_forest():
+    from sklearn.ensemble import RandomForestClassifier
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(400, 5)).astype(np.float32)
+    y = (X[:, 0] + rng.normal(scale=0.5, size=400) > 0).astype(int) + (X[:, 1] > 1)
+    X[rng.random(X.shape) < 0.1] = np.nan
+    return RandomForestClassifier(20, random_state=0).fit(X, y), X
+
+
+def test_a_ragged_forest_reaches_the_same_leaves_as_scikit_learn():
+    forest, X = fit_forest()
+    flat = trees.export(forest)
+    # Grown to purity, its leaves end at many depths
+    assert flat.ragged
+    expected = forest.apply(X).T + np.asarray(flat.roots)[:, None]
+    assert np.array_equal(flat.apply(X), expected)
+    assert np.array_equal(flat.predict_proba(X), forest.predict_proba(X))
+    # One row at a time too, where summing a single column could add pairwise
+    assert all(np.array_equal(flat.predict_proba(X[i:i + 1]), forest.predict_proba(X[i:i + 1])) for i in range(20))
+
+
+def test_batches_over_max_rows_go_to_the_original():
+    forest, X = fit_forest()
+    flat = trees.export(forest)
+    flat.max_rows = 16
+    calls = []
+
+    class Original:
+        def predict_proba(self, X):
+            calls.append(len(X))
+            return forest.predict_proba(X)
+
+    member = trees.Fallback(flat, Original())
+    assert np.array_equal(member.predict_proba(X[:16]), forest.predict_proba(X[:16]))
+    assert np.array_equal(member.predict_proba(X[:17]), forest.predict_proba(X[:17]))
+    assert calls == [17]
+
+
+def test_xgboost_margins_are_summed_in_tree_order_one_row_at_a_time():
+    xgboost = pytest.importorskip("xgboost")
+
+    forest, X = fit_forest()
+    y = forest.predict(X)
+    model = xgboost.XGBClassifier(n_estimators=60, max_depth=4, random_state=0).fit(X, y)
+    flat = trees.export(model)
+    assert not flat.ragged
+    for i in range(40):
+        assert np.array_equal(flat.predict_proba(X[i:i + 1]), model.predict_proba(X[i:i + 1]))
@@ -0,0 +1,103 @@
+"""Build the BM25 knowledge index used to ground Gemini prompts.
+
+Splits each markdown file in backend/knowledge into one passage per "##"
+section and writes memory-mappable arrays that app/knowledge.py loads:
+
+    cd backend && python tools/build_knowledge_index.py
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import knowledge  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def passages(path):
+    title, section, lines = None, None, []
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip()
+            if line.startswith("# "):
+                title = line[2:].strip()
+            elif line.startswith("## "):
+                if section and lines:
+                    yield title, f"{section}: {' '.join(lines)}"
+                section, lines = line[3:].strip(), []
+            elif line:
+                lines.append(line)
+    if section and lines:
+        yield title, f"{section}: {' '.join(lines)}"
+
+
+def build(corpus, output, k1, b):
+    sources, title_ids, texts = [], [], []
+    for path in sorted(glob.glob(os.path.join(corpus, "*.md"))):
+        for title, text in passages(path):
+            if title not in sources:
+                sources.append(title)
+            title_ids.append(sources.index(title))
+            texts.append(text)
+
+    terms = [Counter(knowledge.tokenize(text)) for text in texts]
+    lengths = np.array([sum(tf.values()) for tf in terms], dtype=np.float32)
+    average = float(lengths.mean())
+    vocab = {term: i for i, term in enumerate(sorted(set().union(*terms)))}
+
+    postings = [[] for _ in vocab]
+    for doc, tf in enumerate(terms):
+        for term, count in tf.items():
+            postings[vocab[term]].append((doc, count))
+
+    ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    docs, weights = [], []
+    for term_id, entries in enumerate(postings):
+        idf = math.log(1 + (len(texts) - len(entries) + 0.5) / (len(entries) + 0.5))
+        for doc, count in entries:
+            norm = count + k1 * (1 - b + b * lengths[doc] / average)
+            docs.append(doc)
+            weights.append(idf * count * (k1 + 1) / norm)
+        ptr[term_id + 1] = len(docs)
+
+    encoded = [text.encode() for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(text) for text in encoded])
+
+    os.makedirs(output, exist_ok=True)
+    np.save(os.path.join(output, "postings_ptr.npy"), ptr)
+    np.save(os.path.join(output, "postings_doc.npy"), np.array(docs, dtype=np.int32))
+    np.save(os.path.join(output, "postings_weight.npy"), np.array(weights, dtype=np.float32))
+    np.save(os.path.join(output, "text_offsets.npy"), offsets)
+    np.save(os.path.join(output, "titles.npy"), np.array(title_ids, dtype=np.int32))
+    with open(os.path.join(output, "passages.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    with open(os.path.join(output, "vocab.json"), "w") as f:
+        json.dump(vocab, f, separators=(",", ":"), sort_keys=True)
+    with open(os.path.join(output, "sources.json"), "w") as f:
+        json.dump(sources, f, indent=1)
+    return len(texts), len(vocab), len(docs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=os.path.join(HERE, "..", "knowledge"))
+    parser.add_argument("--output", default=knowledge.KNOWLEDGE_INDEX_PATH)
+    parser.add_argument("--k1", type=float, default=1.2)
+    parser.add_argument("--b", type=float, default=0.75)
+    args = parser.parse_args()
+
+    count, terms, entries = build(args.corpus, args.output, args.k1, args.b)
+    print(f"indexed {count} passages, {terms} terms, {entries} postings into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
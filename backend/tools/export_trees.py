@@ -0,0 +1,110 @@
+"""Export the tree members of the risk ensemble to flat arrays for /predict.
+
+Writes each random forest or XGBoost member of ml-models/ensemble_model.pkl
+to ml-models/trees/<member>/ and checks that its predictions are
+bit-identical to the original's on rows at and around every split threshold
+before listing it in trees/manifest.json. Each member is then timed against
+the original at growing batch sizes: the largest size at which the flat
+arrays still win is saved as its ``max_rows``, and a member they do not beat
+even one row at a time is not exported:
+
+    cd backend && python tools/export_trees.py
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import predict  # noqa: E402
+import trees  # noqa: E402
+
+
+# Batch sizes timed, up to the rows trees.TreeEnsemble traverses at once
+BATCH_SIZES = (1, 4, 16, 64, 256, 1024, trees.TREE_CHUNK_ROWS)
+
+
+def best_seconds(predict, X, calls):
+    predict(X)
+    best = float("inf")
+    for _ in range(calls):
+        start = time.perf_counter()
+        predict(X)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def crossover(flat, member, X):
+    """The largest of BATCH_SIZES at which ``flat`` beats ``member``: None if it wins at all of them, 0 at none."""
+    max_rows = 0
+    for size in BATCH_SIZES:
+        batch = np.resize(X, (size, X.shape[1]))
+        calls = max(5, 256 // size)
+        if best_seconds(flat.predict_proba, batch, calls) >= best_seconds(member.predict_proba, batch, calls):
+            return max_rows
+        max_rows = size
+    return None
+
+
+def export(models, rows, seed=0):
+    import joblib
+
+    model_path = os.path.join(models, "ensemble_model.pkl")
+    ensemble = joblib.load(model_path)
+    output = os.path.join(models, "trees")
+    shutil.rmtree(output, ignore_errors=True)
+
+    exported = []
+    for name, member in trees.members(ensemble)[0]:
+        try:
+            flat = trees.export(member)
+        except ValueError as e:
+            print(f"{name:<16} kept as is: {e}")
+            continue
+        X = trees.verification_rows(flat, rows, seed)
+        start = time.perf_counter()
+        expected = member.predict_proba(X)
+        original = time.perf_counter() - start
+        start = time.perf_counter()
+        got = flat.predict_proba(X)
+        elapsed = time.perf_counter() - start
+        if expected.dtype != got.dtype or not np.array_equal(expected, got):
+            mismatched = int(np.count_nonzero((expected != got).any(axis=1)))
+            print(f"{name:<16} NOT exported: {mismatched}/{rows} rows differ from the original")
+            continue
+        max_rows = crossover(flat, member, X)
+        if max_rows == 0:
+            print(f"{name:<16} kept as is: the original is faster even one row at a time")
+            continue
+        flat.meta["max_rows"] = flat.max_rows = max_rows
+        flat.save(os.path.join(output, name))
+        exported.append(name)
+        print(
+            f"{name:<16} {flat.kind:<8} {len(flat.roots):>5} trees {len(flat.feature):>8} nodes "
+            f"{flat.nbytes / 1e6:7.2f} MB  bit-identical on {rows} rows  "
+            f"{original * 1e3:8.1f} ms -> {elapsed * 1e3:7.1f} ms  "
+            f"faster up to {'any number of' if max_rows is None else max_rows} rows"
+        )
+
+    if exported:
+        with open(os.path.join(output, "manifest.json"), "w") as f:
+            json.dump({"model_sha256": predict.model_digest(model_path), "members": exported}, f, indent=1)
+    return exported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", default=predict.RISK_MODEL_PATH)
+    parser.add_argument("--rows", type=int, default=20000, help="verification rows per member")
+    args = parser.parse_args()
+    if not export(args.models, args.rows):
+        sys.exit("no tree members exported")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Add a risk model version to the registry that /predict serves from.
+
+Copies a model directory (ensemble_model.pkl, preprocessing.pkl,
+model_config.json) to RISK_MODEL_REGISTRY/<version>, re-saving the pickles
+uncompressed so workers can memory-map their arrays and exporting the tree
+members (see export_trees.py). The version appears in the registry in one
+rename. With --activate it also becomes CURRENT; workers switch to it on
+SIGHUP, on their next poll or on POST /admin/model:
+
+    cd backend && python tools/publish_model.py ../ml-models --registry ../model-registry --activate
+"""
+import argparse
+import os
+import shutil
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import export_trees  # noqa: E402
+import registry  # noqa: E402
+
+PICKLES = ("ensemble_model.pkl", "preprocessing.pkl")
+
+
+def publish(source, root, version, rows, activate=False):
+    import joblib
+
+    final = os.path.join(root, version)
+    if os.path.exists(final):
+        sys.exit(f"version {version} already exists in {root}")
+    os.makedirs(root, exist_ok=True)
+    staging = os.path.join(root, f".staging-{version}")
+    shutil.rmtree(staging, ignore_errors=True)
+    # Exported trees belong to the pickle they came from; they are made afresh
+    shutil.copytree(source, staging, ignore=shutil.ignore_patterns("trees", *PICKLES))
+    for name in PICKLES:
+        if os.path.exists(os.path.join(source, name)):
+            joblib.dump(joblib.load(os.path.join(source, name)), os.path.join(staging, name))
+    if rows:
+        export_trees.export(staging, rows)
+    os.rename(staging, final)
+    print(f"published {version} to {final}")
+    if activate:
+        registry.write_current(root, version)
+        print(f"{version} is now CURRENT")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="directory with the model files")
+    parser.add_argument("--registry", default=registry.RISK_MODEL_REGISTRY)
+    parser.add_argument("--version", default=datetime.now().strftime("%Y%m%d-%H%M%S"))
+    parser.add_argument("--rows", type=int, default=20000, help="tree export verification rows; 0 skips the export")
+    parser.add_argument("--activate", action="store_true", help="make the version CURRENT")
+    args = parser.parse_args()
+    if not args.registry:
+        sys.exit("set --registry or RISK_MODEL_REGISTRY")
+    if not registry.valid_version(args.version):
+        sys.exit(f"invalid version name {args.version!r}")
+    publish(args.source, args.registry, args.version, args.rows, args.activate)
+
+
+if __name__ == "__main__":
+    main()
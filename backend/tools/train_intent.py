@@ -0,0 +1,85 @@
+"""Train the /chat intent classifier from labelled examples.
+
+Fits a softmax regression over the hashed n-gram features in intent.py and
+writes the weights that the service loads at startup:
+
+    cd backend && python tools/train_intent.py
+"""
+import argparse
+import os
+import random
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import intent  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_examples(path):
+    examples = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                label, text = line.rstrip("\n").split("\t", 1)
+                examples.append((label, text))
+    return examples
+
+
+def design_matrix(texts):
+    x = np.zeros((len(texts), intent.FEATURE_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        np.add.at(x[row], intent.features(text), 1.0)
+    return x
+
+
+def train(x, y, classes, epochs, rate, l2):
+    weights = np.zeros((classes, x.shape[1]), dtype=np.float32)
+    bias = np.zeros(classes, dtype=np.float32)
+    targets = np.eye(classes, dtype=np.float32)[y]
+    for _ in range(epochs):
+        scores = x @ weights.T + bias
+        scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+        probabilities = scores / scores.sum(axis=1, keepdims=True)
+        error = (probabilities - targets) / len(x)
+        weights -= rate * (error.T @ x + l2 * weights)
+        bias -= rate * error.sum(axis=0)
+    return weights, bias
+
+
+def accuracy(weights, bias, x, y):
+    return float(np.mean(np.argmax(x @ weights.T + bias, axis=1) == y)) if len(x) else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--examples", default=os.path.join(HERE, "intent_examples.tsv"))
+    parser.add_argument("--output", default=intent.INTENT_MODEL_PATH)
+    parser.add_argument("--epochs", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=2.0)
+    parser.add_argument("--l2", type=float, default=1e-3)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    args = parser.parse_args()
+
+    examples = load_examples(args.examples)
+    labels = {name: i for i, name in enumerate(intent.INTENTS)}
+    random.Random(0).shuffle(examples)
+    x = design_matrix([text for _, text in examples])
+    y = np.array([labels[label] for label, _ in examples])
+
+    split = int(len(examples) * (1 - args.holdout))
+    weights, bias = train(x[:split], y[:split], len(labels), args.epochs, args.rate, args.l2)
+    print(f"train accuracy {accuracy(weights, bias, x[:split], y[:split]):.3f}, "
+          f"holdout accuracy {accuracy(weights, bias, x[split:], y[split:]):.3f} ({len(examples) - split} examples)")
+
+    # The shipped model is refit on every example.
+    weights, bias = train(x, y, len(labels), args.epochs, args.rate, args.l2)
+    np.savez(args.output, intents=np.array(intent.INTENTS), weights=weights, bias=bias)
+    print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()